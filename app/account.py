@@ -6,6 +6,7 @@ from app.main import db
 from app.auth import user_required
 from app.forms import UserDetailsForm, UserRegisterForm
 from app.database import UserDetails
+from app.invalidation import record_change, publish_change
 
 account = Blueprint("account", __name__)
 
@@ -55,7 +56,9 @@ def show_user_details():
         flash("Your details have been successfully updated!", category="primary")
 
         # Save the updates
+        record_change("users", username=current_username)
         db.session.commit()
+        publish_change("users", username=current_username)
 
         return render_template("my_account.html", form=form)
     
@@ -87,7 +90,9 @@ def add_user_details():
         )
 
         db.session.add(new_user_details)
+        record_change("users", username=current_username)
         db.session.commit()
+        publish_change("users", username=current_username)
 
         flash("Your details have been saved. You can always modify them from the 'My Account' section", category="primary")
         return redirect(url_for("user.main"))
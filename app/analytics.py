@@ -7,6 +7,7 @@ import logging
 
 from app.main import db # db is for database
 from app.database import EventDetails, UserDetails, EventRegistration, EventRating
+from app.cache import chart_cache
 
 
 def get_avg_rating(event_id=None):
@@ -30,6 +31,12 @@ def get_avg_rating(event_id=None):
 
 
 def get_user_analytics(event_id):
+    # Rendering the charts is slow, they are kept until a registration of the event or the
+    # details of a user change (see app/invalidation.py)
+    return chart_cache.get_or_compute(event_id, lambda: render_user_analytics(event_id))
+
+
+def render_user_analytics(event_id):
     # Define a function that generates an analytic chart
     # This function takes in an analytic column as an input (ie. Department), and
     # returns a pie chart (with a title and legend)
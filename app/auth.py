@@ -8,6 +8,7 @@ from app.globals import Role
 from app.main import db
 from app.forms import LoginForm, RegForm
 from app.database import Credentials
+from app.invalidation import record_change, publish_change
 
 auth = Blueprint("auth", __name__)
 
@@ -84,7 +85,10 @@ def register():
             )
             
             db.session.add(new_user)
+            # The user may have been looked up (and cached as missing) before
+            record_change("users", username=username)
             db.session.commit()
+            publish_change("users", username=username)
 
             login_user(new_user, remember=True)
 
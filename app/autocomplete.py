@@ -0,0 +1,317 @@
+from datetime import datetime
+from sqlalchemy import func, select
+import logging
+import re
+import threading
+
+from app.globals import AUTOCOMPLETE_SIZE
+from app.cache import bump_catalog_content_version
+
+# Ranked autocomplete over the event names
+# A compressed prefix (radix) trie where every node caches the top k completions below it,
+# so a lookup only walks the prefix and never depends on the size of the catalog
+
+# Ranking knobs: every registration is worth one point
+UPCOMING_EVENT_BOOST = 5.0
+PAST_EVENT_PENALTY = 10.0
+
+
+def score_event(num_of_registrations, is_past_event):
+    if is_past_event:
+        return num_of_registrations - PAST_EVENT_PENALTY
+    return num_of_registrations + UPCOMING_EVENT_BOOST
+
+
+def _keys_for_name(name):
+    # An event can be completed from the start of any word in its name,
+    # e.g. "Jazz Night" is indexed as "jazz night" and "night"
+    lowered = name.lower()
+    return {lowered[match.start():] for match in re.finditer(r"\w+", lowered)}
+
+
+class _Node:
+    __slots__ = ("children", "terminals", "top")
+
+    def __init__(self):
+        # first character of the edge -> [edge label, child node]
+        self.children = {}
+        # ids of the events that have a key ending at this node
+        self.terminals = set()
+        # cached [(score, event_id)] of the best completions in this subtree
+        self.top = []
+
+
+class AutocompleteTrie:
+    def __init__(self, k=AUTOCOMPLETE_SIZE):
+        self.k = k
+        self.root = _Node()
+        # event_id -> (name, score)
+        self.entries = {}
+        self.lock = threading.Lock()
+        # Time at which the past/upcoming part of the scores was last brought up to date
+        self.scored_at = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def build(self, events, scored_at=None):
+        # Build the trie from (event_id, name, score) tuples, replacing any existing content
+        with self.lock:
+            self.root = _Node()
+            self.entries = {}
+            for event_id, name, score in events:
+                if name is None:
+                    continue
+                self.entries[event_id] = (name, score)
+                for key in _keys_for_name(name):
+                    self._insert(key, event_id)
+            self._recompute_subtree(self.root)
+            self.scored_at = scored_at
+        logging.info("Built the autocomplete trie with %d events", len(self.entries))
+
+    def upsert(self, event_id, name, score):
+        # Add an event or update its name and score, only the affected paths are recomputed
+        with self.lock:
+            old_keys = set()
+            if event_id in self.entries:
+                old_keys = _keys_for_name(self.entries[event_id][0])
+            new_keys = _keys_for_name(name) if name is not None else set()
+
+            if name is None:
+                self.entries.pop(event_id, None)
+            else:
+                self.entries[event_id] = (name, score)
+
+            for key in old_keys - new_keys:
+                self._remove_key(key, event_id)
+            for key in new_keys - old_keys:
+                self._insert(key, event_id)
+            for key in old_keys | new_keys:
+                self._recompute_path(key)
+
+    def update_score(self, event_id, score):
+        with self.lock:
+            if event_id not in self.entries:
+                return
+            name, _ = self.entries[event_id]
+            self.entries[event_id] = (name, score)
+            for key in _keys_for_name(name):
+                self._recompute_path(key)
+
+    def remove(self, event_id):
+        with self.lock:
+            if event_id not in self.entries:
+                return
+            name, _ = self.entries.pop(event_id)
+            keys = _keys_for_name(name)
+            for key in keys:
+                self._remove_key(key, event_id)
+            for key in keys:
+                self._recompute_path(key)
+
+    def complete(self, prefix):
+        # Returns up to k [name, event_id] pairs for the names matching the prefix, best first
+        prefix = prefix.lower()
+        if prefix == "":
+            return []
+
+        with self.lock:
+            node = self.root
+            remaining = prefix
+            while remaining:
+                child = node.children.get(remaining[0])
+                if child is None:
+                    return []
+                label, next_node = child
+                if remaining.startswith(label):
+                    remaining = remaining[len(label):]
+                elif label.startswith(remaining):
+                    remaining = ""
+                else:
+                    return []
+                node = next_node
+
+            return [[self.entries[event_id][0], event_id] for _, event_id in node.top]
+
+    def _insert(self, key, event_id):
+        node = self.root
+        remaining = key
+        while remaining:
+            child = node.children.get(remaining[0])
+            if child is None:
+                leaf = _Node()
+                node.children[remaining[0]] = [remaining, leaf]
+                node = leaf
+                break
+
+            label, next_node = child
+            common = 0
+            while common < min(len(label), len(remaining)) and label[common] == remaining[common]:
+                common += 1
+
+            if common < len(label):
+                # Split the edge so that the shared part becomes its own node
+                middle = _Node()
+                middle.children[label[common]] = [label[common:], next_node]
+                middle.top = list(next_node.top)
+                child[0] = label[:common]
+                child[1] = middle
+                next_node = middle
+
+            remaining = remaining[common:]
+            node = next_node
+
+        node.terminals.add(event_id)
+
+    def _path(self, key):
+        # Nodes from the root to the node where the key ends, None if the key is not present
+        nodes = [self.root]
+        node = self.root
+        remaining = key
+        while remaining:
+            child = node.children.get(remaining[0])
+            if child is None or not remaining.startswith(child[0]):
+                return None
+            remaining = remaining[len(child[0]):]
+            node = child[1]
+            nodes.append(node)
+        return nodes
+
+    def _remove_key(self, key, event_id):
+        nodes = self._path(key)
+        if nodes is None:
+            return
+        nodes[-1].terminals.discard(event_id)
+
+        # Prune the branch if it doesn't lead to any event anymore
+        for depth in range(len(nodes) - 1, 0, -1):
+            node = nodes[depth]
+            if node.terminals or node.children:
+                break
+            parent = nodes[depth - 1]
+            for first_char, (_, child) in list(parent.children.items()):
+                if child is node:
+                    del parent.children[first_char]
+
+    def _recompute_path(self, key):
+        # Recompute the cached completions bottom up along the key
+        # The key may have been pruned partially, so recompute the longest existing prefix
+        nodes = [self.root]
+        node = self.root
+        remaining = key
+        while remaining:
+            child = node.children.get(remaining[0])
+            if child is None or not remaining.startswith(child[0]):
+                break
+            remaining = remaining[len(child[0]):]
+            node = child[1]
+            nodes.append(node)
+
+        for node in reversed(nodes):
+            self._recompute_node(node)
+
+    def _recompute_subtree(self, node):
+        for _, child in node.children.values():
+            self._recompute_subtree(child)
+        self._recompute_node(node)
+
+    def _recompute_node(self, node):
+        candidates = {}
+        for event_id in node.terminals:
+            candidates[event_id] = self.entries[event_id][1]
+        for _, child in node.children.values():
+            for score, event_id in child.top:
+                candidates[event_id] = score
+
+        # Best score first, ties go to the older event
+        ranked = sorted(candidates.items(), key=lambda item: (-item[1], item[0]))
+        node.top = [(score, event_id) for event_id, score in ranked[:self.k]]
+
+
+# How often the past/upcoming part of the scores is brought up to date, in seconds
+RESCORE_INTERVAL = 60
+
+
+def _registration_counts(event_ids=None):
+    from app.main import db
+    from app.database import EventRegistration
+
+    query = db.session.query(EventRegistration.event_id, func.count(EventRegistration.id))
+    if event_ids is not None:
+        query = query.filter(EventRegistration.event_id.in_(event_ids))
+    return dict(query.group_by(EventRegistration.event_id).all())
+
+
+def _is_past_event(starts_at, now):
+    # starts_at is None only for events without a start date, an event without a start time
+    # starts at midnight (see event_starts_at)
+    return starts_at is not None and starts_at < now
+
+
+def build_autocomplete_trie(trie, rows=None):
+    # rows need the id, name and starts_at of the events, read from the database if omitted
+    from app.main import db
+    from app.database import EventDetails
+
+    now = datetime.now()
+    registrations = _registration_counts()
+    if rows is None:
+        rows = db.session.query(
+            EventDetails.id, EventDetails.name, EventDetails.starts_at
+        ).all()
+    trie.build(
+        (
+            (
+                row.id,
+                row.name,
+                score_event(registrations.get(row.id, 0), _is_past_event(row.starts_at, now)),
+            )
+            for row in rows
+        ),
+        scored_at=now,
+    )
+
+
+def refresh_event_in_autocomplete(trie, event_id):
+    # Incremental update hook for event and registration writes
+    from app.database import EventDetails
+
+    event = EventDetails.query.filter_by(id=event_id).first()
+    if event is None:
+        trie.remove(event_id)
+        return
+
+    score = score_event(
+        _registration_counts([event_id]).get(event_id, 0),
+        _is_past_event(event.starts_at, datetime.now()),
+    )
+    trie.upsert(event_id, event.name, score)
+
+
+def rescore_started_events(trie):
+    # Events that started since the last rescore lose their upcoming boost
+    # Only those events are touched, so this stays cheap no matter the size of the catalog
+    from app.main import db
+    from app.database import EventDetails
+
+    now = datetime.now()
+    scored_at = trie.scored_at
+    if scored_at is not None and (now - scored_at).total_seconds() < RESCORE_INTERVAL:
+        return
+    trie.scored_at = now
+    if scored_at is None:
+        return
+
+    # A range scan of the starts_at index
+    started = db.session.execute(
+        select(EventDetails.id).where(EventDetails.starts_at >= scored_at, EventDetails.starts_at < now)
+    ).scalars().all()
+    if not started:
+        return
+
+    registrations = _registration_counts(started)
+    for event_id in started:
+        trie.update_score(event_id, score_event(registrations.get(event_id, 0), True))
+
+    # The ranking changed, so cached suggestions must not be served anymore
+    bump_catalog_content_version()
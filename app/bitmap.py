@@ -0,0 +1,374 @@
+import logging
+import threading
+from datetime import date, datetime, time
+
+import numpy as np
+
+# Compressed bitmaps of event ids for combining the listing filter tags
+# Like a Roaring bitmap, the ids are split into chunks of 2^16 by their high bits and every
+# non-empty chunk is stored in the smaller of two containers:
+#   a sorted uint16 array of the low bits, while the chunk holds at most ARRAY_MAX ids
+#   a bitset of 1024 uint64 words otherwise
+# so a bitmap of a rare tag costs a few bytes per event and a bitmap of a common one at most
+# 8KB per 65536 ids, and AND/OR/AND NOT are a handful of vectorized operations per chunk.
+#
+# EventBitmapIndex keeps one bitmap per filter tag, category, tag of the Tag table and start
+# date, and evaluates filter expressions of the listing URLs (see parse_filter_expression):
+#   "free+in-person+music+today"   free AND in-person AND music AND today
+#   "music,nightlife+-past events"  (music OR nightlife) AND NOT past events
+
+CHUNK_BITS = 16
+WORDS_PER_CHUNK = (1 << CHUNK_BITS) // 64
+# Beyond this many ids an array container is larger than a bitset (8KB)
+ARRAY_MAX = 4096
+
+# Number of set bits of every byte
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint16)
+
+
+def _is_array(container):
+    return container.dtype == np.uint16
+
+
+def _words(container):
+    if not _is_array(container):
+        return container
+    words = np.zeros(WORDS_PER_CHUNK, dtype=np.uint64)
+    bits = np.left_shift(np.uint64(1), (container & 63).astype(np.uint64))
+    np.bitwise_or.at(words, container >> 6, bits)
+    return words
+
+
+def _values(container):
+    if _is_array(container):
+        return container
+    return np.flatnonzero(np.unpackbits(container.view(np.uint8), bitorder="little")).astype(np.uint16)
+
+
+def _cardinality(container):
+    if _is_array(container):
+        return len(container)
+    return int(POPCOUNT[container.view(np.uint8)].sum())
+
+
+def _compact(container):
+    # The smaller container for the same values, None when empty
+    cardinality = _cardinality(container)
+    if cardinality == 0:
+        return None
+    if _is_array(container):
+        return container if cardinality <= ARRAY_MAX else _words(container)
+    return _values(container) if cardinality <= ARRAY_MAX else container
+
+
+class Bitmap:
+    # A set of event ids, the operators return new bitmaps (containers are never changed in place,
+    # so bitmaps can share them)
+
+    def __init__(self, chunks=None):
+        # high bits -> container
+        self.chunks = {} if chunks is None else chunks
+
+    @classmethod
+    def from_ids(cls, event_ids):
+        event_ids = np.unique(np.asarray(list(event_ids), dtype=np.int64))
+        highs = event_ids >> CHUNK_BITS
+        boundaries = np.flatnonzero(np.diff(highs)) + 1
+        chunks = {}
+        for chunk in np.split(event_ids, boundaries):
+            if len(chunk):
+                chunks[int(chunk[0] >> CHUNK_BITS)] = _compact((chunk & 0xFFFF).astype(np.uint16))
+        return cls(chunks)
+
+    def __len__(self):
+        return sum(_cardinality(container) for container in self.chunks.values())
+
+    def __contains__(self, event_id):
+        container = self.chunks.get(event_id >> CHUNK_BITS)
+        if container is None:
+            return False
+        low = event_id & 0xFFFF
+        if _is_array(container):
+            position = np.searchsorted(container, low)
+            return position < len(container) and container[position] == low
+        return bool((int(container[low >> 6]) >> (low & 63)) & 1)
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and self.to_list() == other.to_list()
+
+    def __repr__(self):
+        return f"Bitmap({self.to_list()})"
+
+    def to_array(self):
+        parts = [
+            (np.int64(high) << CHUNK_BITS) + _values(self.chunks[high]).astype(np.int64)
+            for high in sorted(self.chunks)
+        ]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def to_list(self):
+        return self.to_array().tolist()
+
+    def add(self, event_id):
+        self._update(event_id, True)
+
+    def discard(self, event_id):
+        self._update(event_id, False)
+
+    def _update(self, event_id, present):
+        if (event_id in self) == present:
+            return
+        high, low = event_id >> CHUNK_BITS, event_id & 0xFFFF
+        container = self.chunks.get(high, np.zeros(0, dtype=np.uint16))
+        if _is_array(container):
+            if present:
+                container = np.insert(container, np.searchsorted(container, low), np.uint16(low))
+            else:
+                container = container[container != low]
+        else:
+            # Copy on write, other bitmaps may share the container
+            container = container.copy()
+            container[low >> 6] ^= np.uint64(1 << (low & 63))
+        container = _compact(container)
+        if container is None:
+            self.chunks.pop(high, None)
+        else:
+            self.chunks[high] = container
+
+    def __and__(self, other):
+        chunks = {}
+        for high in self.chunks.keys() & other.chunks.keys():
+            mine, theirs = self.chunks[high], other.chunks[high]
+            if _is_array(mine) and _is_array(theirs):
+                container = np.intersect1d(mine, theirs, assume_unique=True)
+            elif _is_array(mine) or _is_array(theirs):
+                # Probe the bitset with the values of the array
+                values, words = (mine, theirs) if _is_array(mine) else (theirs, mine)
+                container = values[(words[values >> 6] >> (values & 63).astype(np.uint64)) & np.uint64(1) == 1]
+            else:
+                container = mine & theirs
+            container = _compact(container)
+            if container is not None:
+                chunks[high] = container
+        return Bitmap(chunks)
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for high, theirs in other.chunks.items():
+            mine = chunks.get(high)
+            if mine is None:
+                chunks[high] = theirs
+            elif _is_array(mine) and _is_array(theirs) and len(mine) + len(theirs) <= ARRAY_MAX:
+                chunks[high] = np.union1d(mine, theirs)
+            else:
+                chunks[high] = _compact(_words(mine) | _words(theirs))
+        return Bitmap(chunks)
+
+    def __sub__(self, other):
+        # AND NOT
+        chunks = {}
+        for high, mine in self.chunks.items():
+            theirs = other.chunks.get(high)
+            if theirs is None:
+                chunks[high] = mine
+                continue
+            if _is_array(mine):
+                if _is_array(theirs):
+                    container = np.setdiff1d(mine, theirs, assume_unique=True)
+                else:
+                    container = mine[(theirs[mine >> 6] >> (mine & 63).astype(np.uint64)) & np.uint64(1) == 0]
+            else:
+                container = mine & ~_words(theirs)
+            container = _compact(container)
+            if container is not None:
+                chunks[high] = container
+        return Bitmap(chunks)
+
+
+def parse_filter_expression(expression):
+    # "+" separated groups that must all match, each a "," separated list of terms of which one
+    # must match, a term starting with "-" matches the events not matching the rest of it
+    # Returns [[(negated, term), ...], ...] with lowercased terms
+    groups = []
+    for group in expression.lower().split("+"):
+        terms = []
+        for term in group.split(","):
+            term = term.strip()
+            negated = term.startswith("-")
+            term = term[1:].strip() if negated else term
+            if not term:
+                raise ValueError(f"Invalid filter expression {expression}")
+            terms.append((negated, term))
+        groups.append(terms)
+    return groups
+
+
+def is_filter_expression(tag):
+    # Whether a filter tag of the listing URLs combines several filters
+    return any(separator in tag for separator in "+,") or tag.startswith("-")
+
+
+class EventBitmapIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Every live event
+        self.universe = Bitmap()
+        # key -> bitmap, see _keys
+        self.bitmaps = {}
+        # event id -> its keys, and its start date and time (for past events)
+        self.keys_of = {}
+        self.starts = {}
+        # The events of the days before a date, (date, bitmap), cleared by every write
+        self.earlier_days = None
+
+    def __len__(self):
+        return len(self.keys_of)
+
+    def _keys(self, event, tag_names):
+        keys = {f"category:{(event.category or '').lower()}"}
+        keys.update(f"tag:{name.lower()}" for name in tag_names)
+        if not event.is_online:
+            keys.add("in-person")
+        if not event.ticket_price:
+            keys.add("free")
+        if event.start_date:
+            keys.add(f"date:{event.start_date.isoformat()}")
+        return keys
+
+    def build(self, events, tags_of=None):
+        # Build the index from objects with the EventDetails filter columns and a dict of event id -> tag names
+        tags_of = tags_of or {}
+        with self.lock:
+            self._reset()
+            ids_of = {}
+            for event in events:
+                keys = self._keys(event, tags_of.get(event.id, ()))
+                self.keys_of[event.id] = keys
+                self.starts[event.id] = (event.start_date, event.start_time)
+                for key in keys:
+                    ids_of.setdefault(key, []).append(event.id)
+            self.universe = Bitmap.from_ids(self.keys_of.keys())
+            self.bitmaps = {key: Bitmap.from_ids(event_ids) for key, event_ids in ids_of.items()}
+            self.earlier_days = None
+        logging.info("Built the event bitmap index with %d events and %d bitmaps", len(self.keys_of), len(self.bitmaps))
+
+    def upsert(self, event, tag_names=()):
+        with self.lock:
+            self._remove(event.id)
+            keys = self._keys(event, tag_names)
+            self.keys_of[event.id] = keys
+            self.starts[event.id] = (event.start_date, event.start_time)
+            self.universe.add(event.id)
+            for key in keys:
+                self.bitmaps.setdefault(key, Bitmap()).add(event.id)
+
+    def remove(self, event_id):
+        with self.lock:
+            self._remove(event_id)
+
+    def _remove(self, event_id):
+        self.earlier_days = None
+        keys = self.keys_of.pop(event_id, None)
+        if keys is None:
+            return
+        self.starts.pop(event_id)
+        self.universe.discard(event_id)
+        for key in keys:
+            bitmap = self.bitmaps[key]
+            bitmap.discard(event_id)
+            if not bitmap.chunks:
+                del self.bitmaps[key]
+
+    def has_tag(self, name):
+        return f"tag:{name.lower()}" in self.bitmaps
+
+    def _term(self, term, now):
+        # The bitmap of a filter tag (see is_valid_filter_tag in app/filter.py) or the name of a tag
+        if term == "all":
+            return self.universe
+        if term in ("in-person", "free"):
+            return self.bitmaps.get(term, Bitmap())
+        if term == "today":
+            return self.bitmaps.get(f"date:{now.date().isoformat()}", Bitmap())
+        if term == "past events":
+            return self._past(now)
+        if f"category:{term}" in self.bitmaps:
+            return self.bitmaps[f"category:{term}"]
+        return self.bitmaps.get(f"tag:{term}", Bitmap())
+
+    def _past(self, now):
+        # Events that already started: earlier days, and the earlier start times of today
+        today = now.date()
+        if self.earlier_days is None or self.earlier_days[0] != today:
+            # One merge of all the earlier days, it is reused until the next write or day
+            earlier_ids = [
+                bitmap.to_array() for key, bitmap in self.bitmaps.items()
+                if key.startswith("date:") and date.fromisoformat(key[5:]) < today
+            ]
+            self.earlier_days = (today, Bitmap.from_ids(np.concatenate(earlier_ids) if earlier_ids else []))
+        past = self.earlier_days[1]
+        started_today = [
+            event_id for event_id in self._term("today", now).to_list()
+            # Like starts_at, an event without a start time starts at midnight
+            if (self.starts[event_id][1] or time.min) < now.time()
+        ]
+        return past | Bitmap.from_ids(started_today)
+
+    def evaluate(self, expression, now=None):
+        # The bitmap of the events matching a filter expression, see parse_filter_expression
+        groups = parse_filter_expression(expression)
+        now = now or datetime.now()
+        with self.lock:
+            result = self.universe
+            for group in groups:
+                matches = Bitmap()
+                for negated, term in group:
+                    bitmap = self._term(term, now)
+                    matches = matches | (self.universe - bitmap if negated else bitmap)
+                result = result & matches
+            return result
+
+    def facet_counts(self, bitmap, terms, now=None):
+        # Number of events of the bitmap matching every term, e.g. for the counts of the filter buttons
+        now = now or datetime.now()
+        with self.lock:
+            return {term: len(bitmap & self._term(term.lower(), now)) for term in terms}
+
+
+# The index used by the listing pages
+event_bitmaps = EventBitmapIndex()
+
+
+def load_event_tags(event_ids=None):
+    # event id -> tag names
+    # NOTE: The models are imported here so that the index can be used without creating the app
+    # (importing app.main creates it, and the app imports this module through app.filter)
+    from app.main import db
+    from app.database import Tag, event_tags
+    query = db.session.query(event_tags.c.event_id, Tag.name).join(Tag, Tag.id == event_tags.c.tag_id)
+    if event_ids is not None:
+        query = query.filter(event_tags.c.event_id.in_(event_ids))
+    tags_of = {}
+    for event_id, name in query:
+        tags_of.setdefault(event_id, []).append(name)
+    return tags_of
+
+
+def build_event_bitmaps():
+    from app.database import EventDetails
+    events = EventDetails.query.with_entities(
+        EventDetails.id, EventDetails.start_date, EventDetails.start_time, EventDetails.is_online,
+        EventDetails.ticket_price, EventDetails.category,
+    )
+    event_bitmaps.build(events, load_event_tags())
+
+
+def refresh_event_bitmaps(event_id, event=None):
+    # Called after an event or its tags are changed and committed, event is None when it was deleted
+    if event is None:
+        event_bitmaps.remove(event_id)
+    else:
+        event_bitmaps.upsert(event, load_event_tags([event_id]).get(event_id, ()))
@@ -0,0 +1,223 @@
+from collections import OrderedDict
+import threading
+import time
+
+from app.globals import (
+    SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, USER_CACHE_SIZE, USER_CACHE_TTL, ORGANIZER_CACHE_SIZE, CHART_CACHE_SIZE,
+    CARD_CACHE_SIZE, CARD_CACHE_TTL,
+)
+
+# Small in-process caches
+# Entries are keyed on the catalog version, so any write to the events bumps the version
+# and stale results simply stop being looked up (they age out through the LRU order)
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        # Time to live of an entry in seconds, None means entries never expire
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Counters used to size the cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires_at = None if self.ttl is None else self.clock() + self.ttl
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share a single execution: the first caller runs
+    # the function, the others wait for it and get the same result (or exception)
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        # Number of calls that were answered by another caller's execution
+        self.shared = 0
+
+    def do(self, key, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+# Catalog version: the id of the last change_log row applied to the caches of this worker (see
+# app/invalidation.py). The ids are handed out by the shared database and never reused, so every
+# worker that caught up with the changes has the same version, and so has a restarted worker
+_catalog_version = 0
+_catalog_version_lock = threading.Lock()
+
+
+def get_catalog_version():
+    return _catalog_version
+
+
+def advance_catalog_version(change_id):
+    # The version never goes back, the changes up to change_id must have been applied
+    global _catalog_version
+    with _catalog_version_lock:
+        _catalog_version = max(_catalog_version, change_id)
+        return _catalog_version
+
+
+# Catalog content version, bumped by the writes that can change the search results: event writes
+# and search index changes. Registrations don't bump it, so the cached search results survive a
+# registration spike (the autocomplete ranking by registrations catches up within SEARCH_CACHE_TTL)
+_catalog_content_version = 0
+
+
+def get_catalog_content_version():
+    return _catalog_content_version
+
+
+def bump_catalog_content_version():
+    global _catalog_content_version
+    with _catalog_version_lock:
+        _catalog_content_version += 1
+        return _catalog_content_version
+
+
+# Registration version of every user: the id of the change_log row of their last registration
+# or cancellation applied by this worker, 0 if there was none since the worker started
+_registration_versions = {}
+
+
+def get_registration_version(username):
+    return _registration_versions.get(username, 0)
+
+
+def advance_registration_version(username, change_id):
+    with _catalog_version_lock:
+        _registration_versions[username] = max(_registration_versions.get(username, 0), change_id)
+        return _registration_versions[username]
+
+
+# Version of every event, bumped whenever it is written or deleted
+_event_versions = {}
+
+
+def get_event_version(event_id):
+    return _event_versions.get(event_id, 0)
+
+
+def bump_event_version(event_id):
+    with _catalog_version_lock:
+        _event_versions[event_id] = _event_versions.get(event_id, 0) + 1
+        return _event_versions[event_id]
+
+
+def normalize_query(query):
+    # "  Jazz   NIGHT " and "jazz night" are the same query
+    return " ".join(query.lower().split())
+
+
+# Cache for the search bar autocomplete and the search results page
+search_cache = LRUCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+# Identical concurrent searches that missed the cache share one backend call
+search_flight = SingleFlight()
+
+# Logged in users by username, so the pages answered from their ETag don't need the database
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Organizer names by username, shown on the event and organizer pages
+organizer_name_cache = LRUCache(maxsize=ORGANIZER_CACHE_SIZE)
+
+# Rendered analytics charts by event id, they only change with the registrations of the event
+# or the details of the registered users
+chart_cache = LRUCache(maxsize=CHART_CACHE_SIZE)
+
+# Rendered event cards, see app/fragments.py
+card_cache = LRUCache(maxsize=CARD_CACHE_SIZE, ttl=CARD_CACHE_TTL)
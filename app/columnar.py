@@ -0,0 +1,324 @@
+import logging
+import threading
+from datetime import date, datetime
+
+import numpy as np
+
+from app.database import EventDetails
+from app.filter import EventFilterBuilder, MAX_SQL_EVENT_IDS
+from app.globals import USE_COLUMNAR_FILTERS
+
+# Columnar snapshot of the event catalog for the listing filters
+# The columns the filters look at are kept in numpy arrays, one entry per event:
+#   ids[i], alive[i]         -> the event id and whether the entry is live (deleted and replaced entries aren't)
+#   start_day[i]             -> start_date as a proleptic ordinal, 0 when there is no date
+#   start_time[i]            -> start_time in microseconds since midnight, -1 when there is no time
+#   end_day[i]               -> end_date as a proleptic ordinal, start_day when there is no end date
+#   is_online[i], price[i]   -> the coalesced is_online flag and ticket_price
+#   category[i], organizer[i] -> codes of the lowercased category and the organizer username
+# so a filter is a boolean mask over the arrays and a chain of filters is combined with a single
+# logical AND, instead of a trip to the database.
+# ColumnarEventFilter has the same interface as EventFilterBuilder (see app/filter.py) and the
+# matching events are loaded by id, with only the columns the page needs.
+# Writes update the snapshot in place (see refresh_event_columns), it is only rebuilt at startup.
+# An edit appends the new version of the event and marks the old entry dead, the dead entries
+# are dropped once they make up a share of the arrays
+
+# The EventDetails columns the snapshot is built from
+SNAPSHOT_COLUMNS = [
+    EventDetails.id, EventDetails.start_date, EventDetails.start_time, EventDetails.end_date,
+    EventDetails.is_online, EventDetails.ticket_price, EventDetails.category, EventDetails.organizer,
+]
+
+MICROSECONDS_PER_DAY = 86_400_000_000
+# Listing key of the events without a date, see EventColumns.listing_keys
+NO_START_KEY = -1
+
+# Initial number of entries, the arrays double when they are full
+INITIAL_CAPACITY = 1024
+# Full arrays are compacted instead of grown when this share of their entries is dead
+DEAD_ROWS_RATIO = 0.25
+
+# The arrays of EventColumns, one entry per row
+COLUMN_NAMES = ("ids", "alive", "start_day", "start_time", "end_day", "is_online", "price", "category", "organizer")
+
+
+def _microseconds(value):
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 1_000_000 + value.microsecond
+
+
+def _end_day(event):
+    end_date = event.end_date or event.start_date
+    return end_date.toordinal() if end_date else 0
+
+
+class EventColumns:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.built = False
+        self._reset(INITIAL_CAPACITY)
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def _reset(self, capacity):
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.start_day = np.zeros(capacity, dtype=np.int32)
+        self.start_time = np.full(capacity, -1, dtype=np.int64)
+        self.end_day = np.zeros(capacity, dtype=np.int32)
+        self.is_online = np.zeros(capacity, dtype=bool)
+        self.price = np.zeros(capacity, dtype=np.float64)
+        self.category = np.zeros(capacity, dtype=np.int32)
+        self.organizer = np.zeros(capacity, dtype=np.int32)
+        # event id -> entry, value -> code
+        self.row_of = {}
+        self.category_codes = {}
+        self.organizer_codes = {}
+
+    def build(self, events):
+        # Build the snapshot from objects with the EventDetails filter columns, replacing any existing content
+        events = list(events)
+        size = len(events)
+        with self.lock:
+            self._reset(max(INITIAL_CAPACITY, size))
+            self.size = size
+            self.ids[:size] = [event.id for event in events]
+            self.alive[:size] = True
+            self.start_day[:size] = [event.start_date.toordinal() if event.start_date else 0 for event in events]
+            self.start_time[:size] = [_microseconds(event.start_time) if event.start_time else -1 for event in events]
+            self.end_day[:size] = [_end_day(event) for event in events]
+            self.is_online[:size] = [bool(event.is_online) for event in events]
+            self.price[:size] = [event.ticket_price or 0 for event in events]
+            self.category[:size] = [self.category_code((event.category or "").lower()) for event in events]
+            self.organizer[:size] = [self.organizer_code(event.organizer or "") for event in events]
+            self.row_of = {event.id: row for row, event in enumerate(events)}
+            self.built = True
+        logging.info("Built the columnar event snapshot with %d events", size)
+
+    def upsert(self, event):
+        with self.lock:
+            # Entries are replaced rather than updated, so a search running on a copy of the
+            # arrays sees either the old or the new version of the event
+            self._delete(event.id)
+            self._set(self._new_row(event.id), event)
+
+    def remove(self, event_id):
+        with self.lock:
+            self._delete(event_id)
+
+    def _new_row(self, event_id):
+        if self.size == len(self.ids):
+            if self.size - len(self.row_of) > DEAD_ROWS_RATIO * self.size:
+                self._compact()
+            else:
+                self._grow()
+        row = self.size
+        self.size += 1
+        self.row_of[event_id] = row
+        return row
+
+    def _grow(self):
+        for name in COLUMN_NAMES:
+            column = getattr(self, name)
+            grown = np.zeros(2 * len(column), dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def _compact(self):
+        # Drop the dead entries and renumber the live ones (order is preserved), the capacity is kept
+        # New arrays, so a search running on the previous ones is not affected
+        live = np.flatnonzero(self.alive[:self.size])
+        for name in COLUMN_NAMES:
+            column = getattr(self, name)
+            compacted = np.zeros(len(column), dtype=column.dtype)
+            compacted[:len(live)] = column[live]
+            setattr(self, name, compacted)
+        self.size = len(live)
+        self.row_of = {event_id: row for row, event_id in enumerate(self.ids[:self.size].tolist())}
+
+    def _delete(self, event_id):
+        row = self.row_of.pop(event_id, None)
+        if row is not None:
+            self.alive[row] = False
+
+    def _set(self, row, event):
+        self.ids[row] = event.id
+        self.alive[row] = True
+        self.start_day[row] = event.start_date.toordinal() if event.start_date else 0
+        self.start_time[row] = _microseconds(event.start_time) if event.start_time else -1
+        self.end_day[row] = _end_day(event)
+        self.is_online[row] = bool(event.is_online)
+        self.price[row] = event.ticket_price or 0
+        self.category[row] = self.category_code((event.category or "").lower())
+        self.organizer[row] = self.organizer_code(event.organizer or "")
+
+    def category_code(self, category):
+        return self.category_codes.setdefault(category, len(self.category_codes))
+
+    def organizer_code(self, organizer):
+        return self.organizer_codes.setdefault(organizer, len(self.organizer_codes))
+
+    def listing_keys(self):
+        # starts_at in microseconds, as LISTING_ORDER in app/filter.py: midnight when there is no
+        # start time, and before every start when there is no date
+        days = self.start_day[:self.size].astype(np.int64)
+        times = np.maximum(self.start_time[:self.size], 0)
+        return np.where(days > 0, days * MICROSECONDS_PER_DAY + times, NO_START_KEY)
+
+
+# The snapshot used by the listing pages when USE_COLUMNAR_FILTERS is set
+event_columns = EventColumns()
+
+
+def build_event_columns():
+    event_columns.build(EventDetails.query.with_entities(*SNAPSHOT_COLUMNS))
+
+
+def refresh_event_columns(event_id, event=None):
+    # Called after an event write is committed, event is None when it was deleted
+    if not event_columns.built:
+        return
+    if event is None:
+        event_columns.remove(event_id)
+    else:
+        event_columns.upsert(event)
+
+
+def new_event_filter():
+    # The filter builder of the event listings, see USE_COLUMNAR_FILTERS
+    if USE_COLUMNAR_FILTERS and event_columns.built:
+        return ColumnarEventFilter()
+    return EventFilterBuilder()
+
+
+class ColumnarEventFilter:
+    # Drop-in for EventFilterBuilder answered from an EventColumns snapshot:
+    #   ColumnarEventFilter().free().category("music").all()
+
+    def __init__(self, columns=None):
+        self.columns = event_columns if columns is None else columns
+        # Filters as functions of a view of the columns, they are evaluated and combined together
+        # by _matching_ids, so writes in between don't matter
+        self.filters = []
+        # Search result ids, most relevant first
+        self.ordered_event_ids = None
+
+    def in_person(self):
+        self.filters.append(lambda view: ~view("is_online"))
+        return self
+
+    def free(self):
+        self.filters.append(lambda view: view("price") == 0)
+        return self
+
+    def today(self, today=None):
+        today = (today or date.today()).toordinal()
+        self.filters.append(lambda view: view("start_day") == today)
+        return self
+
+    def past(self, now=None):
+        # Events that already started
+        now = now or datetime.now()
+        today, time_now = now.date().toordinal(), _microseconds(now.time())
+
+        def started(view):
+            # Like starts_at, an event without a start time starts at midnight
+            start_day, start_time = view("start_day"), np.maximum(view("start_time"), 0)
+            return (start_day > 0) & ((start_day < today) | ((start_day == today) & (start_time < time_now)))
+
+        self.filters.append(started)
+        return self
+
+    def category(self, category):
+        category = category.lower()
+        self.filters.append(lambda view: view("category") == self.columns.category_codes.get(category, -1))
+        return self
+
+    def organizer(self, username):
+        self.filters.append(lambda view: view("organizer") == self.columns.organizer_codes.get(username, -1))
+        return self
+
+    def overlapping(self, start, end):
+        # Events taking place on a day of [start, end), an event without an end date lasts its start date
+        start, end = start.toordinal(), end.toordinal()
+        self.filters.append(
+            lambda view: (view("start_day") > 0) & (view("start_day") < end) & (view("end_day") >= start)
+        )
+        return self
+
+    def event_ids(self, event_ids):
+        # Only keep the given events, and return them in the given order
+        self.ordered_event_ids = list(event_ids)
+        wanted = np.array(self.ordered_event_ids, dtype=np.int64)
+        self.filters.append(lambda view: np.isin(view("ids"), wanted))
+        return self
+
+    def in_events(self, event_ids):
+        # Only keep the given events, in any order
+        wanted = np.array(list(event_ids), dtype=np.int64)
+        self.filters.append(lambda view: np.isin(view("ids"), wanted))
+        return self
+
+    filter_tag = EventFilterBuilder.filter_tag
+
+    def _matching_ids(self, with_keys=False):
+        # The ids of the matching events, and their listing keys if with_keys is set
+        # Read under the same lock as the mask: a compaction renumbers the rows
+        columns = self.columns
+        with columns.lock:
+            def view(name):
+                return getattr(columns, name)[:columns.size]
+
+            mask = view("alive").copy()
+            for matches in self.filters:
+                mask &= matches(view)
+            rows = np.flatnonzero(mask)
+            if with_keys:
+                return columns.ids[rows], columns.listing_keys()[rows]
+            return columns.ids[rows]
+
+    def _load(self, event_ids, row_type):
+        # The events with the given ids (in any order), only the columns of row_type if given
+        rows = []
+        for start in range(0, len(event_ids), MAX_SQL_EVENT_IDS):
+            rows.extend(EventFilterBuilder().event_ids(event_ids[start:start + MAX_SQL_EVENT_IDS]).all(row_type))
+        return rows
+
+    def listing_page(self, after=None, limit=None, row_type=None):
+        # The events after the (starts_at, id) key in listing order, see EventFilterBuilder
+        ids, keys = self._matching_ids(with_keys=True)
+        if after is not None:
+            starts_at, event_id = after
+            if starts_at is None:
+                after_key = NO_START_KEY
+            else:
+                after_key = starts_at.toordinal() * MICROSECONDS_PER_DAY + _microseconds(starts_at)
+            later = (keys > after_key) | ((keys == after_key) & (ids > event_id))
+            keys, ids = keys[later], ids[later]
+
+        # Only the page needs sorting
+        if limit is not None and limit < len(ids):
+            first = np.argpartition(keys, limit - 1)[:limit]
+            # Keys tied with the last one can be on either side of the partition, take them all
+            first = np.union1d(first, np.flatnonzero(keys == keys[first].max()))
+            keys, ids = keys[first], ids[first]
+        order = np.lexsort((ids, keys))[:limit]
+        page_ids = ids[order].tolist()
+
+        position = {event_id: number for number, event_id in enumerate(page_ids)}
+        events = self._load(page_ids, row_type)
+        events.sort(key=lambda event: position[event.id])
+        return events
+
+    def all(self, row_type=None):
+        event_ids = self._matching_ids().tolist()
+        events = self._load(event_ids, row_type)
+        if self.ordered_event_ids is None:
+            events.sort(key=lambda event: event.id)
+            return events
+
+        position = {event_id: number for number, event_id in enumerate(self.ordered_event_ids)}
+        events.sort(key=lambda event: position[event.id])
+        return events
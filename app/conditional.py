@@ -0,0 +1,67 @@
+import hashlib
+import time
+from functools import wraps
+from pathlib import Path
+
+from flask import request, session, make_response
+from flask_login import current_user
+
+from app.globals import ETAG_TIME_BUCKET
+from app.cache import get_catalog_version, get_registration_version
+
+# Conditional GET for the listing pages
+# The ETag of a page is derived from everything the page is rendered from: the URL, the user,
+# the catalog version and the user's registration version (ids of the shared change log, see
+# app/invalidation.py, so they agree across workers and restarts), the templates and, for pages
+# depending on the current time, the time bucket. The user and my events listings always do:
+# whatever the filter, they show the counts of the Today and Past Events filters.
+# A request whose If-None-Match has the current ETag is answered with a 304 before the view runs,
+# so neither the database nor Jinja are touched
+
+
+def _templates_version():
+    # Changes whenever a template changes, it is the same in every worker
+    digest = hashlib.sha1()
+    for path in sorted(Path(__file__).parent.joinpath("templates").rglob("*.html")):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+TEMPLATES_VERSION = _templates_version()
+
+
+def page_etag(*parts):
+    username = current_user.get_id()
+    key = (request.full_path, username, get_catalog_version(), get_registration_version(username),
+           TEMPLATES_VERSION, *parts)
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def conditional_page(session_defaults={}, time_dependent=lambda **kwargs: False):
+    # Decorator answering a GET view with a 304 when the page is unchanged
+    # session_defaults: the session values the page depends on and their default values
+    # time_dependent: whether the page, given the view arguments, depends on the current time
+    def decorator(view):
+        @wraps(view)
+        def decorated_function(*args, **kwargs):
+            # Flashed messages are shown once, a page showing them is always rendered
+            if session.get("_flashes"):
+                return view(*args, **kwargs)
+
+            parts = [session.get(key, default) for key, default in session_defaults.items()]
+            if time_dependent(**kwargs):
+                parts.append(int(time.time() // ETAG_TIME_BUCKET))
+            etag = page_etag(*parts)
+
+            if request.if_none_match.contains(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag)
+            # The page is specific to the user and must be revalidated before it is reused
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+
+        return decorated_function
+
+    return decorator
@@ -1,9 +1,10 @@
 from flask_login import UserMixin
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, event
 from icalendar import Calendar, Event
-from datetime import datetime
+from datetime import datetime, time
 
 from app.main import db
+from app.cache import organizer_name_cache
 
 class Credentials(db.Model, UserMixin):
     __tablename__ = "credentials"
@@ -55,7 +56,9 @@ class Tag(db.Model):
 # Defining the association table for the many-to-many relationship between EventDetails and Tag
 event_tags = db.Table('event_tags',
     db.Column('event_id', db.Integer, db.ForeignKey('event_details.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True),
+    # The primary key only serves the tags of an event, this one the events of a tag
+    db.Index('ix_event_tags_tag_id', 'tag_id'),
 )
 
 class EventDetails(db.Model):
@@ -79,6 +82,10 @@ class EventDetails(db.Model):
     end_date = db.Column(db.Date)
     start_time = db.Column(db.Time)
     end_time = db.Column(db.Time)
+    # The dates and times above combined, kept in sync on every write (see sync_event_times) so
+    # that past, today and upcoming events are single range predicates on an index
+    starts_at = db.Column(db.DateTime)
+    ends_at = db.Column(db.DateTime)
 
     # Participant capacity information
     max_capacity = db.Column(db.Integer)
@@ -94,6 +101,15 @@ class EventDetails(db.Model):
     # Add a relationship to the tags
     tags = db.relationship('Tag', secondary=event_tags, backref=db.backref('events', lazy='dynamic'))
 
+    __table_args__ = (
+        # Time ranges (past, today, calendar), the end is read from the index
+        db.Index("ix_event_details_starts_at", "starts_at", "ends_at"),
+        # The keyset order of the listings (see LISTING_ORDER in app/filter.py)
+        db.Index("ix_event_details_starts_at_id", "starts_at", "id"),
+        # The upcoming and past events of an organizer, and all the events of an organizer
+        db.Index("ix_event_details_organizer_starts_at", "organizer", "starts_at"),
+    )
+
     # A sample data from this table will look like this
     def __repr__(self):
         return f"ID : {self.id}, Name: {self.name}, Organizer: {self.organizer}, Tags: {', '.join(tag.name for tag in self.tags)}"
@@ -103,8 +119,10 @@ class EventDetails(db.Model):
     
     # Method to get the Organizer's name without having to directly access Credentials table otherwise
     def get_organizer_name_from_username(organizer_username):
-        organizer = Credentials.query.filter_by(username=organizer_username).first()
-        return organizer.name if organizer else None
+        def load_organizer_name():
+            organizer = Credentials.query.filter_by(username=organizer_username).first()
+            return organizer.name if organizer else None
+        return organizer_name_cache.get_or_compute(organizer_username, load_organizer_name)
     
     # Method to create am iCal event using the information in the event details
     def to_ical_event(self):
@@ -125,6 +143,28 @@ class EventDetails(db.Model):
         cal.add_component(event)
         return cal.to_ical()
 
+def event_starts_at(start_date, start_time):
+    # An event without a start time starts at the beginning of its day
+    if start_date is None:
+        return None
+    return datetime.combine(start_date, start_time or time.min)
+
+
+def event_ends_at(start_date, end_date, end_time):
+    # An event without an end date ends on its start date, and without an end time at the end of that day
+    end_date = end_date or start_date
+    if end_date is None:
+        return None
+    return datetime.combine(end_date, end_time or time.max)
+
+
+@event.listens_for(EventDetails, "before_insert")
+@event.listens_for(EventDetails, "before_update")
+def sync_event_times(mapper, connection, target):
+    target.starts_at = event_starts_at(target.start_date, target.start_time)
+    target.ends_at = event_ends_at(target.start_date, target.end_date, target.end_time)
+
+
 class EventRating(db.Model):
     __tablename__ = 'event_ratings'
     
@@ -137,6 +177,9 @@ class EventRating(db.Model):
     #TODO: Perhaps limit the range of integers from 1 to 5
     rating = db.Column(db.Integer)
 
+    # The rating of a user for an event, and the ratings of the events of an organizer
+    __table_args__ = (db.Index("ix_event_ratings_event_id_attendee_username", "event_id", "attendee_username"),)
+
     def __repr__(self):
         return f"Username: {self.attendee_username}, ID : {self.event_id}, Rating: {self.rating}"
 
@@ -147,9 +190,70 @@ class EventRegistration(db.Model):
     event_id = db.Column(db.Integer, ForeignKey("event_details.id"), nullable=False)
     attendee_username = db.Column(db.String(150), ForeignKey("credentials.username"), nullable=False)
 
-    # Unique constraint
-    __table_args__ = (db.UniqueConstraint("event_id", "attendee_username"),)
+    __table_args__ = (
+        # Unique constraint, also the index of the registrations of an event
+        db.UniqueConstraint("event_id", "attendee_username"),
+        # The events a user registered for
+        db.Index("ix_event_registration_attendee_username", "attendee_username"),
+    )
 
     # A sample data from this table will look like this
     def __repr__(self):
         return f"Attendee: {self.attendee_username}, Event ID: {self.event_id}"
+
+class EventWaitlist(db.Model):
+    __tablename__ = "event_waitlist"
+
+    # Users waiting for a seat of a full event, promoted to a registration in the order they joined
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    event_id = db.Column(db.Integer, ForeignKey("event_details.id"), nullable=False)
+    attendee_username = db.Column(db.String(150), ForeignKey("credentials.username"), nullable=False)
+    # The lowest position is promoted first. Positions are not renumbered when users leave,
+    # only their order matters
+    position = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        # The head of the waitlist and its next position are index seeks, however long it is
+        db.Index("ix_event_waitlist_event_id_position", "event_id", "position", unique=True),
+        db.UniqueConstraint("event_id", "attendee_username"),
+    )
+
+    # A sample data from this table will look like this
+    def __repr__(self):
+        return f"Attendee: {self.attendee_username}, Event ID: {self.event_id}, Position: {self.position}"
+
+class SearchOutbox(db.Model):
+    __tablename__ = "search_outbox"
+
+    # Pending changes to push to the search index, written in the same commit as the event change
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # NOTE: No foreign key since the event can already be deleted when the change is applied
+    event_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)  # "create", "update" or "delete"
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    last_error = db.Column(db.String(300))
+
+    # A sample data from this table will look like this
+    def __repr__(self):
+        return f"Event ID: {self.event_id}, Operation: {self.operation}, Attempts: {self.attempts}"
+
+class ChangeLog(db.Model):
+    __tablename__ = "change_log"
+    # Ids are never reused, so that the workers can tell which changes they have already seen
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    # Writes that invalidate in-process caches, written in the same commit as the change and
+    # replayed by the other workers (see app/invalidation.py)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    topic = db.Column(db.String(20), nullable=False)  # "events", "registrations", "ratings", "users" or "search"
+    # NOTE: No foreign keys since the event or user can already be deleted when the change is replayed
+    event_id = db.Column(db.Integer)
+    username = db.Column(db.String(150))
+    # The worker that made the change, it has already invalidated its own caches
+    origin = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    # A sample data from this table will look like this
+    def __repr__(self):
+        return f"ID: {self.id}, Topic: {self.topic}, Event ID: {self.event_id}, Username: {self.username}"
@@ -0,0 +1,67 @@
+from functools import partial
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from app.globals import SQLITE_BUSY_TIMEOUT, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE, SQLITE_POOL_SIZE
+
+# Settings of the SQLite connections
+# With the default rollback journal, a commit locks the whole database file and the readers of
+# every other worker wait for it (or fail with "database is locked" once their timeout runs out).
+# In WAL mode the readers keep reading the last committed state while a write is in progress,
+# only the writers take turns. The production profile switches to WAL and tunes every new
+# connection with PRAGMAs, the default profile keeps the defaults of SQLAlchemy and SQLite
+
+DB_PROFILES = {
+    "default": {
+        "engine_options": {},
+        "pragmas": {},
+    },
+    "production": {
+        "engine_options": {
+            # A pool of connections shared by the threads of the worker. A connection is only
+            # used by one thread at a time, so it can be handed to another thread later
+            "poolclass": QueuePool,
+            "pool_size": SQLITE_POOL_SIZE,
+            "max_overflow": SQLITE_POOL_SIZE,
+            "pool_timeout": SQLITE_BUSY_TIMEOUT / 1000,
+            "connect_args": {"check_same_thread": False},
+        },
+        # Applied in this order to every new connection
+        "pragmas": {
+            # Persistent, stored in the database file
+            "journal_mode": "WAL",
+            # Commits no longer wait for the disk, only checkpoints do. Still durable across
+            # crashes of the app in WAL mode, the last commits can be lost on a power failure
+            "synchronous": "NORMAL",
+            "busy_timeout": SQLITE_BUSY_TIMEOUT,
+            "mmap_size": SQLITE_MMAP_SIZE,
+            # A negative cache size is in KiB instead of pages
+            "cache_size": -(SQLITE_CACHE_SIZE // 1024),
+            "temp_store": "MEMORY",
+        },
+    },
+}
+
+
+def set_pragmas(dbapi_connection, connection_record, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        # PRAGMA takes no bound parameters, the values are ours
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def init_database(app, db, profile):
+    # Replaces db.init_app(app), with the settings of the profile
+    if profile not in DB_PROFILES:
+        raise ValueError(f"Unknown database profile {profile!r}, expected one of {sorted(DB_PROFILES)}")
+    settings = DB_PROFILES[profile]
+    app.config["DB_PROFILE"] = profile
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = settings["engine_options"]
+    db.init_app(app)
+
+    if settings["pragmas"]:
+        # The engine is created by init_app, before its first connection
+        with app.app_context():
+            event.listen(db.engine, "connect", partial(set_pragmas, pragmas=settings["pragmas"]))
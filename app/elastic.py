@@ -0,0 +1,129 @@
+from datetime import datetime, timezone
+from elasticsearch import helpers
+import logging
+
+from app.main import db
+from app.database import EventDetails
+
+# Elasticsearch indexing helpers
+# Searches always go through the EVENTS_ALIAS alias. A reindex builds a brand new
+# timestamped index next to the live one and then swaps the alias atomically,
+# so search keeps working (on the old data) while the reindex is running
+
+EVENTS_ALIAS = "events"
+
+# Number of events fetched from the database and sent per bulk request
+REINDEX_CHUNK_SIZE = 500
+
+# Columns sent to elasticsearch, no need to load the long descriptions
+INDEXED_COLUMNS = [
+    EventDetails.id,
+    EventDetails.name,
+    EventDetails.short_description,
+    EventDetails.category,
+    EventDetails.venue,
+    EventDetails.additional_info,
+]
+
+
+def event_to_document(event):
+    return {
+        "id": str(event.id),
+        "name": event.name,
+        "short_description": event.short_description,
+        "category": event.category,
+        "venue": event.venue,
+        "additional_info": event.additional_info,
+    }
+
+
+def new_index_name():
+    return f"{EVENTS_ALIAS}-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}"
+
+
+def stream_indexed_events(chunk_size=REINDEX_CHUNK_SIZE, columns=INDEXED_COLUMNS):
+    # Stream the events from the database chunk by chunk instead of loading the whole table
+    return (
+        db.session.query(*columns)
+        .order_by(EventDetails.id)
+        .execution_options(yield_per=chunk_size)
+    )
+
+
+def generate_index_actions(index_name, events):
+    for event in events:
+        yield {
+            "_op_type": "index",
+            "_index": index_name,
+            "_id": str(event.id),
+            "_source": event_to_document(event),
+        }
+
+
+def reindex_events(es, events=None, chunk_size=REINDEX_CHUNK_SIZE):
+    # Rebuild the events index with the bulk API and atomically point the alias to it
+    # The events are read from the database unless given. Returns the name of the new index
+    if events is None:
+        events = stream_indexed_events(chunk_size)
+
+    index_name = new_index_name()
+    es.indices.create(index=index_name)
+
+    try:
+        num_indexed, _ = helpers.bulk(
+            es, generate_index_actions(index_name, events), chunk_size=chunk_size
+        )
+        es.indices.refresh(index=index_name)
+    except Exception:
+        # Leave the live index untouched if the new one could not be built
+        logging.exception("Reindexing the events into %s failed", index_name)
+        es.options(ignore_status=404).indices.delete(index=index_name)
+        raise
+
+    actions = [{"add": {"index": index_name, "alias": EVENTS_ALIAS}}]
+    old_indices = []
+    if es.indices.exists_alias(name=EVENTS_ALIAS):
+        old_indices = list(es.indices.get_alias(name=EVENTS_ALIAS).body.keys())
+        actions = [{"remove": {"index": old, "alias": EVENTS_ALIAS}} for old in old_indices] + actions
+    elif es.indices.exists(index=EVENTS_ALIAS):
+        # Older deployments used a concrete index named "events", drop it in the same atomic swap
+        actions.append({"remove_index": {"index": EVENTS_ALIAS}})
+
+    es.indices.update_aliases(actions=actions)
+
+    for old in old_indices:
+        es.options(ignore_status=404).indices.delete(index=old)
+
+    logging.info("Indexed %d events into %s", num_indexed, index_name)
+    return index_name
+
+
+def apply_event_changes(es, changes):
+    # Sync the given events ({event_id: operation}) to the index with a single bulk request
+    # Events still in the database are (re)indexed and missing ones are deleted, whatever the
+    # recorded operation was, so replaying an old change can't resurrect a deleted event
+    rows = db.session.query(*INDEXED_COLUMNS).filter(EventDetails.id.in_(list(changes))).all()
+    existing = {row.id: row for row in rows}
+
+    actions = []
+    for event_id in changes:
+        if event_id in existing:
+            actions.append({
+                "_op_type": "index",
+                "_index": EVENTS_ALIAS,
+                "_id": str(event_id),
+                "_source": event_to_document(existing[event_id]),
+            })
+        else:
+            actions.append({"_op_type": "delete", "_index": EVENTS_ALIAS, "_id": str(event_id)})
+
+    _, errors = helpers.bulk(es, actions, raise_on_error=False)
+
+    failed = set()
+    for error in errors:
+        (op_type, item), = error.items()
+        # Deleting a document that was never indexed is not an error
+        if op_type == "delete" and item.get("status") == 404:
+            continue
+        failed.add(int(item["_id"]))
+    return failed
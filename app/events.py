@@ -11,20 +11,22 @@ from flask import (
     abort,
 )
 from flask_login import login_required, current_user
+from sqlalchemy import and_, or_, func, update, insert, select, literal, exists
+from sqlalchemy.exc import IntegrityError
+from collections import namedtuple
 from datetime import datetime
 import logging
 import os.path
 import os
 
 from app.main import db # db is for database
-from app.globals import Role, USE_SIMPLE_SEARCH
+from app.globals import Role
 from app.auth import organizer_required, user_required
-from app.database import Credentials, EventRegistration, EventDetails, EventRating
+from app.database import EventRegistration, EventDetails, EventRating, EventWaitlist
 from app.forms import EventCreateForm
 from app.analytics import get_user_analytics, get_avg_rating
-
-if not USE_SIMPLE_SEARCH:
-    from app.main import es # es is for elasticsearch
+from app.search_backends import stage_search_change
+from app.invalidation import record_change, publish_change
 
 events = Blueprint("events", __name__)
 
@@ -34,10 +36,10 @@ events = Blueprint("events", __name__)
 def show_event(id):
     logging.info("Loading webpage for event ID: %d", id)
 
-    # Get all the details for the event
-    event = EventDetails.query.filter_by(id=id).first()
+    # The event with the user's registration and rating, in a single query
+    event_for_user = load_event_for_user(id)
 
-    if not event:
+    if event_for_user is None:
         logging.error(
             "Integrity Error: The event ID passed to show_event has no valid entry in the database"
         )
@@ -46,9 +48,10 @@ def show_event(id):
             "caller": "show_event",
             "message": "Can not show the event since the event does not exist"
         })
+    event = event_for_user.event
 
     # Check if the user registered for the event
-    is_registered = EventRegistration.query.filter_by(attendee_username=current_user.get_id(), event_id=id).first()
+    is_registered = event_for_user.registration
 
     #Check for past event. Users will only be able to rate if this is met. 
     is_past_event = past_event(id)
@@ -58,7 +61,8 @@ def show_event(id):
     prev_rating = previous_rating(attendee_username=current_user.get_id(), event_id=id)
     logging.info("Prev Rating: %s", prev_rating)
 
-    event_dict = event.__dict__
+    # A copy, the event is memoized for the rest of the request
+    event_dict = dict(event.__dict__)
     
     # Fix: Need to pass event ID as a string
     str_id = str(event_dict["id"])
@@ -92,11 +96,15 @@ def show_event(id):
             event_day=event_dict["start_date"].day,
             event_month=event_dict["start_date"].strftime("%B"),)
     else:
+        is_waitlisted = event_for_user.waitlist is not None and not is_past_event
         if is_past_event:
             flash("This is a past event!", category="primary")
+        elif is_waitlisted:
+            flash("You are on the waitlist for the event!", category="primary")
         return render_template("event.html", 
         event=event_dict, 
         is_registered=False, 
+        is_waitlisted=is_waitlisted,
         is_past_event = is_past_event, 
         prev_rating=prev_rating,
         event_dayofweek=event_dict["start_date"].weekday(), 
@@ -196,10 +204,15 @@ def create_event():
             )
 
         db.session.add(new_event)
+
+        # The search index change is committed together with the event
+        db.session.flush()
+        stage_search_change(new_event.id, "create")
+        record_change("events", new_event.id)
+
         db.session.commit()
 
-        if not USE_SIMPLE_SEARCH:
-            add_event_to_index(new_event)
+        publish_change("events", new_event.id, event=new_event)
 
         return redirect(url_for("events.show_event_admin", id=new_event.id))
 
@@ -253,13 +266,24 @@ def edit_event(id):
         event.end_date = form.end_date.data
         event.start_time = form.start_time.data
         event.end_time = form.end_time.data
-        # TODO: Add a check to prevent the max capacity from being set to below the current capacity
         event.max_capacity = form.max_capacity.data
         event.ticket_price = form.ticket_price.data
         event.redirect_link = form.redirect_link.data
         event.additional_info = form.additional_info.data
 
-        # TODO: Update the event details to the index for elastic search
+        # The seats can't be taken back, take_seat and the waitlist rely on max_capacity >= current_capacity
+        # They are read after the flush: the edit holds the write lock until it commits, so no
+        # registration can take a seat in between
+        db.session.flush()
+        taken = count_seats(event.id)
+        if event.max_capacity is not None and event.max_capacity < taken:
+            db.session.rollback()
+            form.max_capacity.errors.append(f"{taken} seats are already taken, the capacity can't be lower")
+            return render_template("create_event.html", form=form)
+
+        # Update the event details in the search index
+        stage_search_change(event.id, "update")
+        record_change("events", event.id)
 
         # Add the banner details for the newly edited event
         banner_file = form.banner_image.data
@@ -274,9 +298,19 @@ def edit_event(id):
             banner_file.save(
                 os.path.join(current_app.root_path, "static", "event-assets", filename)
             )
-            
+
+        # A higher capacity gives the new seats to the waitlist
+        db.session.flush()
+        promoted = promote_from_waitlist(event.id)
+        for username in promoted:
+            record_change("registrations", event.id, username)
+
         db.session.commit()
 
+        publish_change("events", event.id, event=event)
+        for username in promoted:
+            publish_change("registrations", event.id, username)
+
         return redirect(url_for("events.show_event_admin", id=event.id))
 
     return render_template("create_event.html", form=form)
@@ -309,9 +343,15 @@ def delete_event(id):
             "message": "You are not authorized to delete this event"
         })
 
+    # Nobody is waiting for a seat of a deleted event
+    EventWaitlist.query.filter_by(event_id=id).delete()
     db.session.delete(event)
+    stage_search_change(id, "delete")
+    record_change("events", id)
     db.session.commit()
 
+    publish_change("events", id)
+
     return redirect(url_for("organizer.main"))
 
 
@@ -350,8 +390,17 @@ def register_for_event(event_id):
     logging.info("EVENT ID: %s", event_id)
     logging.info("USERNAME: %s", current_user.get_id())
 
-    # Check for valid username
-    user = Credentials.query.filter_by(username=current_user.get_id()).first()
+    # The event with the user's registration, in a single query shared with past_event
+    event_for_user = load_event_for_user(event_id)
+    if event_for_user is None:
+        abort(404, description = {
+            "type": "event_not_found",
+            "caller": "events.register_for_event",
+            "message": "Can not register for the event since the event does not exist"
+        })
+
+    # Check for valid username, the logged in user was already loaded by the user loader
+    user = current_user if current_user.is_authenticated else None
     is_past_event = past_event(event_id)
     if not user:
         logging.warning("Cannot register user with an invalid username")
@@ -372,22 +421,54 @@ def register_for_event(event_id):
                 "message": "Event is a past event"
             })
 
-    # TODO: Check if event has enough seats left
-
     # Check if the user is already registered
-    is_registered = EventRegistration.query.filter_by(attendee_username=current_user.get_id(), event_id=event_id).first()
+    is_registered = event_for_user.registration
     if is_registered:
         logging.info("Cancelling user's registration")
 
-        # Delete the registration
-        EventRegistration.query.filter_by(attendee_username=current_user.get_id(), event_id=event_id).delete()
+        # Delete the registration and give its seat back, unless a concurrent request already did
+        # The seat goes to the head of the waitlist in the same transaction
+        promoted = []
+        cancelled = EventRegistration.query.filter_by(attendee_username=current_user.get_id(), event_id=event_id).delete()
+        if cancelled:
+            release_seat(event_id)
+            promoted = promote_from_waitlist(event_id)
+        for username in [current_user.get_id(), *promoted]:
+            record_change("registrations", event_id, username)
         db.session.commit()
+        forget_event_for_user(event_id)
+
+        for username in [current_user.get_id(), *promoted]:
+            publish_change("registrations", event_id, username)
 
         flash("Cancelled registration for the event!", category="primary")
-        event = EventDetails.query.filter_by(id=event_id).first()
 
         return redirect(url_for('events.show_event', id=event_id))
 
+    # Clicking again leaves the waitlist
+    if event_for_user.waitlist:
+        logging.info("Removing user from the waitlist")
+        EventWaitlist.query.filter_by(attendee_username=current_user.get_id(), event_id=event_id).delete()
+        db.session.commit()
+        forget_event_for_user(event_id)
+
+        flash("Left the waitlist for the event!", category="primary")
+
+        return redirect(url_for('events.show_event', id=event_id))
+
+    # Take a seat, the registration is only added if one is left
+    if not take_seat(event_id):
+        logging.info("Event ID %s is full, adding user to the waitlist", event_id)
+        try:
+            if join_waitlist(event_id, current_user.get_id()):
+                flash("This event is full, you were added to the waitlist!", category="primary")
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request of the same user joined first
+            db.session.rollback()
+        forget_event_for_user(event_id)
+        return redirect(url_for('events.show_event', id=event_id))
+
     # Register the user
     new_registration = EventRegistration(
         attendee_username=current_user.get_id(),
@@ -395,47 +476,168 @@ def register_for_event(event_id):
     )
 
     db.session.add(new_registration)
-    db.session.commit()
+    record_change("registrations", event_id, current_user.get_id())
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request of the same user registered first, the rollback gives the seat back
+        # Nothing was committed, so there is no change to publish
+        db.session.rollback()
+        logging.info("User is already registered for event ID %s", event_id)
+        forget_event_for_user(event_id)
+        return redirect(url_for('events.show_event', id=event_id))
+    forget_event_for_user(event_id)
+
+    publish_change("registrations", event_id, current_user.get_id())
 
-    event = EventDetails.query.filter_by(id=event_id).first()
     return redirect(url_for('events.show_event', id=event_id))
 
-def add_event_to_index(new_event):
-    event_detail = {
-        "id": new_event.id,
-        "name": new_event.name,
-        "short_description": new_event.short_description,
-        "category": new_event.category,
-        "venue": new_event.venue,
-        "additional_info": new_event.additional_info,
-    }
+def take_seat(event_id):
+    # Counts a new registration against the capacity of the event, in the transaction of the
+    # registration. The check and the increment are a single conditional UPDATE, so concurrent
+    # registrations can't both take the last seat and no lock is held between a read and a write
+    # An event without a maximum capacity has unlimited seats
+    # Returns False if the event is full
+    seats = func.coalesce(EventDetails.current_capacity, 0)
+    taken = db.session.execute(
+        update(EventDetails)
+        .where(EventDetails.id == event_id)
+        .where(or_(EventDetails.max_capacity.is_(None), seats < EventDetails.max_capacity))
+        .values(current_capacity=seats + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return taken.rowcount == 1
+
+
+def count_seats(event_id):
+    # The seats taken, as counted by take_seat and release_seat
+    return db.session.execute(
+        select(func.coalesce(EventDetails.current_capacity, 0)).where(EventDetails.id == event_id)
+    ).scalar()
+
 
-    logging.info("The event dict for indexing:", event_detail)
-    es.index(index="events", document=event_detail)
-    es.indices.refresh(index="events")
-    logging.info(es.cat.count(index="events", format="json"))
+def release_seat(event_id):
+    # Gives the seat of a cancelled registration back, in the transaction of the cancellation
+    seats = func.coalesce(EventDetails.current_capacity, 0)
+    db.session.execute(
+        update(EventDetails)
+        .where(EventDetails.id == event_id)
+        .values(current_capacity=func.max(seats - 1, 0))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def join_waitlist(event_id, username):
+    # Appends the user to the waitlist of the event, in the transaction of the registration
+    # The next position is read and written by a single statement: a seek to the end of the
+    # (event_id, position) index, concurrent users can't get the same position
+    # A user registered by a concurrent request of theirs is not added
+    # Returns False if the user was not added
+    registered = exists().where(
+        EventRegistration.event_id == event_id, EventRegistration.attendee_username == username
+    )
+    # A scalar subquery: an aggregate in the outer SELECT would always return a row, the
+    # registered check would filter nothing
+    last_position = (
+        select(func.max(EventWaitlist.position))
+        .where(EventWaitlist.event_id == event_id)
+        .scalar_subquery()
+    )
+    next_position = (
+        select(literal(event_id), literal(username), func.coalesce(last_position, 0) + 1)
+        .where(~registered)
+    )
+    joined = db.session.execute(
+        insert(EventWaitlist).from_select(["event_id", "attendee_username", "position"], next_position)
+    )
+    return joined.rowcount == 1
+
+
+def promote_from_waitlist(event_id):
+    # Registers the users at the head of the waitlist for the seats left, in the transaction that
+    # freed them. Called after a write to the event, which holds the write lock of the database,
+    # so concurrent cancellations can't promote the same user
+    # Returns the usernames of the promoted users
+    promoted = []
+    while True:
+        head = (
+            EventWaitlist.query.filter_by(event_id=event_id)
+            .order_by(EventWaitlist.position)
+            .first()
+        )
+        if head is None:
+            return promoted
+        is_registered = EventRegistration.query.filter_by(
+            event_id=event_id, attendee_username=head.attendee_username
+        ).first()
+        if is_registered:
+            # Waitlisted before join_waitlist checked the registrations, the entry is only dropped
+            db.session.delete(head)
+            db.session.flush()
+            continue
+        if not take_seat(event_id):
+            return promoted
+        db.session.delete(head)
+        db.session.add(EventRegistration(event_id=event_id, attendee_username=head.attendee_username))
+        db.session.flush()
+        promoted.append(head.attendee_username)
+
+
+# An event with the registration, waitlist entry and rating of the current user (None if they have none)
+EventForUser = namedtuple("EventForUser", ["event", "registration", "waitlist", "rating"])
+
+
+def load_event_for_user(event_id):
+    # Loads the event, the current user's registration, waitlist entry and rating in one query
+    # Memoized on the request (flask.g lives as long as the app context, which can outlive the
+    # request), so the event routes and the helpers below share a single round trip
+    # Returns None if the event does not exist
+    username = current_user.get_id()
+    if not hasattr(request, "events_for_user"):
+        request.events_for_user = {}
+    loaded = request.events_for_user
+    key = (int(event_id), username)
+    if key not in loaded:
+        row = (
+            db.session.query(EventDetails, EventRegistration, EventWaitlist, EventRating)
+            .outerjoin(EventRegistration, and_(
+                EventRegistration.event_id == EventDetails.id, EventRegistration.attendee_username == username
+            ))
+            .outerjoin(EventWaitlist, and_(
+                EventWaitlist.event_id == EventDetails.id, EventWaitlist.attendee_username == username
+            ))
+            .outerjoin(EventRating, and_(
+                EventRating.event_id == EventDetails.id, EventRating.attendee_username == username
+            ))
+            .filter(EventDetails.id == key[0])
+            .first()
+        )
+        loaded[key] = None if row is None else EventForUser(*row)
+    return loaded[key]
+
+
+def forget_event_for_user(event_id):
+    # Called after the registration or rating of the current user was written
+    getattr(request, "events_for_user", {}).pop((int(event_id), current_user.get_id()), None)
 
 
 def past_event(event_id):
     #Here we check to see if the event is a past event or not.
     #Only if it is a past event will users be able to add a rating for it
-    current_date = datetime.now().date()
-    current_time = datetime.now().time()
-    event_detail = EventDetails.query.filter_by(id=event_id).first()
-    logging.info("Current Date: ", current_date, " Current time: ", current_time)
-    if event_detail.start_date < current_date:
-        return True
-    elif (event_detail.start_date == current_date and event_detail.start_time < current_time):
-        return True
-    else:
-        return False
+    now = datetime.now()
+    event_detail = load_event_for_user(event_id).event
+    logging.info("Current time: %s", now)
+    return event_detail.starts_at is not None and event_detail.starts_at < now
 
 
 def previous_rating(attendee_username, event_id):
     #This function returns 0 if no previous rating
     #Else, it returns the value of the previous rating (1-5)
 
-    prev_rating = EventRating.query.filter_by(attendee_username=attendee_username, event_id=event_id).first()
+    if attendee_username == current_user.get_id():
+        prev_rating = load_event_for_user(event_id).rating
+    else:
+        prev_rating = EventRating.query.filter_by(attendee_username=attendee_username, event_id=event_id).first()
     if prev_rating is None:
         return 0
     else:
@@ -445,8 +647,17 @@ def previous_rating(attendee_username, event_id):
 
 @events.route("/events/submit_rating/<int:event_id>", methods=["GET", "POST"])
 def submit_rating(event_id):
+    # The event with the user's registration and previous rating, in a single query
+    event_for_user = load_event_for_user(event_id)
+    if event_for_user is None:
+        abort(404, description = {
+            "type": "event_not_found",
+            "caller": "events.submit_rating",
+            "message": "Can not rate the event since the event does not exist"
+        })
+
     # Check if the user registered for the event
-    is_registered = EventRegistration.query.filter_by(attendee_username=current_user.get_id(), event_id=event_id).first()
+    is_registered = event_for_user.registration
     is_past_event = past_event(event_id)
     if (is_past_event == False or is_registered is None):
         abort(401, description = {
@@ -456,15 +667,17 @@ def submit_rating(event_id):
             })
     # Get the user's username (assuming they are logged in)
     attendee_username = current_user.get_id()
-    event_id = request.form.get('event_id')
+    # NOTE: The rating is for the event checked above, not for an event_id sent with the form
     rating = request.form.get('rating')
 
-    if event_id and rating and attendee_username: 
+    if rating and attendee_username: 
         # Check if the user has already rated this event, and update the rating if they have
-        existing_rating = EventRating.query.filter_by(attendee_username=attendee_username, event_id=event_id).first()
+        existing_rating = event_for_user.rating
         if existing_rating is not None:
             existing_rating.rating = rating
+            record_change("ratings", event_id, attendee_username)
             db.session.commit()
+            publish_change("ratings", event_id, attendee_username)
             logging.info("Here is the updated rating: ", existing_rating)
             flash('Rating Updated successfully!', 'warning')
         else:
@@ -472,10 +685,13 @@ def submit_rating(event_id):
             new_rating = EventRating(attendee_username=attendee_username ,event_id=event_id, rating=rating)
             logging.info("Here is the new submitted rating: ", new_rating)
             db.session.add(new_rating)
-            
+            record_change("ratings", event_id, attendee_username)
+
             db.session.commit()
+            publish_change("ratings", event_id, attendee_username)
 
             flash('Rating submitted successfully!', 'warning')
+        forget_event_for_user(event_id)
     else:
         flash('Failed to submit rating. Please try again.', 'danger')
         
@@ -1,8 +1,16 @@
 from flask import Blueprint, request, redirect, url_for
-from datetime import date, datetime
+from sqlalchemy import func, literal, or_, tuple_, select
+from datetime import date, datetime, time, timedelta
+import json
 import logging
 
 from app.auth import login_required
+from app.main import db
+from app.database import EventDetails
+from app.cache import get_catalog_version
+from app.globals import EVENT_CATEGORIES
+from app.projections import project
+from app.bitmap import event_bitmaps, is_filter_expression, parse_filter_expression
 
 filter = Blueprint("filter", __name__)
 
@@ -17,6 +25,9 @@ def filter_events(search=None):
 
     logging.info("User filtering for: %s", request.form["filter-tag"])
     tag = request.form["filter-tag"]
+    if tag != "clear":
+        # The filter tags are combined, selecting a tag of the current filter removes it
+        tag = toggle_filter_tag(request.form.get("current-filter", "all"), tag)
 
     # Assemble the arguments for the redrect link based on 
     # the filter tag selected
@@ -37,46 +48,156 @@ def filter_events(search=None):
     else:
         return redirect(url_for("user.main", **redirect_args))
 
-def filter_for_today_events(events):
-    return { 
-        event_id: events[event_id] 
-        for event_id in events.keys() 
-        if events[event_id]["start_date"] == date.today().strftime('%Y-%m-%d')
-    }
-
-def filter_for_inperson_events(events):
-    return { 
-        event_id: events[event_id] 
-        for event_id in events.keys() 
-        if not int(events[event_id]["is_online"])
-    }
-
-def filter_for_free_events(events):
-    return { 
-        event_id: events[event_id] 
-        for event_id in events.keys() 
-        if float(events[event_id]["ticket_price"]) == 0.0
-    }
-
-def filter_events_on_category(events, category):
-    return {
-        event_id: events[event_id] 
-        for event_id in events.keys() 
-        if (events[event_id]["category"] == category)
-    }
-
-def filter_events_on_event_ids_list(events, event_ids):
-    # Loop through event_ids: If event_id is in events, then return that event
-    return {
-        event_id: events[event_id] 
-        for event_id in event_ids 
-        if event_id in events
-    }
-
-def filter_for_past_events(events):
-    # Return events that are past events
-    return { 
-        event_id: events[event_id] 
-        for event_id in events.keys() 
-        if (events[event_id]["start_date"] < date.today().strftime('%Y-%m-%d')) or (events[event_id]["start_date"] == date.today().strftime('%Y-%m-%d') and events[event_id]["start_time"] < datetime.now().strftime("%H:%M:%S"))
-    }
\ No newline at end of file
+# Order of the event listings: by start (see event_starts_at), events without a date first.
+# The rows of ix_event_details_starts_at_id are in this order, so a page is a seek into the index
+LISTING_ORDER = (EventDetails.starts_at, EventDetails.id)
+
+# Maximum number of search result ids sent to SQLite in an IN (...) list, the rest of a
+# larger result is filtered after the query (SQLite limits the number of bound parameters)
+MAX_SQL_EVENT_IDS = 10000
+
+
+# (catalog version, longest event in days), see get_longest_event_days
+_longest_event_days = (None, 0)
+
+
+def get_longest_event_days():
+    # Number of days between the start and end dates of the longest event, recomputed after
+    # the catalog changes
+    global _longest_event_days
+    version = get_catalog_version()
+    if _longest_event_days[0] != version:
+        end_date = func.coalesce(EventDetails.end_date, EventDetails.start_date)
+        longest = db.session.query(
+            func.max(func.julianday(end_date) - func.julianday(EventDetails.start_date))
+        ).scalar()
+        _longest_event_days = (version, max(0, int(longest or 0)))
+    return _longest_event_days[1]
+
+
+def is_valid_filter_tag(tag):
+    # A filter tag, or a combination of filter tags and event tags (see app/bitmap.py)
+    if is_filter_expression(tag):
+        try:
+            groups = parse_filter_expression(tag)
+        except ValueError:
+            return False
+        return all(
+            is_valid_filter_tag(term) or event_bitmaps.has_tag(term)
+            for group in groups for _, term in group
+        )
+    return tag in ("all", "in-person", "free", "today", "past events") or tag.capitalize() in EVENT_CATEGORIES
+
+
+def active_filter_tags(tag):
+    # The filter tags combined by the filter of a listing URL
+    return [term for term in tag.split("+") if term != "all"]
+
+
+def toggle_filter_tag(current, tag):
+    # Adds the tag to the combination of the current filter, or removes it if it is already there
+    tags = active_filter_tags(current)
+    tags = [active for active in tags if active != tag] if tag in tags else tags + [tag]
+    return "+".join(tags) or "all"
+
+
+class EventFilterBuilder:
+    # Composes the event listing filters into a single SQLAlchemy query, so the listing
+    # pages only fetch the matching rows. Every method returns the builder for chaining:
+    #   EventFilterBuilder().free().category("music").all()
+
+    def __init__(self, query=None):
+        self.query = EventDetails.query if query is None else query
+        # Search result ids, most relevant first
+        self.ordered_event_ids = None
+
+    def in_person(self):
+        self.query = self.query.filter(func.coalesce(EventDetails.is_online, 0) == 0)
+        return self
+
+    def free(self):
+        self.query = self.query.filter(func.coalesce(EventDetails.ticket_price, 0) == 0)
+        return self
+
+    def today(self, today=None):
+        start = datetime.combine(today or date.today(), time.min)
+        self.query = self.query.filter(EventDetails.starts_at >= start, EventDetails.starts_at < start + timedelta(days=1))
+        return self
+
+    def past(self, now=None):
+        # Events that already started
+        self.query = self.query.filter(EventDetails.starts_at < (now or datetime.now()))
+        return self
+
+    def category(self, category):
+        # The categories are stored lowercased (see create_event), only the tag is lowercased so
+        # the comparison can use the column as is
+        self.query = self.query.filter(EventDetails.category == category.lower())
+        return self
+
+    def overlapping(self, start, end):
+        # Events taking place on a day of [start, end), an event without an end date lasts its start date
+        # Bounding the starts by the longest event keeps the query a range scan of the starts_at index
+        start, end = datetime.combine(start, time.min), datetime.combine(end, time.min)
+        self.query = self.query.filter(
+            EventDetails.starts_at >= start - timedelta(days=get_longest_event_days()),
+            EventDetails.starts_at < end,
+            EventDetails.ends_at >= start,
+        )
+        return self
+
+    def event_ids(self, event_ids):
+        # Only keep the given events, and return them in the given order
+        self.ordered_event_ids = list(event_ids)
+        if len(self.ordered_event_ids) <= MAX_SQL_EVENT_IDS:
+            self.query = self.query.filter(EventDetails.id.in_(self.ordered_event_ids))
+        return self
+
+    def in_events(self, event_ids):
+        # Only keep the given events, in any order
+        # The ids are sent as a single JSON array parameter, so there is no limit on their number
+        ids = func.json_each(json.dumps(list(event_ids))).table_valued("value")
+        self.query = self.query.filter(EventDetails.id.in_(select(ids.c.value)))
+        return self
+
+    def filter_tag(self, tag):
+        # Apply the filter tag of the listing page URLs, see is_valid_filter_tag
+        if is_filter_expression(tag):
+            # Combinations of tags are answered by the bitmap index
+            return self.in_events(event_bitmaps.evaluate(tag).to_list())
+        if tag == "in-person":
+            return self.in_person()
+        if tag == "free":
+            return self.free()
+        if tag == "today":
+            return self.today()
+        if tag == "past events":
+            return self.past()
+        if tag != "all":
+            return self.category(tag)
+        return self
+
+    def listing_page(self, after=None, limit=None, row_type=None):
+        # The events after the (starts_at, id) key in LISTING_ORDER, see app/pagination.py
+        # Events without a date have no starts_at, SQLite sorts the NULLs first
+        query = self.query.order_by(*LISTING_ORDER)
+        if after is not None:
+            starts_at, event_id = after
+            if starts_at is None:
+                query = query.filter(or_(EventDetails.starts_at.is_not(None), EventDetails.id > event_id))
+            else:
+                query = query.filter(tuple_(*LISTING_ORDER) > tuple_(literal(starts_at), literal(event_id)))
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all() if row_type is None else project(query, row_type)
+
+    def all(self, row_type=None):
+        # ORM objects, or compact rows with only the columns of row_type (see app/projections.py)
+        rows = self.query.all() if row_type is None else project(self.query, row_type)
+        if self.ordered_event_ids is None:
+            return rows
+
+        position = {event_id: number for number, event_id in enumerate(self.ordered_event_ids)}
+        rows = [row for row in rows if row.id in position]
+        rows.sort(key=lambda row: position[row.id])
+        return rows
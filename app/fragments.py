@@ -0,0 +1,30 @@
+import hashlib
+from pathlib import Path
+
+from flask import current_app
+from markupsafe import Markup
+
+from app.cache import card_cache, get_event_version
+
+# Fragment cache of the event cards
+# The card grids of the listing pages show mostly the same events from one request to the next,
+# so every card is rendered once and the pages join the cached HTML. A card is keyed by the
+# event id, the version of the event (bumped by every write of the event, see
+# app/invalidation.py), the kind of card and the hash of the card template, so only the cards
+# of changed events are rendered again. Outdated cards are never looked up again and leave the
+# LRU cache as it fills up or when they expire
+
+CARD_TEMPLATE = "event_card.html"
+
+CARD_TEMPLATE_VERSION = hashlib.sha1(
+    Path(__file__).parent.joinpath("templates", CARD_TEMPLATE).read_bytes()
+).hexdigest()
+
+
+def render_event_card(event, admin=False):
+    # event is any row with the EventCard columns, admin cards link to the organizer's event page
+    # Called from the templates as event_card(event)
+    key = (event.id, get_event_version(event.id), admin, CARD_TEMPLATE_VERSION)
+    return card_cache.get_or_compute(
+        key, lambda: Markup(current_app.jinja_env.get_template(CARD_TEMPLATE).render(event=event, admin=admin))
+    )
@@ -0,0 +1,97 @@
+from sqlalchemy import text
+import logging
+import re
+
+from app.main import db
+
+# SQLite FTS5 search backend
+# The virtual table mirrors the searchable columns of event_details (external content table)
+# and is kept in sync by triggers, so the ORM code never has to write to it directly
+
+FTS_TABLE = "event_details_fts"
+FTS_COLUMNS = ["name", "short_description", "venue", "additional_info"]
+
+# Per column weights for bm25(), in the same order as FTS_COLUMNS
+# A match in the event name is worth much more than a match in the additional information
+FTS_WEIGHTS = [10.0, 4.0, 2.0, 1.0]
+
+
+def _column_list(prefix=""):
+    return ", ".join(prefix + column for column in FTS_COLUMNS)
+
+
+def create_fts_index():
+    # Create the FTS5 table and its sync triggers if they don't exist yet
+    # Safe to call on every startup
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE},
+    ).first()
+
+    if not exists:
+        logging.info("Creating the %s full text search table", FTS_TABLE)
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"{_column_list()}, content='event_details', content_rowid='id', prefix='2 3')"
+        ))
+
+    db.session.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON event_details BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {_column_list()}) VALUES (new.id, {_column_list('new.')}); "
+        f"END"
+    ))
+    db.session.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON event_details BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_column_list()}) VALUES ('delete', old.id, {_column_list('old.')}); "
+        f"END"
+    ))
+    # Only the updates of the mirrored columns reindex the event, not the seat counts that every
+    # registration writes
+    update_trigger = (
+        f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF {_column_list()} ON event_details BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_column_list()}) VALUES ('delete', old.id, {_column_list('old.')}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {_column_list()}) VALUES (new.id, {_column_list('new.')}); "
+        f"END"
+    )
+    current_update_trigger = db.session.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = :name"),
+        {"name": f"{FTS_TABLE}_au"},
+    ).scalar()
+    if current_update_trigger != update_trigger:
+        # Databases created before the trigger was limited to the mirrored columns
+        db.session.execute(text(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au"))
+        db.session.execute(text(update_trigger))
+
+    if not exists:
+        # Index the events that were created before the FTS table existed
+        db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+    db.session.commit()
+
+
+def build_fts_match_expression(query):
+    # Turn a free text query into an FTS5 MATCH expression
+    # Every word must match (implicit AND) and the words are treated as prefixes,
+    # so "hack nig" matches "Hackathon Night". Quoting keeps FTS5 syntax out of user input
+    tokens = re.findall(r"\w+", query.lower())
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def get_eventids_matching_fts_query(query, limit=None):
+    # Returns the matching event ids ordered by relevance (best match first)
+    match_expression = build_fts_match_expression(query)
+    if match_expression == "":
+        return []
+
+    weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+    sql = (
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+        f"ORDER BY bm25({FTS_TABLE}, {weights})"
+    )
+    params = {"match": match_expression}
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params["limit"] = limit
+
+    rows = db.session.execute(text(sql), params).all()
+    return [row[0] for row in rows]
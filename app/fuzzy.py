@@ -0,0 +1,265 @@
+import heapq
+import logging
+import re
+import threading
+
+# Typo tolerant search over the event names, a local stand-in for the elasticsearch query
+#   span_near(clauses=[fuzzy(name, token, fuzziness="AUTO") for token in query], slop=0, in_order=False)
+# Candidate terms are found with a SymSpell style dictionary of precomputed deletes,
+# so a lookup never compares the query against the whole vocabulary
+
+# Edit distance allowed by elasticsearch's fuzziness "AUTO": 0 for 1-2 characters,
+# 1 for 3-5 characters and 2 for longer terms
+MAX_EDIT_DISTANCE = 2
+
+# Deletes are only generated for the first PREFIX_LENGTH characters of a term,
+# which bounds the size of the dictionary for long words
+PREFIX_LENGTH = 7
+
+# Number of query tokens whose similar terms are remembered between searches
+SIMILAR_TERMS_CACHE_SIZE = 10000
+
+
+def tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def auto_fuzziness(term):
+    if len(term) <= 2:
+        return 0
+    if len(term) <= 5:
+        return 1
+    return 2
+
+
+def edit_distance(a, b, max_distance):
+    # Damerau-Levenshtein (optimal string alignment) distance, like elasticsearch's fuzzy
+    # query with transpositions. Returns max_distance + 1 as soon as the limit is exceeded
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(term, max_distance):
+    # Every string obtained by deleting up to max_distance characters from the term's prefix
+    result = {term[:PREFIX_LENGTH]}
+    frontier = set(result)
+    for _ in range(max_distance):
+        next_frontier = set()
+        for word in frontier:
+            for i in range(len(word)):
+                next_frontier.add(word[:i] + word[i + 1:])
+        next_frontier -= result
+        result |= next_frontier
+        frontier = next_frontier
+    return result
+
+
+class FuzzyEventIndex:
+    def __init__(self):
+        # event_id -> (name, [term at each position])
+        self.events = {}
+        # term -> set of event_ids containing the term
+        self.postings = {}
+        # delete string -> {term length: set of terms that produce it}
+        # Bucketing on the length skips the terms that are too short or too long to ever match
+        self.deletes = {}
+        # query token -> {term: edit distance}, cleared whenever the vocabulary changes
+        self.similar_terms_cache = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.events)
+
+    def build(self, events):
+        # Build the index from (event_id, name) pairs, replacing any existing content
+        with self.lock:
+            self.events = {}
+            self.postings = {}
+            self.deletes = {}
+            self.similar_terms_cache = {}
+            for event_id, name in events:
+                self._add(event_id, name)
+        logging.info("Built the fuzzy event index with %d events and %d terms", len(self.events), len(self.postings))
+
+    def add(self, event_id, name):
+        with self.lock:
+            self._remove(event_id)
+            self._add(event_id, name)
+
+    def remove(self, event_id):
+        with self.lock:
+            self._remove(event_id)
+
+    def search(self, query, limit=None):
+        # Returns [name, event_id] pairs of the events whose name contains every query token
+        # (within the AUTO edit distance) at adjacent positions in any order.
+        # Closer matches come first
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self.lock:
+            # term -> edit distance, for every query token
+            matched_terms = [self._similar_terms(token) for token in tokens]
+            if not all(matched_terms):
+                return []
+
+            candidates = None
+            for terms in sorted(matched_terms, key=lambda terms: sum(len(self.postings[t]) for t in terms)):
+                events = set()
+                for term in terms:
+                    events |= self.postings[term]
+                candidates = events if candidates is None else candidates & events
+                if not candidates:
+                    return []
+
+            # No event can match closer than every token's closest term
+            lower_bound = sum(min(terms.values()) for terms in matched_terms)
+
+            if len(matched_terms) == 1 and limit is not None:
+                # A single token needs no span check: the best matches are the lowest ids
+                # among the events containing one of the closest terms
+                closest = set()
+                for term, distance in matched_terms[0].items():
+                    if distance == lower_bound:
+                        closest |= self.postings[term]
+                if len(closest) >= limit:
+                    return [[self.events[event_id][0], event_id] for event_id in heapq.nsmallest(limit, closest)]
+
+            results = []
+            num_best = 0
+            for event_id in sorted(candidates):
+                distance = self._span_distance(self.events[event_id][1], matched_terms)
+                if distance is None:
+                    continue
+                results.append((distance, event_id))
+                # Events are visited by id, so once enough of them match as closely as
+                # possible the rest can only rank lower
+                if distance == lower_bound:
+                    num_best += 1
+                    if limit is not None and num_best == limit:
+                        break
+
+            results.sort()
+            if limit is not None:
+                results = results[:limit]
+            return [[self.events[event_id][0], event_id] for _, event_id in results]
+
+    def _similar_terms(self, token):
+        if token not in self.similar_terms_cache:
+            if len(self.similar_terms_cache) >= SIMILAR_TERMS_CACHE_SIZE:
+                self.similar_terms_cache.clear()
+            self.similar_terms_cache[token] = self._find_similar_terms(token)
+        return self.similar_terms_cache[token]
+
+    def _find_similar_terms(self, token):
+        max_distance = auto_fuzziness(token)
+        if max_distance == 0:
+            return {token: 0} if token in self.postings else {}
+
+        candidates = set()
+        lengths = range(len(token) - max_distance, len(token) + max_distance + 1)
+        for delete in _deletes(token, max_distance):
+            buckets = self.deletes.get(delete)
+            if buckets is None:
+                continue
+            for length in lengths:
+                if length in buckets:
+                    candidates |= buckets[length]
+
+        similar = {}
+        for term in candidates:
+            distance = edit_distance(token, term, max_distance)
+            if distance <= max_distance:
+                similar[term] = distance
+        return similar
+
+    def _span_distance(self, terms, matched_terms):
+        # Smallest total edit distance over the windows of len(matched_terms) adjacent positions
+        # where every query token matches a different term, None if there is no such window
+        width = len(matched_terms)
+        if width == 1:
+            distances = [matched_terms[0][term] for term in terms if term in matched_terms[0]]
+            return min(distances) if distances else None
+
+        # Every window has to contain a match of the first token
+        anchors = [position for position, term in enumerate(terms) if term in matched_terms[0]]
+        starts = {
+            start
+            for position in anchors
+            for start in range(max(0, position - width + 1), min(position, len(terms) - width) + 1)
+        }
+
+        best = None
+        for start in starts:
+            window = terms[start:start + width]
+            distance = self._assign(window, matched_terms, 0, [False] * width)
+            if distance is not None and (best is None or distance < best):
+                best = distance
+        return best
+
+    def _assign(self, window, matched_terms, token_number, used):
+        # Try every assignment of the remaining query tokens to the free window positions
+        if token_number == len(matched_terms):
+            return 0
+        best = None
+        for position, term in enumerate(window):
+            if used[position] or term not in matched_terms[token_number]:
+                continue
+            used[position] = True
+            rest = self._assign(window, matched_terms, token_number + 1, used)
+            used[position] = False
+            if rest is not None:
+                distance = matched_terms[token_number][term] + rest
+                if best is None or distance < best:
+                    best = distance
+        return best
+
+    def _add(self, event_id, name):
+        if name is None:
+            return
+        terms = tokenize(name)
+        self.events[event_id] = (name, terms)
+        for term in set(terms):
+            if term not in self.postings:
+                self.postings[term] = set()
+                self.similar_terms_cache = {}
+                for delete in _deletes(term, MAX_EDIT_DISTANCE):
+                    self.deletes.setdefault(delete, {}).setdefault(len(term), set()).add(term)
+            self.postings[term].add(event_id)
+
+    def _remove(self, event_id):
+        if event_id not in self.events:
+            return
+        _, terms = self.events.pop(event_id)
+        for term in set(terms):
+            posting = self.postings[term]
+            posting.discard(event_id)
+            if posting:
+                continue
+            # The term is gone from the catalog, drop it from the dictionary as well
+            del self.postings[term]
+            self.similar_terms_cache = {}
+            for delete in _deletes(term, MAX_EDIT_DISTANCE):
+                buckets = self.deletes.get(delete)
+                if buckets is None or len(term) not in buckets:
+                    continue
+                buckets[len(term)].discard(term)
+                if not buckets[len(term)]:
+                    del buckets[len(term)]
+                if not buckets:
+                    del self.deletes[delete]
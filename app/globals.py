@@ -31,9 +31,81 @@ CAMPUS_CATEGORIES = [
 ]
 
 EVENT_CATEGORIES = ["Academic", "Hobbies", "Music", "Nightlife", "Business"]
+# Colors of the events of every category in the calendar view
+CATEGORY_COLORS = {
+    "Academic": "#007bff",
+    "Hobbies": "#28a745",
+    "Music": "#dc3545",
+    "Nightlife": "#6f42c1",
+    "Business": "#17a2b8",
+}
 # List of tags that can be used to sort the event data
 # NOTE: Do not add a tag named "clear", since it has a special functionality
 FILTERS = ["In-Person", "Today", "Free", *EVENT_CATEGORIES, "Past Events"]
 
 DB_NAME = "database.db"
-USE_SIMPLE_SEARCH=True
\ No newline at end of file
+
+# Settings of the SQLite connections (see app/db_profiles.py). One of:
+# "default": the SQLAlchemy and SQLite defaults, for development and the tests
+# "production": WAL journaling and tuned pragmas, so that concurrent workers don't block each other
+# NOTE: DB_PROFILE can be overridden from the environment
+DB_PROFILE = "default"
+
+# Tuning of the production profile
+# How long (in milliseconds) a connection waits for a lock before failing with "database is locked"
+SQLITE_BUSY_TIMEOUT = 5000
+# Size (in bytes) of the database file read through memory mapping and of the page cache
+# of every connection
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_CACHE_SIZE = 64 * 1024 * 1024
+# Connections kept open by every worker, one per thread serving requests
+SQLITE_POOL_SIZE = 8
+
+# Search backend used to match events against a search query (see app/search_backends.py). One of:
+# "simple": substring match on the event names using an in-process index
+# "fts": ranked full text search using an SQLite FTS5 table inside DB_NAME
+# "fuzzy": typo tolerant search on the event names using an in-process index
+# "elasticsearch": fuzzy search using the elasticsearch cluster at ELASTICSEARCH_HOST
+# NOTE: Every backend except elasticsearch runs without any external service
+SEARCH_BACKEND = "simple"
+
+# Maximum number of suggestions returned by the search bar autocomplete
+AUTOCOMPLETE_SIZE = 5
+
+# Shorter autocomplete queries get no suggestions, they match too much to be useful
+AUTOCOMPLETE_MIN_QUERY_LENGTH = 2
+# Autocomplete requests allowed per session: a burst of AUTOCOMPLETE_BURST requests,
+# refilled at AUTOCOMPLETE_RATE requests per second
+AUTOCOMPLETE_RATE = 5
+AUTOCOMPLETE_BURST = 10
+
+# Number of search/autocomplete results kept in memory and how long they live (in seconds)
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 300
+
+# Number of event cards rendered with a listing page, the next pages are fetched while scrolling
+EVENTS_PAGE_SIZE = 24
+
+# Answer the event listing filters from a columnar in-memory snapshot of the catalog
+# (see app/columnar.py) instead of SQL queries, for filter heavy traffic
+USE_COLUMNAR_FILTERS = False
+
+# Logged in users kept in memory and how long they live (in seconds)
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+
+# Pages that depend on the current time (e.g. today's or past events) get a new ETag every
+# ETAG_TIME_BUCKET seconds
+ETAG_TIME_BUCKET = 60
+
+# Organizer names and event analytics charts kept in memory
+ORGANIZER_CACHE_SIZE = 1024
+CHART_CACHE_SIZE = 256
+
+# How often (in seconds) every worker checks the database for writes made by the other workers
+# (see app/invalidation.py)
+CHANGE_POLL_INTERVAL = 1.0
+
+# Rendered event cards kept in memory and how long they live (in seconds)
+CARD_CACHE_SIZE = 4096
+CARD_CACHE_TTL = 600
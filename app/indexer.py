@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+import logging
+import threading
+
+from app.main import db
+from app.database import SearchOutbox
+
+# Outbox driven search indexer
+# Event routes only write a SearchOutbox row in the same commit as the event change,
+# a background worker then drains the outbox in batches and applies the changes to the
+# search index. Request latency no longer depends on the search index, and a change
+# can't be lost since it only leaves the outbox once it has been applied
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_POLL_INTERVAL = 2.0
+OUTBOX_MAX_ATTEMPTS = 8
+# Retries back off exponentially: 1s, 2s, 4s, ... capped at OUTBOX_MAX_BACKOFF seconds
+OUTBOX_MAX_BACKOFF = 300
+
+
+def enqueue_search_update(event_id, operation):
+    # Adds the change to the current session, the caller commits it together with the event
+    # and then calls wake_outbox_worker
+    db.session.add(SearchOutbox(event_id=event_id, operation=operation))
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(2 ** (attempts - 1), OUTBOX_MAX_BACKOFF))
+
+
+def drain_outbox(apply_changes, batch_size=OUTBOX_BATCH_SIZE, now=None):
+    # Applies one batch of pending changes, returns the number of outbox rows handled
+    # apply_changes is called with {event_id: operation} and returns the set of event ids
+    # that failed. Every operation re-syncs the event from the database, so applying the
+    # changes of an event out of order or more than once is harmless
+    now = now or datetime.now()
+    rows = (
+        SearchOutbox.query
+        .filter(SearchOutbox.available_at <= now)
+        .order_by(SearchOutbox.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    # Several changes of one event collapse into its latest operation
+    changes = {row.event_id: row.operation for row in rows}
+
+    try:
+        failed = set(apply_changes(changes))
+        error = "Failed to apply the change to the search index"
+    except Exception as e:
+        logging.exception("Applying %d search index changes failed", len(changes))
+        failed = set(changes)
+        error = str(e)[:300]
+
+    for row in rows:
+        if row.event_id not in failed:
+            db.session.delete(row)
+            continue
+
+        row.attempts += 1
+        row.last_error = error
+        if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+            logging.error("Dropping search index change %s after %d attempts: %s", row, row.attempts, error)
+            db.session.delete(row)
+        else:
+            row.available_at = now + retry_delay(row.attempts)
+
+    # Search results cached before the index caught up must not be served anymore, by any
+    # worker (the index is shared) and in any page
+    # NOTE: Imported here, app.invalidation imports the search backends which import this module
+    from app.invalidation import record_change, publish_change
+    applied = len(failed) < len(changes)
+    if applied:
+        record_change("search")
+    db.session.commit()
+    if applied:
+        publish_change("search")
+    return len(rows)
+
+
+class OutboxWorker(threading.Thread):
+    def __init__(self, app, apply_changes, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL):
+        super().__init__(name="search-outbox-worker", daemon=True)
+        self.app = app
+        self.apply_changes = apply_changes
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                with self.app.app_context():
+                    handled = drain_outbox(self.apply_changes, self.batch_size)
+            except Exception:
+                logging.exception("The search outbox worker failed to drain the outbox")
+                handled = 0
+
+            # Keep going while there is a backlog, otherwise sleep until woken up or the next poll
+            if handled < self.batch_size:
+                self.wake.wait(self.poll_interval)
+                self.wake.clear()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+
+# The worker of this process, started when an asynchronous search backend is selected
+outbox_worker = None
+
+
+def start_outbox_worker(app, apply_changes):
+    # Only one worker runs per process
+    global outbox_worker
+    if outbox_worker is not None and outbox_worker.is_alive():
+        return outbox_worker
+    outbox_worker = OutboxWorker(app, apply_changes)
+    outbox_worker.start()
+    return outbox_worker
+
+
+def wake_outbox_worker():
+    if outbox_worker is not None:
+        outbox_worker.wake.set()
@@ -0,0 +1,270 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import text
+
+from app.main import db
+from app.database import ChangeLog, EventDetails
+from app.globals import CHANGE_POLL_INTERVAL
+from app.cache import (
+    advance_catalog_version,
+    advance_registration_version,
+    bump_catalog_content_version,
+    bump_event_version,
+    search_cache,
+    user_cache,
+    organizer_name_cache,
+    chart_cache,
+    card_cache,
+)
+from app.search_backends import get_search_backend, use_search_backend, publish_search_change
+from app.columnar import event_columns, build_event_columns, refresh_event_columns
+from app.bitmap import build_event_bitmaps, refresh_event_bitmaps
+
+# Cross-worker cache invalidation
+# Every worker keeps in-process caches (search index and results, filter bitmaps and columns,
+# users, organizer names, charts, event cards, catalog versions) that go stale when another
+# worker, possibly on another host, writes to the shared database. So every such write adds a
+# ChangeLog row in the same commit (record_change) and invalidates the caches of its own worker
+# once committed (publish_change). A watcher thread in every worker notices commits made through
+# any other connection with PRAGMA data_version, which doesn't even read the database, and
+# replays the ChangeLog rows written by the other workers. The database is the only thing
+# shared, there is no broker to run
+# The ids of the ChangeLog rows are also the versions of the pages (see app/conditional.py): the
+# catalog version is the id of the last change applied, the registration version of a user the
+# id of their last registration change. Unlike counters, they are the same in every worker that
+# caught up and survive restarts
+
+# Changes are kept this long, a worker that falls further behind rebuilds all its caches
+CHANGE_LOG_RETENTION = timedelta(days=1)
+# How often (in seconds) a worker deletes the expired changes
+CHANGE_PRUNE_INTERVAL = 3600
+
+# A ChangeLog row as read by the watcher
+Change = namedtuple("Change", ["id", "topic", "event_id", "username", "origin"])
+
+
+def _on_event_change(event_id, username, event):
+    # event is None when the event was deleted
+    publish_search_change(event_id, event)
+    refresh_event_columns(event_id, event)
+    refresh_event_bitmaps(event_id, event)
+    # The cached cards of the previous version are no longer looked up
+    bump_event_version(event_id)
+
+
+def _on_registration_change(event_id, username, event):
+    # The registration count is part of the autocomplete ranking
+    get_search_backend().update_ranking(event_id)
+    chart_cache.discard(event_id)
+
+
+def _on_rating_change(event_id, username, event):
+    # The ratings are only cached in the pages, their versions follow the change ids
+    pass
+
+
+def _on_user_change(event_id, username, event):
+    user_cache.discard(username)
+    organizer_name_cache.discard(username)
+    # The charts break the registered users down by their details
+    chart_cache.clear()
+
+
+def _on_search_change(event_id, username, event):
+    # The shared search index caught up with the event changes (see app/indexer.py)
+    bump_catalog_content_version()
+
+
+# The caches to invalidate for every topic, handlers are called with (event_id, username, event)
+HANDLERS = {
+    "events": _on_event_change,
+    "registrations": _on_registration_change,
+    "ratings": _on_rating_change,
+    "users": _on_user_change,
+    "search": _on_search_change,
+}
+
+# Identifies the changes made by this worker, see get_origin
+_origin = None
+
+
+def get_origin():
+    global _origin
+    if _origin is None:
+        _origin = f"{socket.gethostname()[:40]}:{os.getpid()}:{secrets.token_hex(4)}"
+    return _origin
+
+
+def record_change(topic, event_id=None, username=None):
+    # Adds the change to the current session, the caller commits it together with the write
+    # and then calls publish_change
+    if topic not in HANDLERS:
+        raise ValueError(f"Unknown change topic {topic!r}, expected one of {sorted(HANDLERS)}")
+    db.session.add(ChangeLog(topic=topic, event_id=event_id, username=username, origin=get_origin()))
+
+
+def publish_change(topic, event_id=None, username=None, event=None):
+    # Called after the commit, invalidates the caches of this worker
+    # event is the written event for the "events" topic, None if it was deleted
+    HANDLERS[topic](event_id, username, event)
+    # Moves the versions past the change, once the changes the other workers committed before
+    # it are replayed too
+    if change_watcher is not None:
+        # The handlers may have read through the session. Its connection goes back to the pool
+        # before waiting for the lock, the thread holding it may need one to replay the changes
+        db.session.rollback()
+        change_watcher.poll()
+
+
+def advance_versions(rows):
+    # Called once the changes are applied to the caches of this worker, the changes of this
+    # worker included
+    for row in rows:
+        if row.topic == "registrations":
+            advance_registration_version(row.username, row.id)
+    advance_catalog_version(rows[-1].id)
+
+
+def replay_changes(rows):
+    # Invalidates the caches of this worker for the changes made by the other workers
+    # Repeated changes are replayed once, the handlers read the current state anyway
+    origin = get_origin()
+    changes = dict.fromkeys((row.topic, row.event_id, row.username) for row in rows if row.origin != origin)
+    for topic, event_id, username in changes:
+        event = db.session.get(EventDetails, event_id) if topic == "events" else None
+        HANDLERS[topic](event_id, username, event)
+    return len(changes)
+
+
+def rebuild_local_caches():
+    # Used when changes were pruned before this worker could replay them
+    for cache in [search_cache, user_cache, organizer_name_cache, chart_cache, card_cache]:
+        cache.clear()
+    backend = get_search_backend()
+    if backend.asynchronous:
+        # The index is shared by the workers and kept in sync by the search outbox
+        bump_catalog_content_version()
+    else:
+        use_search_backend(backend.name)
+    build_event_bitmaps()
+    if event_columns.built:
+        build_event_columns()
+
+
+def get_last_change_id():
+    # The last id handed out, even if that change was pruned since (ids are never reused)
+    last_id = db.session.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")).scalar()
+    return last_id or 0
+
+
+def prune_changes(now=None):
+    now = now or datetime.now()
+    pruned = ChangeLog.query.filter(ChangeLog.created_at < now - CHANGE_LOG_RETENTION).delete()
+    db.session.commit()
+    return pruned
+
+
+class ChangeWatcher(threading.Thread):
+    def __init__(self, app, last_seen_id=0, poll_interval=CHANGE_POLL_INTERVAL):
+        super().__init__(name="change-watcher", daemon=True)
+        self.app = app
+        # Changes up to this id were made before the caches were built or have been replayed
+        self.last_seen_id = last_seen_id
+        self.poll_interval = poll_interval
+        self.data_version = None
+        self.connection = None
+        self.pruned_at = time.monotonic()
+        self.stopped = threading.Event()
+        # Polled by the watcher thread and by the requests publishing a change
+        self.lock = threading.Lock()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                with self.app.app_context():
+                    self.poll()
+                    if time.monotonic() - self.pruned_at > CHANGE_PRUNE_INTERVAL:
+                        self.pruned_at = time.monotonic()
+                        prune_changes()
+            except Exception:
+                logging.exception("The change watcher failed to replay the changes of the other workers")
+            self.stopped.wait(self.poll_interval)
+
+    def poll(self):
+        # Replays the changes committed since the last poll, returns the number of new changes
+        # Needs an app context
+        with self.lock:
+            return self._poll()
+
+    def _poll(self):
+        if self.connection is None:
+            # A connection of its own: data_version only moves for commits made by other connections
+            self.connection = sqlite3.connect(db.engine.url.database, check_same_thread=False)
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return 0
+        self.data_version = data_version
+
+        # Read through the connection of the watcher, most polls find nothing to replay and
+        # don't take a connection from the pool
+        rows = [Change(*row) for row in self.connection.execute(
+            "SELECT id, topic, event_id, username, origin FROM change_log WHERE id > ? ORDER BY id",
+            (self.last_seen_id,),
+        )]
+        if rows:
+            if rows[0].id != self.last_seen_id + 1 and self._missed_pruned_changes():
+                logging.warning("Changes after %d were pruned before they were replayed, rebuilding the caches", self.last_seen_id)
+                rebuild_local_caches()
+            else:
+                replay_changes(rows)
+            advance_versions(rows)
+            self.last_seen_id = rows[-1].id
+        return len(rows)
+
+    def _missed_pruned_changes(self):
+        # Ids are never reused and the oldest changes are pruned first, so changes were missed
+        # if even the change following the last one seen is gone
+        first_id = self.connection.execute("SELECT min(id) FROM change_log").fetchone()[0]
+        return first_id is not None and first_id > self.last_seen_id + 1
+
+    def stop(self):
+        self.stopped.set()
+
+
+# The watcher of this process, started by create_app once the caches are built
+change_watcher = None
+
+
+def start_change_watcher(app, last_seen_id=None):
+    # Only one watcher runs per process, needs an app context unless last_seen_id is given
+    global change_watcher
+    if change_watcher is not None and change_watcher.is_alive():
+        return change_watcher
+    if last_seen_id is None:
+        last_seen_id = get_last_change_id()
+    # The caches were built from the database with the changes up to last_seen_id
+    advance_catalog_version(last_seen_id)
+    change_watcher = ChangeWatcher(app, last_seen_id)
+    change_watcher.start()
+    return change_watcher
+
+
+def _after_fork_in_child():
+    # Workers forked from a preloaded app are workers of their own: they need their own
+    # origin and watcher (threads don't survive a fork). The caches were inherited from the
+    # parent, so the watcher carries on from the parent's position
+    global _origin
+    _origin = None
+    if change_watcher is not None:
+        start_change_watcher(change_watcher.app, change_watcher.last_seen_id)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -9,8 +9,8 @@ import logging, sys
 
 ## Initialize and import databases schemas
 db = SQLAlchemy()
-from app.database import Credentials, EventDetails
-from app.globals import DB_NAME, USE_SIMPLE_SEARCH
+from app.database import Credentials
+from app.globals import DB_NAME, DB_PROFILE, SEARCH_BACKEND, USE_COLUMNAR_FILTERS
 
 # Initialize logger module
 logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
@@ -38,10 +38,6 @@ def create_elasticsearch(elasticsearch_host, max_retries=60, retry_delay=5):
 
     return es
 
-if not USE_SIMPLE_SEARCH:
-    elasticsearch_host = os.environ["ELASTICSEARCH_HOST"]
-    es = create_elasticsearch(elasticsearch_host)
-
 def create_app(debug):
     app = Flask(__name__)
     app.debug = debug
@@ -50,7 +46,9 @@ def create_app(debug):
     app.config["GRAPHIC_DIRECTORY"] = path = os.path.join(
         app.root_path, "static", "event-assets"
     )
-    db.init_app(app)
+    # DB_PROFILE can be overridden from the environment, e.g. DB_PROFILE=production for the deployment
+    from app.db_profiles import init_database
+    init_database(app, db, os.environ.get("DB_PROFILE", DB_PROFILE))
     bootstrap = Bootstrap(app=app)
 
     ## Make the app CORS compliant
@@ -76,40 +74,49 @@ def create_app(debug):
     app.register_blueprint(user_events, url_prefix="/")
     app.register_blueprint(account, url_prefix="/")
 
+    # The event cards of the listing pages are rendered through the fragment cache
+    from app.fragments import render_event_card
+    app.add_template_global(render_event_card, "event_card")
+
     with app.app_context():
         db.create_all()
+        # create_all doesn't add new columns and indexes to existing tables
+        from app.migrations import migrate
+        applied = migrate()
+        if applied:
+            logging.info("Applied the database migrations %s", ", ".join(applied))
+
+        # Build the search backend from the events database
+        # SEARCH_BACKEND can be overridden from the environment without touching the code
+        from app.search_backends import use_search_backend
+        use_search_backend(os.environ.get("SEARCH_BACKEND", SEARCH_BACKEND), app=app)
+
+        # Bitmaps of the filter tags, for combining them
+        from app.bitmap import build_event_bitmaps
+        build_event_bitmaps()
+
+        if USE_COLUMNAR_FILTERS:
+            from app.columnar import build_event_columns
+            build_event_columns()
 
-        # Index the events database using elasticsearch
-        # Scrape any existing "junk" data
-        if not USE_SIMPLE_SEARCH:
-            if es.indices.exists(index="events"):
-                es.options(ignore_status=[400, 404]).indices.delete(index="events")
-            # Initialize the events index to an empty dict
-            if not es.indices.exists(index="events"):
-                es.index(index="events", document={})
-
-            events_data = EventDetails.query.all()
-            for row in events_data:
-                event_detail = {
-                    "id": str(getattr(row, "id")),
-                    "name": str(getattr(row, "name")),
-                    "description": str(getattr(row, "short_description")),
-                    "category": str(getattr(row, "category")),
-                    "venue": str(getattr(row, "venue")),
-                    "additional_info": str(getattr(row, "additional_info")),
-                }
-                logging.info("The event dict for indexing:", event_detail)
-                es.index(index="events", document=event_detail)
-
-            es.indices.refresh(index="events")
-            logging.info(es.cat.count(index="events", format="json"))
+        # Replay the writes of the other workers into the caches built above
+        from app.invalidation import start_change_watcher
+        start_change_watcher(app)
 
     login_manager = LoginManager()
     login_manager.init_app(app)
 
     @login_manager.user_loader
     def load_user(username):
-        return Credentials.query.get(username)
+        # Users are cached detached from the session, they are only read
+        from app.cache import user_cache
+        user = user_cache.get(username)
+        if user is None:
+            user = db.session.get(Credentials, username)
+            if user is not None:
+                db.session.expunge(user)
+                user_cache.set(username, user)
+        return user
 
     # Custom Error Handling for 404 Error
     @app.errorhandler(404)
@@ -0,0 +1,138 @@
+from sqlalchemy import inspect, select, func, text, update, and_, or_
+
+from app.main import db
+from app.database import EventDetails, EventRating, EventRegistration, event_tags, event_starts_at, event_ends_at
+
+# Schema changes that create_all can't make to an existing database.db, applied at startup
+# create_all only creates the missing tables, so the columns and indexes added to existing
+# tables are migrations. The migrations are applied in order and the number of the last one
+# applied is the user_version of the database, so each of them runs once per database. They
+# are written to also run on a database created by create_all, which already has the change.
+# Every migration runs in a BEGIN IMMEDIATE transaction that reads the version again: the workers
+# starting together against one database take turns and only the first one applies it
+
+# Number of events backfilled per transaction
+BACKFILL_BATCH_SIZE = 10000
+
+
+def add_event_time_columns():
+    # starts_at and ends_at were added to event_details after the first databases were created
+    columns = {column["name"] for column in inspect(db.session.connection()).get_columns("event_details")}
+    for name in ["starts_at", "ends_at"]:
+        if name not in columns:
+            db.session.execute(text(f"ALTER TABLE event_details ADD COLUMN {name} DATETIME"))
+
+
+def add_event_time_indexes():
+    create_indexes(EventDetails.__table__)
+    # Superseded by ix_event_details_starts_at
+    db.session.execute(text("DROP INDEX IF EXISTS ix_event_details_start_date"))
+
+
+def add_lookup_indexes():
+    # The ratings and registrations of a user and the events of a tag
+    for table in [EventRating.__table__, EventRegistration.__table__, event_tags]:
+        create_indexes(table)
+
+
+def add_listing_index():
+    # The keyset order of the listings, ix_event_details_starts_at_id
+    create_indexes(EventDetails.__table__)
+
+
+def fill_event_times():
+    # The events written before starts_at and ends_at existed, in the migration transaction
+    backfill_event_times(commit=False)
+
+
+def create_indexes(table):
+    # In the migration transaction, the indexes created by create_all are skipped
+    for index in table.indexes:
+        index.create(db.session.connection(), checkfirst=True)
+
+
+def count_taken_seats():
+    # current_capacity was set to 0 when an event was created and never updated by the
+    # registrations, it is now kept up to date by the registrations (see events.take_seat)
+    registrations = (
+        select(func.count(EventRegistration.id))
+        .where(EventRegistration.event_id == EventDetails.id)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(EventDetails).values(current_capacity=registrations).execution_options(synchronize_session=False)
+    )
+
+
+# Append only: the position of a migration is its version
+MIGRATIONS = [
+    add_event_time_columns,
+    add_event_time_indexes,
+    add_lookup_indexes,
+    count_taken_seats,
+    add_listing_index,
+    fill_event_times,
+]
+
+
+def get_schema_version():
+    return db.session.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate():
+    # Applies the migrations the database doesn't have yet, each in its own transaction
+    # Returns the names of the migrations applied by this call
+    applied = []
+    db.session.commit()
+    while True:
+        # The write lock is taken before the version is read, another worker may have applied
+        # the migration while this one waited for it
+        db.session.execute(text("BEGIN IMMEDIATE"))
+        version = get_schema_version()
+        if version >= len(MIGRATIONS):
+            db.session.rollback()
+            if version > len(MIGRATIONS):
+                raise RuntimeError(f"The database is at schema version {version}, this code only knows {len(MIGRATIONS)}")
+            return applied
+        migration = MIGRATIONS[version]
+        migration()
+        # PRAGMA takes no bound parameters, the version is ours
+        db.session.execute(text(f"PRAGMA user_version = {version + 1}"))
+        db.session.commit()
+        applied.append(migration.__name__)
+
+
+def backfill_event_times(batch_size=BACKFILL_BATCH_SIZE, commit=True):
+    # Fills starts_at and ends_at for the events written without them: before the columns
+    # existed (see fill_event_times), or by bulk inserts that bypass the ORM (see sync_event_times)
+    # Every batch is committed unless commit is False
+    # Returns the number of events updated
+    missing = or_(
+        and_(EventDetails.starts_at.is_(None), EventDetails.start_date.is_not(None)),
+        and_(EventDetails.ends_at.is_(None), or_(EventDetails.start_date.is_not(None), EventDetails.end_date.is_not(None))),
+    )
+    query = (
+        db.session.query(
+            EventDetails.id, EventDetails.start_date, EventDetails.start_time, EventDetails.end_date, EventDetails.end_time,
+        )
+        .filter(missing)
+        .order_by(EventDetails.id)
+    )
+
+    updated, last_id = 0, 0
+    while True:
+        rows = query.filter(EventDetails.id > last_id).limit(batch_size).all()
+        if not rows:
+            return updated
+        db.session.execute(update(EventDetails), [
+            {
+                "id": row.id,
+                "starts_at": event_starts_at(row.start_date, row.start_time),
+                "ends_at": event_ends_at(row.start_date, row.end_date, row.end_time),
+            }
+            for row in rows
+        ])
+        if commit:
+            db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1].id
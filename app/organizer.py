@@ -5,6 +5,8 @@ from app.main import db # db is for database
 from app.database import EventDetails, Credentials
 from app.auth import organizer_required
 from app.analytics import get_avg_rating
+from app.projections import EventCard, project
+from app.conditional import conditional_page
 
 organizer = Blueprint("organizer", __name__)
 
@@ -12,6 +14,7 @@ organizer = Blueprint("organizer", __name__)
 @organizer.route("/organizer", methods=["GET"])
 @login_required
 @organizer_required
+@conditional_page()
 def main():
     my_events_data = get_my_events_from_database()
     my_avg_rating = get_avg_rating()
@@ -19,22 +22,10 @@ def main():
     return render_template("organizer_main.html", my_events_data=my_events_data, my_avg_rating=my_avg_rating)
 
 def get_my_events_from_database():
-    events_data = (
+    # Only the columns shown by the event cards
+    return project(
         db.session.query(EventDetails)
         .join(Credentials)
-        .filter(EventDetails.organizer == current_user.username)
-        .all()
+        .filter(EventDetails.organizer == current_user.username),
+        EventCard,
     )
-
-    # Make a dict for event details
-    dict_of_events_details = {}
-    for row in events_data:
-        event_detail = {}
-
-        # TODO: Ideally we should only be passing information that is required by the user_main.html
-        for column in row.__table__.columns:
-            event_detail[column.name] = str(getattr(row, column.name))
-
-        dict_of_events_details[row.id] = event_detail
-
-    return dict_of_events_details
@@ -0,0 +1,101 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from app.globals import EVENTS_PAGE_SIZE
+from app.projections import EventCard
+from app.search import get_eventids_matching_search_query
+
+# Keyset pagination of the event listings
+# Listings are ordered by (starts_at, id) and a page starts right after the last event of the
+# previous page:
+#   WHERE (starts_at, id) > (:starts_at, :id) ORDER BY starts_at, id LIMIT n
+# a seek into the (starts_at, id) index, so every page costs the same, however deep into the
+# listing it is (unlike OFFSET).
+# Search results keep their relevance order instead, they are paged by position in the
+# (cached) list of matching ids.
+# The position of the next page is handed to the client as an opaque cursor token
+
+# Search result ids sent to the database per query while filling a page
+SEARCH_CHUNK_SIZE = 4 * EVENTS_PAGE_SIZE
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(token):
+    # Raises ValueError for a token that wasn't made by encode_cursor
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as error:
+        raise ValueError(f"Invalid cursor {token}") from error
+    if not isinstance(position, dict):
+        raise ValueError(f"Invalid cursor {token}")
+    return position
+
+
+def listing_key(event):
+    # The keyset position of an event, see LISTING_ORDER in app/filter.py
+    return event.starts_at, event.id
+
+
+def get_listing_page(events_filter, after=None, page_size=EVENTS_PAGE_SIZE):
+    # Returns the page of event cards after the given listing_key and the key the next page
+    # starts after (None on the last page)
+
+    # One more row tells whether there is a next page
+    rows = events_filter.listing_page(after, page_size + 1, EventCard)
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, listing_key(rows[-1])
+
+
+def get_ranked_page(make_filter, event_ids, offset=0, page_size=EVENTS_PAGE_SIZE):
+    # Returns the page of event cards (in the order of event_ids) matching the filter from
+    # make_filter(), starting at event_ids[offset], and the offset of the next page
+    # Search hits can be filtered out, so the ids are checked a chunk at a time until the page is full
+    page, positions = [], []
+    start = offset
+    while len(page) <= page_size and start < len(event_ids):
+        chunk = event_ids[start:start + SEARCH_CHUNK_SIZE]
+        rows = make_filter().event_ids(chunk).all(EventCard)
+        position = {event_id: number for number, event_id in enumerate(chunk, start=start)}
+        page.extend(rows)
+        positions.extend(position[row.id] for row in rows)
+        start += len(chunk)
+
+    if len(page) <= page_size:
+        return page, None
+    return page[:page_size], positions[page_size]
+
+
+def get_events_page(make_filter, search=None, cursor=None, page_size=EVENTS_PAGE_SIZE):
+    # A page of event cards of a listing and the cursor of the next page (None on the last page)
+    # make_filter returns a new EventFilterBuilder with the filters of the listing
+    # Raises ValueError for an invalid cursor
+    position = decode_cursor(cursor) if cursor else {}
+
+    if search is not None:
+        offset = position.get("offset", 0)
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError(f"Invalid cursor {cursor}")
+        event_ids = get_eventids_matching_search_query(query=search)
+        rows, next_offset = get_ranked_page(make_filter, event_ids, offset, page_size)
+        return rows, None if next_offset is None else encode_cursor({"offset": next_offset})
+
+    after = position.get("after")
+    if after is not None:
+        try:
+            starts_at, event_id = after
+            # Events without a date have no start
+            after = (None if starts_at is None else datetime.fromisoformat(starts_at)), int(event_id)
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"Invalid cursor {cursor}") from error
+    rows, next_key = get_listing_page(make_filter(), after, page_size)
+    if next_key is None:
+        return rows, None
+    starts_at, event_id = next_key
+    return rows, encode_cursor({"after": [None if starts_at is None else starts_at.isoformat(), event_id]})
@@ -0,0 +1,25 @@
+from collections import namedtuple
+
+from app.database import EventDetails
+
+# Compact, read-only event rows for the listing pages
+# A listing only selects the columns its view shows and every row becomes a namedtuple of the
+# native column values (dates stay dates), instead of a full ORM object plus a dict of strings.
+# The fields of a row type are EventDetails column names, e.g. event.start_date
+
+# An event card of the listing pages, the start is the keyset of the pagination (see app/pagination.py)
+EventCard = namedtuple("EventCard", ["id", "name", "short_description", "image", "start_date", "start_time", "starts_at"])
+
+# An event of the calendar view
+EventCalendarEntry = namedtuple(
+    "EventCalendarEntry", ["id", "name", "category", "start_date", "start_time", "end_date", "end_time"]
+)
+
+
+def columns_of(row_type):
+    return [getattr(EventDetails, field) for field in row_type._fields]
+
+
+def project(query, row_type):
+    # Runs an EventDetails query (with any joins and filters) selecting only the columns of row_type
+    return [row_type._make(row) for row in query.with_entities(*columns_of(row_type))]
@@ -0,0 +1,236 @@
+import itertools
+import logging
+import math
+import re
+import threading
+
+import numpy as np
+
+# Multi-field BM25 (BM25F) relevance ranking of the events for the search results page
+# Term frequencies and field lengths live in compact numpy arrays, one entry per (term, event):
+#   terms[i], rows[i]  -> the term and the row of the event it occurs in
+#   tfs[i, f]          -> occurrences of the term in field f of the event
+#   weights[i]         -> the boosted, length normalized term frequency
+# so scoring a query is a handful of vectorized operations per query term, whatever the size
+# of the catalog.
+# Like a Lucene segment, the main postings are sorted by term and writes go to a small
+# unsorted delta that is merged back once it grows too large
+
+# Searchable fields and their boosts, a match in the name is worth the most
+FIELDS = ["name", "short_description", "long_description", "venue", "category"]
+FIELD_BOOSTS = np.array([3.0, 1.5, 1.0, 1.0, 2.0], dtype=np.float32)
+
+# Standard BM25 parameters: term frequency saturation and document length normalization
+K1 = 1.2
+B = 0.75
+
+# The delta is merged into the main postings once it holds this many postings,
+# or this share of the main postings if that is larger
+MERGE_SIZE = 10_000
+MERGE_RATIO = 0.05
+
+# Deleted rows are dropped by a merge once they make up this share of the rows
+DELETED_ROWS_RATIO = 0.25
+
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+class _Postings:
+    # Parallel posting arrays, see the top of the module
+    def __init__(self, terms=None, rows=None, tfs=None, weights=None):
+        self.terms = np.zeros(0, dtype=np.int32) if terms is None else terms
+        self.rows = np.zeros(0, dtype=np.int32) if rows is None else rows
+        self.tfs = np.zeros((0, len(FIELDS)), dtype=np.uint16) if tfs is None else tfs
+        self.weights = np.zeros(0, dtype=np.float32) if weights is None else weights
+
+    def __len__(self):
+        return len(self.terms)
+
+    def concatenate(self, other):
+        return _Postings(
+            np.concatenate([self.terms, other.terms]),
+            np.concatenate([self.rows, other.rows]),
+            np.concatenate([self.tfs, other.tfs]),
+            np.concatenate([self.weights, other.weights]),
+        )
+
+    def select(self, selection):
+        return _Postings(self.terms[selection], self.rows[selection], self.tfs[selection], self.weights[selection])
+
+
+class BM25FIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def _reset(self):
+        # term -> term id, term ids index the df array
+        self.vocabulary = {}
+        # Per row: the event id, the number of words in every field and whether it is live
+        self.event_ids = np.zeros(0, dtype=np.int64)
+        self.lengths = np.zeros((0, len(FIELDS)), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        # event_id -> row of its live entry
+        self.row_of = {}
+        # Number of live events containing each term
+        self.df = np.zeros(0, dtype=np.int32)
+        # Main postings sorted by term (and by row within a term), delta postings in insertion order
+        self.main = _Postings()
+        self.delta = _Postings()
+
+    def build(self, events):
+        # Build the index from objects with an id and the FIELDS attributes, replacing any existing content
+        with self.lock:
+            self._reset()
+            self._append([self._analyze(event) for event in events])
+            self._merge()
+        logging.info("Built the BM25 index with %d events and %d terms", len(self.row_of), len(self.vocabulary))
+
+    def add(self, event):
+        with self.lock:
+            self._remove(event.id)
+            self._append([self._analyze(event)])
+            self._merge_if_needed()
+
+    def remove(self, event_id):
+        with self.lock:
+            self._remove(event_id)
+            self._merge_if_needed()
+
+    def search(self, query, limit=None):
+        # Returns the ids of the events containing every query term (in any field),
+        # most relevant first
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self.lock:
+            if not terms <= self.vocabulary.keys():
+                return []
+
+            num_rows = len(self.event_ids)
+            scores = np.zeros(num_rows, dtype=np.float32)
+            num_matched_terms = np.zeros(num_rows, dtype=np.uint8)
+            for term in terms:
+                rows, term_scores = self._score_term(self.vocabulary[term])
+                # A term occurs at most once per row in each segment, and a row lives in one segment
+                scores[rows] += term_scores
+                num_matched_terms[rows] += 1
+
+            matches = np.flatnonzero((num_matched_terms == len(terms)) & self.alive)
+            match_scores = scores[matches]
+            if limit is not None and limit < len(matches):
+                best = np.argpartition(-match_scores, limit - 1)[:limit]
+                matches, match_scores = matches[best], match_scores[best]
+
+            # Equally relevant events stay in row (i.e. insertion) order
+            order = np.lexsort((matches, -match_scores))
+            return self.event_ids[matches[order]].tolist()
+
+    def _score_term(self, term_id):
+        # Rows containing the term and their BM25F score for the term
+        # Searching with a matching dtype avoids converting the whole array
+        term_id = np.int32(term_id)
+        start = np.searchsorted(self.main.terms, term_id, side="left")
+        end = np.searchsorted(self.main.terms, term_id, side="right")
+        in_delta = self.delta.terms == term_id
+        rows = np.concatenate([self.main.rows[start:end], self.delta.rows[in_delta]])
+        weights = np.concatenate([self.main.weights[start:end], self.delta.weights[in_delta]])
+
+        num_docs = len(self.row_of)
+        df = self.df[term_id]
+        idf = math.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+        return rows, idf * weights * (K1 + 1.0) / (K1 + weights)
+
+    def _weights(self, postings):
+        # Boosted term frequency, each field normalized by its length relative to the average
+        live_lengths = self.lengths[self.alive]
+        # An empty field everywhere must not divide by zero
+        avg_lengths = np.maximum(live_lengths.mean(axis=0), 1.0) if len(live_lengths) else np.ones(len(FIELDS))
+        norms = 1.0 - B + B * self.lengths[postings.rows] / avg_lengths
+        return (postings.tfs * FIELD_BOOSTS / norms).sum(axis=1).astype(np.float32)
+
+    def _analyze(self, event):
+        # (event id, term ids, number of words in every field) of an event
+        vocabulary = self.vocabulary
+        term_ids, lengths = [], []
+        for field in FIELDS:
+            tokens = tokenize(getattr(event, field) or "")
+            lengths.append(len(tokens))
+            term_ids.extend([vocabulary.setdefault(token, len(vocabulary)) for token in tokens])
+        return event.id, term_ids, lengths
+
+    def _append(self, documents):
+        # Add the analyzed documents as new rows, their postings go to the delta
+        if not documents:
+            return
+        first_row = len(self.event_ids)
+        lengths = np.array([lengths for _, _, lengths in documents], dtype=np.int64)
+        terms = np.fromiter(
+            itertools.chain.from_iterable(term_ids for _, term_ids, _ in documents),
+            dtype=np.int64, count=int(lengths.sum()),
+        )
+        # The terms of a document come field by field, in the order of FIELDS
+        fields = np.repeat(np.tile(np.arange(len(FIELDS)), len(documents)), lengths.ravel())
+        rows = np.repeat(np.arange(first_row, first_row + len(documents), dtype=np.int64), lengths.sum(axis=1))
+
+        # One posting per (term, row) with the term frequency of every field
+        pairs, inverse = np.unique((terms << 32) | rows, return_inverse=True)
+        tfs = np.bincount(inverse.ravel() * len(FIELDS) + fields, minlength=len(pairs) * len(FIELDS))
+        tfs = tfs.reshape(len(pairs), len(FIELDS)).astype(np.uint16)
+        postings = _Postings((pairs >> 32).astype(np.int32), (pairs & 0xFFFFFFFF).astype(np.int32), tfs)
+
+        event_ids = [event_id for event_id, _, _ in documents]
+        self.event_ids = np.concatenate([self.event_ids, np.array(event_ids, dtype=np.int64)])
+        self.lengths = np.vstack([self.lengths, lengths.astype(np.float32)])
+        self.alive = np.concatenate([self.alive, np.ones(len(documents), dtype=bool)])
+        for row, event_id in enumerate(event_ids, start=first_row):
+            self.row_of[event_id] = row
+
+        self.df = np.concatenate([self.df, np.zeros(len(self.vocabulary) - len(self.df), dtype=np.int32)])
+        self.df += np.bincount(postings.terms, minlength=len(self.vocabulary)).astype(np.int32)
+        postings.weights = self._weights(postings)
+        self.delta = self.delta.concatenate(postings)
+
+    def _remove(self, event_id):
+        row = self.row_of.pop(event_id, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self.df[self.main.terms[self.main.rows == row]] -= 1
+        self.df[self.delta.terms[self.delta.rows == row]] -= 1
+
+    def _merge_if_needed(self):
+        num_deleted = len(self.event_ids) - len(self.row_of)
+        if (
+            len(self.delta) > max(MERGE_SIZE, MERGE_RATIO * len(self.main))
+            or num_deleted > DELETED_ROWS_RATIO * len(self.event_ids)
+        ):
+            self._merge()
+
+    def _merge(self):
+        # Fold the delta into the main postings, drop the deleted rows and renumber the
+        # remaining ones (order is preserved), then refresh the length normalization
+        postings = self.main.concatenate(self.delta)
+        postings = postings.select(self.alive[postings.rows])
+        # Delta rows are higher than main rows, so a stable sort on the term keeps rows ascending
+        postings = postings.select(np.argsort(postings.terms, kind="stable"))
+
+        new_rows = np.cumsum(self.alive, dtype=np.int64) - 1
+        postings.rows = new_rows[postings.rows].astype(np.int32)
+        self.event_ids = self.event_ids[self.alive]
+        self.lengths = self.lengths[self.alive]
+        self.alive = np.ones(len(self.event_ids), dtype=bool)
+        self.row_of = {event_id: row for row, event_id in enumerate(self.event_ids.tolist())}
+
+        postings.weights = self._weights(postings)
+        self.main = postings
+        self.delta = _Postings()
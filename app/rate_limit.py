@@ -0,0 +1,55 @@
+import math
+import threading
+import time
+
+from app.cache import LRUCache
+
+# Token bucket rate limiting
+# A bucket holds up to capacity tokens and is refilled at rate tokens per second,
+# every admitted request takes one token. Bursts are allowed up to the capacity and the
+# sustained rate can't exceed the refill rate
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def take(self):
+        # Returns 0 if a token was taken, otherwise the number of seconds until one is available
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    # One token bucket per key (e.g. per session)
+    def __init__(self, rate, capacity, max_keys=10000, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        # A bucket that has been idle long enough to refill completely is the same as a new one,
+        # so it can expire from the cache
+        self.buckets = LRUCache(maxsize=max_keys, ttl=capacity / rate, clock=clock)
+        self.lock = threading.Lock()
+
+    def take(self, key):
+        # Returns 0 if the request is admitted, otherwise the whole number of seconds to wait
+        # (suitable for a Retry-After header)
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.capacity, self.clock)
+            # Refresh the entry so an active key never expires
+            self.buckets.set(key, bucket)
+        wait = bucket.take()
+        return math.ceil(wait) if wait else 0
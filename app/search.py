@@ -1,79 +1,54 @@
 from flask import Blueprint, request, redirect, url_for
+from flask_login import current_user
 import logging
 
 
-from app.globals import USE_SIMPLE_SEARCH
+from app.globals import AUTOCOMPLETE_SIZE, AUTOCOMPLETE_MIN_QUERY_LENGTH, AUTOCOMPLETE_RATE, AUTOCOMPLETE_BURST
 from app.auth import login_required
-from app.database import EventDetails
-
-# To switch between two different serach implementation
-if not USE_SIMPLE_SEARCH:
-    from app.main import es
+from app.search_backends import get_search_backend
+from app.cache import search_cache, search_flight, get_catalog_content_version, normalize_query
+from app.rate_limit import RateLimiter
 
 search = Blueprint("search", __name__)
 
+# Admission control for the autocomplete, the search bar fires a request on every pause in typing
+autocomplete_limiter = RateLimiter(rate=AUTOCOMPLETE_RATE, capacity=AUTOCOMPLETE_BURST)
+
+
+def autocomplete_rate_limit_key():
+    # Every user gets their own token bucket, the anonymous requests one per address
+    # Not a value kept in the session: a client that drops its cookies would get a new bucket
+    # on every request
+    if current_user.is_authenticated:
+        return f"user:{current_user.get_id()}"
+    return f"address:{request.remote_addr}"
+
 
 @search.route("/search", methods=["GET"])
 def search_autocomplete():
     # This function is a standalone method to query our events database with a set of keywords
     # Login won't be required for this method
     
-    query = request.args["search"].lower()
-
-    if USE_SIMPLE_SEARCH:
-        # Using database for autocomplete suggestions
-        # Use simple search algorithm
-        result = []
-
-        # If empty query return empty list
-        if (query == ""):
-            return result
-
-        # Query the events database
-        events_data = EventDetails.query.all()
+    query = normalize_query(request.args["search"])
 
-        for row in events_data:
-            # Check if title matches
-            event_name = str(getattr(row, "name"))
-            event_id = str(getattr(row, "id"))
+    # If the query is too short return empty list
+    if len(query) < AUTOCOMPLETE_MIN_QUERY_LENGTH:
+        return []
 
-            if (query in event_name.lower()):
-                logging.info("Query matched event: %s - %s", event_name, event_id)
-                
-                # Append the IDS
-                result.append([event_name, event_id])
+    retry_after = autocomplete_limiter.take(autocomplete_rate_limit_key())
+    if retry_after:
+        logging.warning("Autocomplete rate limit exceeded, retry after %d seconds", retry_after)
+        return [], 429, {"Retry-After": str(retry_after)}
 
-            else:
-                logging.info("Query did not match event: %s", event_name)
+    backend = get_search_backend()
+    backend.rescore()
 
-        return result
-
-    tokens = query.split(" ")
-
-    logging.info("Search autocomplete received the query: ", tokens)
-
-    clauses = [
-        {
-            "span_multi": {
-                "match": {"fuzzy": {"name": {"value": i, "fuzziness": "AUTO"}}}
-            }
-        }
-        for i in tokens
-    ]
-
-    payload = {
-        "bool": {
-            "must": [{"span_near": {"clauses": clauses, "slop": 0, "in_order": False}}]
-        }
-    }
-
-    resp = es.search(index="events", query=payload, size=5)
-    
-    # Return a list of event name and id ordered by the most relevant on top
-    return [
-        [result["_source"]["name"], result["_source"]["id"]]
-        for result in resp["hits"]["hits"]
-    ]
+    # Results are cached per catalog content version, so any event write invalidates them
+    # Identical queries that miss the cache at the same time share one backend call
+    cache_key = ("autocomplete", query, get_catalog_content_version())
+    return search_cache.get_or_compute(cache_key, lambda: search_flight.do(cache_key, lambda: [
+        [event_name, str(event_id)] for event_name, event_id in backend.autocomplete(query, AUTOCOMPLETE_SIZE)
+    ]))
 
 @search.route("/search_events/<filter>", methods=["POST"])
 @login_required
@@ -107,63 +82,13 @@ def search_events(filter="all"):
     else:
         return redirect(url_for("user.main", **redirect_args))
 
-# Primary ElasticSearch retrival logic
-# Gets the events depending on the search query
+# Gets the events depending on the search query, best match first
 def get_eventids_matching_search_query(query):
 
-    query = query.lower()
-
-    if USE_SIMPLE_SEARCH:
-        # Use simple search algorithm
-        list_event_ids = []
-
-        # Query the events database
-        events_data = EventDetails.query.all()
-
-        for row in events_data:
-            # Check if title matches
-            event_name = str(getattr(row, "name")).lower()
-
-            if (query in event_name):
-                logging.info("Query matched event: %s", event_name)
-                
-                # Append the IDS
-                list_event_ids.append(getattr(row, "id"))
-
-            else:
-                logging.info("Query did not match event: %s", event_name)
-
-        return list_event_ids
-
-    # Here we use elastic search if config USE_SIMPLE_SEARCH is False
-    tokens = query.split(" ")
-
-    # This block creates a list of clauses, each specifying a fuzzy matching criterion for a token in the 'tokens' list.
-    # Each clause is configured to perform a fuzzy match on the 'name' field of the Elasticsearch documents.
-    # Make a JSON query to elastic search to get the list of relevant events
-    clauses = [
-        {
-            "span_multi": {
-                "match": {"fuzzy": {"name": {"value": i, "fuzziness": "AUTO"}}}
-            }
-        }
-        for i in tokens
-    ]
-
-    # Constructing the search query parameters.
-    # This operation looks for proximity matches of the clauses with zero distance and not necessarily in order.
-    payload = {
-        "bool": {
-            "must": [{"span_near": {"clauses": clauses, "slop": 0, "in_order": False}}]
-        }
-    }
-
-    # It searches the 'events' index and retrieves a maximum of 10 matching results.
-    resp = es.search(index="events", query=payload, size=10)
-
-    ## Make a dict for relevant event details
-    list_event_ids = []
-    for result in resp["hits"]["hits"]:
-        list_event_ids.append( int(result["_source"]["id"]) )
-
-    return list_event_ids
+    query = normalize_query(query)
+
+    # Results are cached per catalog content version, so any event write invalidates them
+    cache_key = ("search", query, get_catalog_content_version())
+    return search_cache.get_or_compute(
+        cache_key, lambda: search_flight.do(cache_key, lambda: get_search_backend().search(query))
+    )
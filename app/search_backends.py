@@ -0,0 +1,314 @@
+from abc import ABC, abstractmethod
+import logging
+import os
+
+from app.main import db
+from app.database import EventDetails
+from app.globals import AUTOCOMPLETE_SIZE
+from app.search_index import EventNameIndex
+from app.ranking import BM25FIndex
+from app.autocomplete import (
+    AutocompleteTrie,
+    build_autocomplete_trie,
+    refresh_event_in_autocomplete,
+    rescore_started_events,
+)
+from app.fts import create_fts_index, get_eventids_matching_fts_query
+from app.fuzzy import FuzzyEventIndex
+from app.elastic import (
+    EVENTS_ALIAS,
+    INDEXED_COLUMNS,
+    event_to_document,
+    stream_indexed_events,
+    reindex_events,
+    apply_event_changes,
+)
+from app.cache import bump_catalog_content_version
+from app.indexer import enqueue_search_update, wake_outbox_worker, start_outbox_worker
+
+# Pluggable search backends
+# Every backend answers the search bar autocomplete and the search results page, and is
+# kept in sync by the event routes through index/delete. The routes only ever talk to the
+# active backend returned by get_search_backend, so backends can be swapped at runtime and
+# exercised offline by the same tests and benchmark
+
+# The events handed to index/bulk_index carry these columns (ORM objects work as well)
+# The long description is only used by the relevance ranking, the start time by the
+# autocomplete ranking
+SEARCH_COLUMNS = INDEXED_COLUMNS + [EventDetails.long_description, EventDetails.starts_at]
+
+# Number of results of the elasticsearch search results page
+ELASTICSEARCH_SEARCH_SIZE = 10
+
+
+class SearchBackend(ABC):
+    # The interface shared by every backend, a backend missing one of the abstract methods
+    # fails when it is created
+    name = None
+
+    # True when index/delete are applied by the search outbox worker after the commit
+    # (see app/indexer.py) instead of inline by the event routes
+    asynchronous = False
+
+    @abstractmethod
+    def index(self, event):
+        # Add or replace a single event
+        raise NotImplementedError
+
+    @abstractmethod
+    def bulk_index(self, events):
+        # Replace the whole content of the backend with the given events
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, event_id):
+        # Remove an event, deleting an unknown event is not an error
+        raise NotImplementedError
+
+    @abstractmethod
+    def autocomplete(self, query, size=AUTOCOMPLETE_SIZE):
+        # Returns up to size [event name, event id] pairs, best suggestion first
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, query, size=None):
+        # Returns the ids of the matching events, best match first
+        raise NotImplementedError
+
+    def update_ranking(self, event_id):
+        # Called when something that is not indexed but may affect the ranking changed,
+        # e.g. the registrations of the event
+        pass
+
+    def rescore(self):
+        # Called before every autocomplete lookup to bring time dependent scores up to date
+        pass
+
+    def apply_changes(self, changes):
+        # Sync the given events ({event_id: operation}) from the database
+        # Returns the set of event ids that could not be applied
+        rows = db.session.query(*SEARCH_COLUMNS).filter(EventDetails.id.in_(list(changes))).all()
+        existing = {row.id: row for row in rows}
+        for event_id in changes:
+            if event_id in existing:
+                self.index(existing[event_id])
+            else:
+                self.delete(event_id)
+        return set()
+
+
+class TrieAutocompleteBackend(SearchBackend):
+    # Suggestions come from an in-process autocomplete trie ranked by popularity
+    def __init__(self):
+        self.trie = AutocompleteTrie()
+
+    def index(self, event):
+        refresh_event_in_autocomplete(self.trie, event.id)
+
+    def bulk_index(self, events):
+        build_autocomplete_trie(self.trie, events)
+
+    def delete(self, event_id):
+        self.trie.remove(event_id)
+
+    def autocomplete(self, query, size=AUTOCOMPLETE_SIZE):
+        return self.trie.complete(query)[:size]
+
+    def update_ranking(self, event_id):
+        refresh_event_in_autocomplete(self.trie, event_id)
+
+    def rescore(self):
+        rescore_started_events(self.trie)
+
+
+class SimpleSearchBackend(TrieAutocompleteBackend):
+    # In-process search: events matching every query word (in any searchable field) ranked
+    # by BM25, followed by the remaining events whose name contains the query as a substring
+    name = "simple"
+
+    def __init__(self):
+        super().__init__()
+        self.name_index = EventNameIndex()
+        self.ranking = BM25FIndex()
+
+    def index(self, event):
+        self.name_index.add(event.id, event.name)
+        self.ranking.add(event)
+        super().index(event)
+
+    def bulk_index(self, events):
+        events = list(events)
+        self.name_index.build((event.id, event.name) for event in events)
+        self.ranking.build(events)
+        super().bulk_index(events)
+
+    def delete(self, event_id):
+        self.name_index.remove(event_id)
+        self.ranking.remove(event_id)
+        super().delete(event_id)
+
+    def search(self, query, size=None):
+        ranked = self.ranking.search(query, limit=size)
+        if size is not None and len(ranked) == size:
+            return ranked
+
+        # Partial words ("hack" in "Hackathon Night") only match through the name index
+        seen = set(ranked)
+        substring_matches = [event_id for event_id in self.name_index.lookup(query) if event_id not in seen]
+        return (ranked + substring_matches)[:size]
+
+
+class FTSSearchBackend(TrieAutocompleteBackend):
+    # Ranked full text search using an SQLite FTS5 table
+    # The table is an external content table kept in sync with event_details by triggers,
+    # so only the autocomplete trie has to be maintained here
+    name = "fts"
+
+    def bulk_index(self, events):
+        create_fts_index()
+        super().bulk_index(events)
+
+    def search(self, query, size=None):
+        return get_eventids_matching_fts_query(query, limit=size)
+
+
+class InMemorySearchBackend(SearchBackend):
+    # Typo tolerant search on the event names that emulates the elasticsearch span query,
+    # without any external service
+    name = "fuzzy"
+
+    def __init__(self):
+        self.fuzzy_index = FuzzyEventIndex()
+
+    def index(self, event):
+        self.fuzzy_index.add(event.id, event.name)
+
+    def bulk_index(self, events):
+        self.fuzzy_index.build((event.id, event.name) for event in events)
+
+    def delete(self, event_id):
+        self.fuzzy_index.remove(event_id)
+
+    def autocomplete(self, query, size=AUTOCOMPLETE_SIZE):
+        return self.fuzzy_index.search(query, limit=size)
+
+    def search(self, query, size=None):
+        return [event_id for _, event_id in self.fuzzy_index.search(query, limit=size)]
+
+
+class ElasticsearchBackend(SearchBackend):
+    # Fuzzy search on the event names using an elasticsearch cluster
+    # The routes only write to the search outbox, the outbox worker applies the changes
+    name = "elasticsearch"
+    asynchronous = True
+
+    def __init__(self, es=None):
+        if es is None:
+            from app.main import create_elasticsearch
+            es = create_elasticsearch(os.environ["ELASTICSEARCH_HOST"])
+        self.es = es
+
+    def index(self, event):
+        self.es.index(index=EVENTS_ALIAS, id=str(event.id), document=event_to_document(event))
+
+    def bulk_index(self, events):
+        reindex_events(self.es, events)
+
+    def delete(self, event_id):
+        self.es.options(ignore_status=404).delete(index=EVENTS_ALIAS, id=str(event_id))
+
+    def autocomplete(self, query, size=AUTOCOMPLETE_SIZE):
+        resp = self.es.search(index=EVENTS_ALIAS, query=self._span_query(query), size=size)
+
+        # Return a list of event name and id ordered by the most relevant on top
+        return [
+            [result["_source"]["name"], int(result["_source"]["id"])]
+            for result in resp["hits"]["hits"]
+        ]
+
+    def search(self, query, size=None):
+        resp = self.es.search(
+            index=EVENTS_ALIAS, query=self._span_query(query), size=size or ELASTICSEARCH_SEARCH_SIZE
+        )
+        return [int(result["_source"]["id"]) for result in resp["hits"]["hits"]]
+
+    def apply_changes(self, changes):
+        # A single bulk request for the whole batch
+        return apply_event_changes(self.es, changes)
+
+    def _span_query(self, query):
+        # Every token has to fuzzily match (fuzziness "AUTO") a term of the event name,
+        # the matches have to be adjacent (slop 0) but can be in any order
+        clauses = [
+            {
+                "span_multi": {
+                    "match": {"fuzzy": {"name": {"value": token, "fuzziness": "AUTO"}}}
+                }
+            }
+            for token in query.split(" ")
+        ]
+        return {
+            "bool": {
+                "must": [{"span_near": {"clauses": clauses, "slop": 0, "in_order": False}}]
+            }
+        }
+
+
+# The backends that can be selected with SEARCH_BACKEND, by name
+SEARCH_BACKENDS = {
+    backend.name: backend
+    for backend in [SimpleSearchBackend, FTSSearchBackend, InMemorySearchBackend, ElasticsearchBackend]
+}
+
+# Backend used by the routes of this process, set by use_search_backend
+_search_backend = None
+
+
+def get_search_backend():
+    return _search_backend
+
+
+def create_search_backend(name, **options):
+    # Create the backend and fill it from the events database
+    if name not in SEARCH_BACKENDS:
+        raise ValueError(f"Unknown search backend {name!r}, expected one of {sorted(SEARCH_BACKENDS)}")
+    backend = SEARCH_BACKENDS[name](**options)
+    backend.bulk_index(stream_indexed_events(columns=SEARCH_COLUMNS))
+    return backend
+
+
+def use_search_backend(name, app=None, **options):
+    # Switch the routes of this process over to a freshly built backend
+    # Needs an app context. The outbox worker is started the first time an asynchronous
+    # backend is selected
+    global _search_backend
+    backend = create_search_backend(name, **options)
+    _search_backend = backend
+    if backend.asynchronous and app is not None:
+        start_outbox_worker(app, lambda changes: get_search_backend().apply_changes(changes))
+
+    # Results cached from the previous backend must not be served anymore
+    bump_catalog_content_version()
+    logging.info("Using the %s search backend", backend.name)
+    return backend
+
+
+def stage_search_change(event_id, operation):
+    # Called by the event routes before committing an event write, so that an outbox row
+    # is committed together with the event when the backend is updated asynchronously
+    if _search_backend.asynchronous:
+        enqueue_search_update(event_id, operation)
+
+
+def publish_search_change(event_id, event=None):
+    # Called by the event routes after the commit, event is None if the event was deleted
+    if _search_backend.asynchronous:
+        wake_outbox_worker()
+    elif event is None:
+        _search_backend.delete(event_id)
+    else:
+        _search_backend.index(event)
+
+    # Only bump once the backend was updated, so that a concurrent search can't cache
+    # stale results under the new version
+    bump_catalog_content_version()
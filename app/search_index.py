@@ -0,0 +1,107 @@
+import logging
+import threading
+
+# Character n-gram inverted index over event names
+# Used by the simple search path so that autocomplete and the search results page can
+# answer substring lookups without loading the whole events table on every keystroke
+
+NGRAM_SIZE = 3
+
+# Names are padded so that every substring shorter than NGRAM_SIZE is still contained
+# in at least one indexed gram
+PAD = "\x00"
+
+
+def _ngrams(text):
+    padded = PAD + text + PAD
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+class EventNameIndex:
+    def __init__(self):
+        # event_id -> (original name, lowercased name)
+        self.names = {}
+        # n-gram -> set of event_ids whose name contains the n-gram
+        self.postings = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def build(self, events):
+        # Build the index from (event_id, name) pairs, replacing any existing content
+        with self.lock:
+            self.names = {}
+            self.postings = {}
+            for event_id, name in events:
+                self._add(event_id, name)
+        logging.info("Built the event name index with %d events", len(self.names))
+
+    def add(self, event_id, name):
+        with self.lock:
+            self._remove(event_id)
+            self._add(event_id, name)
+
+    def remove(self, event_id):
+        with self.lock:
+            self._remove(event_id)
+
+    def lookup(self, query):
+        # Returns the sorted list of event ids whose name contains the query (case insensitive)
+        with self.lock:
+            return self._lookup(query)
+
+    def lookup_names(self, query):
+        # Same as lookup but returns [name, event_id] pairs for the autocomplete drop down
+        with self.lock:
+            return [[self.names[event_id][0], event_id] for event_id in self._lookup(query)]
+
+    def _lookup(self, query):
+        query = query.lower()
+        if query == "":
+            return []
+
+        if len(query) >= NGRAM_SIZE:
+            # Intersect the postings of every gram in the query, starting with the rarest one
+            grams = [query[i:i + NGRAM_SIZE] for i in range(len(query) - NGRAM_SIZE + 1)]
+            postings = []
+            for gram in set(grams):
+                if gram not in self.postings:
+                    return []
+                postings.append(self.postings[gram])
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates &= posting
+        else:
+            # Short queries are looked up through every indexed gram that contains them
+            candidates = set()
+            for gram, posting in self.postings.items():
+                if query in gram:
+                    candidates |= posting
+
+        # Grams only tell us the query *might* occur in the name, so verify each candidate
+        return sorted(
+            event_id for event_id in candidates
+            if query in self.names[event_id][1]
+        )
+
+    def _add(self, event_id, name):
+        if name is None:
+            return
+        lowered = name.lower()
+        self.names[event_id] = (name, lowered)
+        for gram in _ngrams(lowered):
+            self.postings.setdefault(gram, set()).add(event_id)
+
+    def _remove(self, event_id):
+        if event_id not in self.names:
+            return
+        _, lowered = self.names.pop(event_id)
+        for gram in _ngrams(lowered):
+            posting = self.postings.get(gram)
+            if posting is None:
+                continue
+            posting.discard(event_id)
+            if not posting:
+                del self.postings[gram]
@@ -1,7 +1,11 @@
 document.addEventListener('DOMContentLoaded', function() {
-    var eventData = JSON.parse(event_data_json.innerText);
-        console.log(eventData);
     var calendarEl = document.getElementById('calendar');
+    // Only the events of the visible dates are fetched, FullCalendar adds the start and end
+    // of the range to the request whenever the user moves to other dates
+    var feedParams = {filter: calendarEl.dataset.filter};
+    if (calendarEl.dataset.search) {
+        feedParams.search = calendarEl.dataset.search;
+    }
     var calendar = new FullCalendar.Calendar(calendarEl, {
         initialView: 'dayGridMonth',  // Default view is set to list
 
@@ -31,7 +35,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 window.location.href = `/events/${eventKey}` ;
             },
 
-        events: eventData,
+        events: {
+            url: calendarEl.dataset.url,
+            extraParams: feedParams,
+            failure: function(error) {
+                console.log(error.message);
+            }
+        },
         
     });
 
@@ -0,0 +1,51 @@
+// Infinite scroll for the event listings
+// The page renders the first page of cards and a sentinel element after them that holds the
+// endpoint and the cursor of the next page. Whenever the sentinel scrolls into view the next
+// page is fetched and its cards are appended, until the endpoint returns no cursor.
+document.addEventListener('DOMContentLoaded', function() {
+    var sentinel = document.getElementById('load-more');
+    if (!sentinel) {
+        return;
+    }
+    var cards = document.getElementById(sentinel.dataset.target);
+    var loading = false;
+
+    function loadNextPage() {
+        var cursor = sentinel.dataset.cursor;
+        if (loading || !cursor) {
+            return;
+        }
+        loading = true;
+        var params = new URLSearchParams({filter: sentinel.dataset.filter, cursor: cursor});
+        if (sentinel.dataset.search) {
+            params.set('search', sentinel.dataset.search);
+        }
+        fetch(`${sentinel.dataset.url}?${params}`)
+            .then((resp) => {
+                if (!resp.ok) {
+                    throw new Error(`Loading the next events failed with status ${resp.status}`);
+                }
+                return resp.json();
+            })
+            .then((page) => {
+                cards.insertAdjacentHTML('beforeend', page.html);
+                if (page.next_cursor) {
+                    sentinel.dataset.cursor = page.next_cursor;
+                } else {
+                    // Last page
+                    observer.disconnect();
+                    sentinel.remove();
+                }
+            })
+            .catch((error) => console.log(error.message))
+            .finally(() => { loading = false; });
+    }
+
+    // Start loading a little before the end of the list is reached
+    var observer = new IntersectionObserver(function(entries) {
+        if (entries.some((entry) => entry.isIntersecting)) {
+            loadNextPage();
+        }
+    }, {rootMargin: '600px'});
+    observer.observe(sentinel);
+});
@@ -1,16 +1,20 @@
-from flask import Blueprint, render_template, abort, session, redirect, url_for
+from flask import Blueprint, render_template, abort, session, redirect, url_for, request, jsonify
 from sqlalchemy import distinct
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import logging
+import zlib
 
-from app.globals import FILTERS, EVENT_CATEGORIES
+from app.globals import FILTERS, CATEGORY_COLORS
 from app.auth import login_required, user_required
 from app.database import EventDetails, Credentials
 from app.search import get_eventids_matching_search_query
-from app.filter import filter_for_today_events, filter_for_inperson_events, filter_for_free_events, filter_events_on_category, filter_events_on_event_ids_list, filter_for_past_events
+from app.filter import is_valid_filter_tag, active_filter_tags
+from app.bitmap import Bitmap, event_bitmaps
+from app.columnar import new_event_filter
+from app.pagination import get_events_page
+from app.projections import EventCalendarEntry
+from app.conditional import conditional_page
 from app.main import db
-import json
-import random
 
 user = Blueprint("user", __name__)
 
@@ -20,33 +24,14 @@ user = Blueprint("user", __name__)
 @user.route("/user/<filter>/<search>", methods=["GET"])
 @login_required
 @user_required
+@conditional_page(session_defaults={"toggle_value": False}, time_dependent=lambda **kwargs: True)
 def main(filter="all", search=None):
-    dict_of_events_details = get_all_events_from_database()
-
-    # Filter the events list based on the search query
-    if search != None:
-        list_event_ids = get_eventids_matching_search_query(query=search)
-        dict_of_events_details = filter_events_on_event_ids_list(events=dict_of_events_details, event_ids=list_event_ids)
-
-    # Filter the events list based on the filter tags
-    if filter == "in-person":
-        dict_of_events_details = filter_for_inperson_events(events=dict_of_events_details)
-    elif filter == "free":
-        dict_of_events_details = filter_for_free_events(events=dict_of_events_details)
-    elif filter == "today":
-        dict_of_events_details = filter_for_today_events(events=dict_of_events_details)
-    elif filter == "past events":
-        dict_of_events_details =  filter_for_past_events(events=dict_of_events_details)
-    elif filter != "all":
-        if filter.capitalize() not in EVENT_CATEGORIES:
-            abort(404, description = {
-                "type": "invalid_filter",
-                "caller": "user.main",
-                "message": f"Invalid filter category {filter}"
-            })
-        dict_of_events_details = filter_events_on_category(events=dict_of_events_details, category=filter)
-
-    event_data_json = convert_dictionary_to_JSON(dict_of_events_details)
+    if not is_valid_filter_tag(filter):
+        abort(404, description = {
+            "type": "invalid_filter",
+            "caller": "user.main",
+            "message": f"Invalid filter category {filter}"
+        })
 
     # NOTE: False - Card view and True - Calendar view
     # Default is set to Card view
@@ -56,8 +41,81 @@ def main(filter="all", search=None):
     toggle = session.get('toggle_value', False)
     session['toggle_value'] = toggle
 
-    return render_template("user_main.html", event_data=dict_of_events_details, event_data_json=event_data_json, 
-                           search=search, filter=filter, filter_tags=FILTERS, toggle=toggle)
+    # Only the active view is rendered
+    if toggle:
+        # The calendar fetches the events of the visible dates from user.calendar_events
+        return render_template("user_main.html", events=[], next_cursor=None,
+                               search=search, filter=filter, filter_tags=FILTERS, toggle=toggle,
+                               active_tags=active_filter_tags(filter), filter_counts=get_filter_tag_counts(filter, search))
+
+    # The card view starts with the first page, the next ones are fetched from user.events_page while scrolling
+    events, next_cursor = get_events_page(lambda: new_event_filter().filter_tag(filter), search)
+
+    return render_template("user_main.html", events=events,
+                           next_cursor=next_cursor, search=search, filter=filter, filter_tags=FILTERS, toggle=toggle,
+                           active_tags=active_filter_tags(filter), filter_counts=get_filter_tag_counts(filter, search))
+
+
+# Returns the cards of the next page of the card view and the cursor of the page after it
+@user.route("/user/page", methods=["GET"])
+@login_required
+@user_required
+def events_page():
+    filter = request.args.get("filter", "all")
+    if not is_valid_filter_tag(filter):
+        abort(404, description = {
+            "type": "invalid_filter",
+            "caller": "user.events_page",
+            "message": f"Invalid filter category {filter}"
+        })
+
+    try:
+        events, next_cursor = get_events_page(lambda: new_event_filter().filter_tag(filter),
+                                              request.args.get("search"), request.args.get("cursor"))
+    except ValueError:
+        abort(404, description = {
+            "type": "invalid_cursor",
+            "caller": "user.events_page",
+            "message": "Invalid page cursor"
+        })
+
+    html = render_template("event_cards.html", events=events)
+    return {"html": html, "next_cursor": next_cursor}
+
+# Returns the events of the calendar view taking place between the start and end dates
+# Called by FullCalendar (static/js/calendar.js) with the visible range, as ISO dates or datetimes
+@user.route("/user/calendar/events", methods=["GET"])
+@login_required
+@user_required
+def calendar_events():
+    filter = request.args.get("filter", "all")
+    if not is_valid_filter_tag(filter):
+        abort(404, description = {
+            "type": "invalid_filter",
+            "caller": "user.calendar_events",
+            "message": f"Invalid filter category {filter}"
+        })
+    try:
+        # Only the date matters, the calendar shows whole days
+        start = date.fromisoformat(request.args["start"][:10])
+        end = date.fromisoformat(request.args["end"][:10])
+    except (KeyError, ValueError):
+        abort(404, description = {
+            "type": "invalid_date_range",
+            "caller": "user.calendar_events",
+            "message": "Invalid calendar date range"
+        })
+
+    events_filter = new_event_filter().filter_tag(filter).overlapping(start, end)
+    search = request.args.get("search")
+    if search != None:
+        events_filter.in_events(get_eventids_matching_search_query(query=search))
+
+    # The response only depends on the catalog, the browser revalidates it with the ETag
+    response = jsonify([convert_event_to_JSON(event) for event in events_filter.all(EventCalendarEntry)])
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
 
 # This function is used to change the 'toggle_value' value in the session
 # while preserving the current filter and search parameters
@@ -70,52 +128,39 @@ def toggle(filter="all", search=None):
     return redirect(url_for('user.main', filter=filter, search=search))
 
 # Helper functions for the users main functionalities
-def get_all_events_from_database():
-    events_data = EventDetails.query.all()
-
-    # Make a dict for event details
-    dict_of_events_details = {}
-    for row in events_data:
-        event_detail = {}
-
-        # TODO: Ideally we should only be passing information that is required by the user_main.html
-        for column in row.__table__.columns:
-            event_detail[column.name] = str(getattr(row, column.name))
-
-        dict_of_events_details[row.id] = event_detail
-
-    return dict_of_events_details
-
-def convert_dictionary_to_JSON(events):
-    event_list = []
-    colors = ['#dc3545', '#007bff', '#28a745', '#ffc107', '#17a2b8']
-    #right now set to random initialisation, we will modify this to colour dependent on events
-
-    for event_id, event_data in events.items():
-        name = event_data['name']
-        start_date = event_data['start_date']
-        end_date = event_data['end_date']
-        start_time = event_data['start_time']
-        end_time = event_data['end_time']
-        
-        background_color = random.choice(colors)
-        border_color = background_color
-    
-        event_info = {
-            'key' : event_id,
-            'title': name,
-            'start': f'{start_date}T{start_time}',
-            'end': f'{end_date}T{end_time}',
-            'backgroundColor': background_color,
-            'borderColor': border_color
-        }
-        
-        event_list.append(event_info)
-
-    event_data_json = json.dumps(event_list)
-
-    logging.info(event_data_json)
-    return event_data_json
+def get_filter_tag_counts(filter, search=None):
+    # Number of events the listing would show with each filter tag added to the current filter
+    events = event_bitmaps.evaluate(filter)
+    if search != None:
+        events = events & Bitmap.from_ids(get_eventids_matching_search_query(query=search))
+    return event_bitmaps.facet_counts(events, [tag.lower() for tag in FILTERS])
+
+def get_category_color(category):
+    # Every category always gets the same color
+    category = (category or "").capitalize()
+    if category in CATEGORY_COLORS:
+        return CATEGORY_COLORS[category]
+    palette = list(CATEGORY_COLORS.values())
+    return palette[zlib.crc32(category.encode()) % len(palette)]
+
+def convert_event_to_JSON(event):
+    # A FullCalendar event, events without a start time last whole days
+    start = event.start_date.isoformat()
+    if event.start_time:
+        start += f"T{event.start_time.isoformat()}"
+    event_info = {
+        'key': event.id,
+        'title': event.name,
+        'start': start,
+        'backgroundColor': get_category_color(event.category),
+        'borderColor': get_category_color(event.category),
+    }
+    if event.end_date and event.end_time:
+        event_info['end'] = f"{event.end_date.isoformat()}T{event.end_time.isoformat()}"
+    elif event.end_date:
+        # The end of whole day events is exclusive
+        event_info['end'] = (event.end_date + timedelta(days=1)).isoformat()
+    return event_info
 
 
 # Function for users to view a list of all organizers with upcoming and/or past events
@@ -143,6 +188,7 @@ def get_active_organizers():
 @user.route("/user/organizers/<organizer_username>", methods=["GET"])
 @login_required
 @user_required
+@conditional_page(time_dependent=lambda **kwargs: True)
 def view_organizer(organizer_username):
     logging.info("Loading webpage for Organizer: %s", organizer_username)
 
@@ -156,23 +202,12 @@ def view_organizer(organizer_username):
 
 # Get the upcoming events for an organizer
 def get_organizer_upcoming_events(organizer_username):
-    # Get the current date and time to filter for upcoming events
-    current_date = datetime.now().date()
-    current_time = datetime.now().time()
-
     # Querying events where the organizer is the specified username and the event is yet to start (upcoming)
+    # A range scan of the (organizer, starts_at) index
     upcoming_events = (
         EventDetails.query
         .filter_by(organizer=organizer_username)
-        .filter(
-            db.or_(
-                EventDetails.start_date > current_date,
-                db.and_(
-                    EventDetails.start_date == current_date,
-                    EventDetails.start_time > current_time
-                )
-            )
-        )
+        .filter(EventDetails.starts_at >= datetime.now())
         .all()
     )
 
@@ -180,23 +215,11 @@ def get_organizer_upcoming_events(organizer_username):
 
 # Get the past events for an organizer
 def get_organizer_past_events(organizer_username):
-    # Get the current date and time to filter for past events
-    current_date = datetime.now().date()
-    current_time = datetime.now().time()
-
     # Querying events where the organizer is the specified username and the event has already started (past)
     past_events = (
         EventDetails.query
         .filter_by(organizer=organizer_username)
-        .filter(
-            db.or_(
-                EventDetails.start_date < current_date,
-                db.and_(
-                    EventDetails.start_date == current_date,
-                    EventDetails.start_time < current_time
-                )
-            )
-        )
+        .filter(EventDetails.starts_at < datetime.now())
         .all()
     )
 
@@ -2,15 +2,18 @@ from flask import (
     Blueprint,
     render_template,
     abort,
+    request,
 )
 from flask_login import login_required, current_user
 
 from app.main import db
-from app.globals import FILTERS, EVENT_CATEGORIES
+from app.globals import FILTERS
 from app.auth import login_required, user_required
 from app.database import EventRegistration, EventDetails
-from app.search import get_eventids_matching_search_query
-from app.filter import filter_for_today_events, filter_for_inperson_events, filter_for_free_events, filter_events_on_category, filter_events_on_event_ids_list, filter_for_past_events
+from app.filter import EventFilterBuilder, is_valid_filter_tag, active_filter_tags
+from app.pagination import get_events_page
+from app.projections import EventCard
+from app.conditional import conditional_page
 
 user_events = Blueprint("user_events", __name__)
 
@@ -19,52 +22,57 @@ user_events = Blueprint("user_events", __name__)
 @user_events.route("/myevents/<filter>/<search>", methods=["GET"])
 @login_required
 @user_required
+@conditional_page(time_dependent=lambda **kwargs: True)
 def main(filter="all", search=None):
-    dict_of_events_details = get_users_events_from_database()
+    if not is_valid_filter_tag(filter):
+        abort(404, description = {
+            "type": "invalid_filter",
+            "caller": "user_events.main",
+            "message": f"Invalid filter category {filter}"
+        })
 
-    # Filter the events list based on the search query
-    if search != None:
-        list_event_ids = get_eventids_matching_search_query(query=search)
-        dict_of_events_details = filter_events_on_event_ids_list(events=dict_of_events_details, event_ids=list_event_ids)
+    # Only the first page is rendered, the next ones are fetched from user_events.events_page while scrolling
+    events, next_cursor = get_events_page(lambda: get_users_events_filter().filter_tag(filter), search)
 
-    # Filter the events list based on the filter tags
-    if filter == "in-person":
-        dict_of_events_details = filter_for_inperson_events(events=dict_of_events_details)
-    elif filter == "free":
-        dict_of_events_details = filter_for_free_events(events=dict_of_events_details)
-    elif filter == "today":
-        dict_of_events_details = filter_for_today_events(events=dict_of_events_details)
-    elif filter == "past events":
-        dict_of_events_details =  filter_for_past_events(events=dict_of_events_details)
-    elif filter != "all":
-        if filter.capitalize() not in EVENT_CATEGORIES:
-            abort(404, description = {
-                "type": "invalid_filter",
-                "caller": "user.main",
-                "message": f"Invalid filter category {filter}"
-            })
-        dict_of_events_details = filter_events_on_category(events=dict_of_events_details, category=filter)
+    return render_template("user_events.html", events=events, next_cursor=next_cursor,
+                           search=search, filter=filter, filter_tags=FILTERS, active_tags=active_filter_tags(filter))
 
-    return render_template("user_events.html", event_data=dict_of_events_details, search=search, filter=filter, filter_tags=FILTERS)
 
+# Returns the cards of the next page of my events and the cursor of the page after it
+@user_events.route("/myevents/page", methods=["GET"])
+@login_required
+@user_required
+def events_page():
+    filter = request.args.get("filter", "all")
+    if not is_valid_filter_tag(filter):
+        abort(404, description = {
+            "type": "invalid_filter",
+            "caller": "user_events.events_page",
+            "message": f"Invalid filter category {filter}"
+        })
+
+    try:
+        events, next_cursor = get_events_page(lambda: get_users_events_filter().filter_tag(filter),
+                                              request.args.get("search"), request.args.get("cursor"))
+    except ValueError:
+        abort(404, description = {
+            "type": "invalid_cursor",
+            "caller": "user_events.events_page",
+            "message": "Invalid page cursor"
+        })
+
+    html = render_template("event_cards.html", events=events)
+    return {"html": html, "next_cursor": next_cursor}
 
-def get_users_events_from_database():
+
+def get_users_events_filter():
     #Query below gets the list of events that the current user has registered for
-    events_data = (
+    return EventFilterBuilder(
         db.session.query(EventDetails)
         .join(EventRegistration)
         .filter(EventRegistration.attendee_username == current_user.username)
     )
 
-    ## Make a dict for event details
-    dict_of_events_details = {}
-    for row in events_data:
-        event_detail = {}
-
-        ## TODO: Ideally we should only be passing information that is required by the user_events.html
-        for column in row.__table__.columns:
-            event_detail[column.name] = str(getattr(row, column.name))
-
-        dict_of_events_details[row.id] = event_detail
 
-    return dict_of_events_details
\ No newline at end of file
+def get_users_events_from_database(events_filter=None):
+    return (events_filter or get_users_events_filter()).all(EventCard)
\ No newline at end of file
@@ -0,0 +1,67 @@
+# Benchmark combining filter tags and counting facets with the event bitmap index
+# Run from the repository root with: python -m benchmarks.bitmap_bench
+import random
+import time
+import timeit
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from app.bitmap import EventBitmapIndex
+
+NUM_EVENTS = 100_000
+NUM_TAGS = 50
+REPEAT = 50
+
+CATEGORIES = ["academic", "hobbies", "music", "nightlife", "business"]
+FILTER_TAGS = ["in-person", "today", "free", *CATEGORIES, "past events"]
+TODAY = date(2030, 6, 1)
+NOW = datetime(2030, 6, 1, 12, 0)
+
+EXPRESSIONS = [
+    "free",
+    "free+in-person+music+today",
+    "music,nightlife+-free",
+    "tag 7+tag 12,tag 13",
+    "in-person+-past events",
+]
+
+Event = namedtuple("Event", ["id", "start_date", "start_time", "is_online", "ticket_price", "category"])
+
+
+def make_events(rng):
+    events, tags_of = [], {}
+    for event_id in range(1, NUM_EVENTS + 1):
+        events.append(Event(
+            event_id,
+            TODAY + timedelta(days=rng.randint(-180, 180)),
+            datetime.min.replace(hour=rng.randint(8, 22)).time(),
+            rng.randint(0, 1),
+            rng.choice([0.0, 0.0, 5.0, 20.0]),
+            rng.choice(CATEGORIES),
+        ))
+        # Tag popularity is skewed, a few tags are on many events
+        tags_of[event_id] = [f"Tag {int(rng.paretovariate(1.2)) % NUM_TAGS}" for _ in range(rng.randint(0, 3))]
+    return events, tags_of
+
+
+def main():
+    events, tags_of = make_events(random.Random(0))
+    index = EventBitmapIndex()
+    start = time.perf_counter()
+    index.build(events, tags_of)
+    print(f"Built the bitmap index of {NUM_EVENTS} events in {time.perf_counter() - start:.1f}s")
+
+    update = min(timeit.repeat(lambda: index.upsert(events[0], tags_of[1]), number=1, repeat=REPEAT)) * 1e6
+    print(f"Updating one event takes {update:.0f} us")
+
+    print(f"{'expression':>30} {'matches':>8} {'evaluate (us)':>14} {'facet counts (us)':>18}")
+    for expression in EXPRESSIONS:
+        matches = index.evaluate(expression, now=NOW)
+        evaluate = min(timeit.repeat(lambda: index.evaluate(expression, now=NOW), number=1, repeat=REPEAT)) * 1e6
+        facets = min(timeit.repeat(
+            lambda: index.facet_counts(matches, FILTER_TAGS, now=NOW), number=1, repeat=REPEAT)) * 1e6
+        print(f"{expression:>30} {len(matches):>8} {evaluate:>14.0f} {facets:>18.0f}")
+
+
+if __name__ == "__main__":
+    main()
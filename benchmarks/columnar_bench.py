@@ -0,0 +1,123 @@
+# Benchmark the event listing filters: the columnar snapshot (app/columnar.py) against the SQL
+# filter builder (app/filter.py) and the dict comprehensions the listing pages used before it
+# Run from the repository root with: python -m benchmarks.columnar_bench
+import random
+import time
+import timeit
+from datetime import date, datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import insert
+
+from app.main import db
+from app.database import EventDetails
+from app.filter import EventFilterBuilder
+from app.columnar import EventColumns, ColumnarEventFilter, SNAPSHOT_COLUMNS
+from app.projections import EventCard
+from app.migrations import backfill_event_times
+
+NUM_EVENTS = 100_000
+REPEAT = 5
+
+CATEGORIES = ["academic", "hobbies", "music", "nightlife", "business"]
+TODAY = date(2030, 6, 1)
+NOW = datetime(2030, 6, 1, 12, 0)
+
+# Filter chains of the listing pages
+CHAINS = {
+    "free": lambda f: f.free(),
+    "in-person + music": lambda f: f.in_person().category("music"),
+    "today + free": lambda f: f.today(TODAY).free(),
+    "past events": lambda f: f.past(NOW),
+}
+
+
+def make_bench_app():
+    bench_app = Flask(__name__)
+    bench_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(bench_app)
+    return bench_app
+
+
+def populate(num_events):
+    rng = random.Random(num_events)
+    db.session.execute(
+        insert(EventDetails),
+        [
+            {
+                "name": f"Event {number}",
+                "category": rng.choice(CATEGORIES),
+                "organizer": f"organizer_{rng.randint(1, 500)}",
+                "is_online": rng.randint(0, 1),
+                "ticket_price": rng.choice([0.0, 0.0, 5.0, 20.0]),
+                "start_date": TODAY + timedelta(days=rng.randint(-180, 180)),
+                "start_time": datetime.min.replace(hour=rng.randint(8, 22)).time(),
+            }
+            for number in range(num_events)
+        ],
+    )
+    db.session.commit()
+    # The bulk insert bypasses the ORM, which fills starts_at/ends_at
+    backfill_event_times()
+
+
+# The dict comprehensions used by the listing pages before the SQL filter builder,
+# over the dicts of strings they worked on
+def dict_chain(name, events):
+    if name == "free":
+        return {key: event for key, event in events.items() if float(event["ticket_price"]) == 0.0}
+    if name == "in-person + music":
+        events = {key: event for key, event in events.items() if not int(event["is_online"])}
+        return {key: event for key, event in events.items() if event["category"] == "music"}
+    if name == "today + free":
+        events = {key: event for key, event in events.items() if event["start_date"] == TODAY.strftime("%Y-%m-%d")}
+        return {key: event for key, event in events.items() if float(event["ticket_price"]) == 0.0}
+    today, now = TODAY.strftime("%Y-%m-%d"), NOW.strftime("%H:%M:%S")
+    return {
+        key: event for key, event in events.items()
+        if event["start_date"] < today or (event["start_date"] == today and event["start_time"] < now)
+    }
+
+
+def best(function):
+    return min(timeit.repeat(function, number=1, repeat=REPEAT)) * 1000
+
+
+def main():
+    bench_app = make_bench_app()
+    with bench_app.app_context():
+        db.create_all()
+        populate(NUM_EVENTS)
+
+        dicts = {
+            row.id: {column.name: str(getattr(row, column.name)) for column in row.__table__.columns}
+            for row in EventDetails.query.all()
+        }
+        db.session.expunge_all()
+
+        columns = EventColumns()
+        start = time.perf_counter()
+        columns.build(EventDetails.query.with_entities(*SNAPSHOT_COLUMNS))
+        print(f"Built the columnar snapshot of {NUM_EVENTS} events in {time.perf_counter() - start:.1f}s")
+        event = db.session.get(EventDetails, 1)
+        print(f"Updating one event takes {best(lambda: columns.upsert(event)):.3f} ms")
+
+        print("Matching event ids (ms)")
+        print(f"{'filters':>18} {'matches':>8} {'dicts':>8} {'SQL':>8} {'columnar':>9}")
+        for name, chain in CHAINS.items():
+            matches = len(chain(ColumnarEventFilter(columns))._matching_ids())
+            dict_ms = best(lambda: dict_chain(name, dicts))
+            sql_ms = best(lambda: chain(EventFilterBuilder()).query.with_entities(EventDetails.id).all())
+            columnar_ms = best(lambda: chain(ColumnarEventFilter(columns))._matching_ids().tolist())
+            print(f"{name:>18} {matches:>8} {dict_ms:>8.2f} {sql_ms:>8.2f} {columnar_ms:>9.2f}")
+
+        print("First page of 24 cards (ms)")
+        print(f"{'filters':>18} {'SQL':>8} {'columnar':>9}")
+        for name, chain in CHAINS.items():
+            sql_ms = best(lambda: chain(EventFilterBuilder()).listing_page(limit=24, row_type=EventCard))
+            columnar_ms = best(lambda: chain(ColumnarEventFilter(columns)).listing_page(limit=24, row_type=EventCard))
+            print(f"{name:>18} {sql_ms:>8.2f} {columnar_ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
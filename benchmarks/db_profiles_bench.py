@@ -0,0 +1,118 @@
+# Benchmark concurrent reads and registration writes against SQLite with the default and the
+# production database profiles of app/db_profiles.py
+# Every profile gets a fresh database file, the threads stand in for the request threads of the
+# workers: the readers load listing pages while the writers register users for events
+# Run from the repository root with: python -m benchmarks.db_profiles_bench
+import tempfile
+import threading
+import time
+from datetime import date, datetime, time as time_of_day, timedelta
+from pathlib import Path
+
+from flask import Flask
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from app.main import db
+from app.database import EventDetails, EventRegistration
+from app.db_profiles import DB_PROFILES, init_database
+
+NUM_EVENTS = 5000
+NUM_READERS = 8
+NUM_WRITERS = 4
+DURATION = 5.0
+PAGE_SIZE = 24
+
+
+def create_bench_app(directory, profile):
+    bench_app = Flask(__name__)
+    bench_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{Path(directory, profile + '.db')}"
+    init_database(bench_app, db, profile)
+    with bench_app.app_context():
+        db.create_all()
+        start = date.today()
+        db.session.execute(insert(EventDetails), [
+            {
+                "name": f"Bench Event {number}",
+                "start_date": start + timedelta(days=number % 365),
+                "start_time": time_of_day(number % 24),
+                "starts_at": datetime.combine(start + timedelta(days=number % 365), time_of_day(number % 24)),
+                "max_capacity": 100,
+            }
+            for number in range(NUM_EVENTS)
+        ])
+        db.session.commit()
+    return bench_app
+
+
+def read(number):
+    # A listing page and the events of a user, as on the user and my-events pages
+    EventDetails.query.filter(EventDetails.starts_at >= datetime.now()).order_by(EventDetails.starts_at) \
+        .offset(number % 100 * PAGE_SIZE).limit(PAGE_SIZE).all()
+    EventRegistration.query.filter_by(attendee_username=f"user{number % 500}").all()
+
+
+def write(number, writer):
+    # One registration per transaction, as register_for_event does
+    db.session.add(EventRegistration(event_id=number % NUM_EVENTS + 1, attendee_username=f"user{writer}-{number}"))
+    db.session.commit()
+
+
+def run(bench_app, deadline, work, counts, latencies, errors):
+    with bench_app.app_context():
+        number = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                work(number)
+            except OperationalError:
+                # "database is locked"
+                db.session.rollback()
+                errors.append(1)
+            else:
+                latencies.append(time.perf_counter() - start)
+            number += 1
+        db.session.remove()
+    counts.append(number)
+
+
+def benchmark(bench_app):
+    deadline = time.perf_counter() + DURATION
+    read_latencies, write_latencies, read_errors, write_errors, counts = [], [], [], [], []
+    threads = [
+        threading.Thread(target=run, args=(bench_app, deadline, read, counts, read_latencies, read_errors))
+        for _ in range(NUM_READERS)
+    ] + [
+        threading.Thread(target=run, args=(
+            bench_app, deadline, lambda number, writer=writer: write(number, writer), counts, write_latencies, write_errors
+        ))
+        for writer in range(NUM_WRITERS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return read_latencies, write_latencies, len(read_errors) + len(write_errors)
+
+
+def percentile(latencies, share):
+    if not latencies:
+        return float("nan")
+    return sorted(latencies)[int(len(latencies) * share) - 1] * 1000
+
+
+def main():
+    print(f"{NUM_READERS} reader and {NUM_WRITERS} writer threads for {DURATION:.0f}s, {NUM_EVENTS} events")
+    print(f"{'profile':>12} {'reads/s':>9} {'writes/s':>9} {'read p99 ms':>12} {'write p99 ms':>13} {'locked':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in DB_PROFILES:
+            bench_app = create_bench_app(directory, profile)
+            reads, writes, errors = benchmark(bench_app)
+            with bench_app.app_context():
+                db.engine.dispose()
+            print(f"{profile:>12} {len(reads) / DURATION:>9.0f} {len(writes) / DURATION:>9.0f} "
+                  f"{percentile(reads, 0.99):>12.1f} {percentile(writes, 0.99):>13.1f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
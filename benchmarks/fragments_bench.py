@@ -0,0 +1,78 @@
+# Benchmark rendering the card grid of a listing page with and without the fragment cache of
+# app/fragments.py
+# Run from the repository root with: python -m benchmarks.fragments_bench
+import random
+import time
+from datetime import date, datetime, time as time_of_day, timedelta
+
+from flask import render_template
+
+from app.main import app
+from app.cache import card_cache, bump_event_version
+from app.fragments import CARD_TEMPLATE
+from app.projections import EventCard
+
+PAGE_SIZES = [24, 500]
+REPEAT = 20
+# Share of the cards whose event changed between two renders of the page
+CHANGED_SHARE = 0.05
+
+WORDS = [
+    "jazz", "night", "hackathon", "career", "fair", "startup", "pitch", "robotics", "club",
+    "yoga", "chess", "lecture", "research", "symposium", "film", "screening", "trivia",
+    "debate", "workshop", "python", "design", "music", "open", "mic", "networking",
+]
+
+
+def make_cards(num_cards):
+    rng = random.Random(num_cards)
+
+    def text(low, high):
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+    cards = []
+    for i in range(num_cards):
+        start_date, start_time = date(2030, 1, 1) + timedelta(days=rng.randint(0, 365)), time_of_day(rng.randint(8, 22))
+        cards.append(EventCard(
+            1_000_000 + i, text(2, 5).title(), text(4, 10), "placeholder.png",
+            start_date, start_time, datetime.combine(start_date, start_time),
+        ))
+    return cards
+
+
+def uncached(cards):
+    # Every card rendered on every request, as before the fragment cache
+    template = app.jinja_env.get_template(CARD_TEMPLATE)
+    return "".join(template.render(event=card, admin=False) for card in cards)
+
+
+def best_time(render, cards, before=lambda: None):
+    times = []
+    for _ in range(REPEAT):
+        before()
+        start = time.perf_counter()
+        render(cards)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    rng = random.Random(0)
+    with app.test_request_context():
+        print(f"{'cards':>6} {'uncached (ms)':>14} {'cold cache (ms)':>16} {'warm cache (ms)':>16} "
+              f"{f'{CHANGED_SHARE:.0%} changed (ms)':>17}")
+        for page_size in PAGE_SIZES:
+            cards = make_cards(page_size)
+            cached = lambda cards: render_template("event_cards.html", events=cards)
+            changed = lambda: [bump_event_version(card.id) for card in rng.sample(cards, int(CHANGED_SHARE * page_size))]
+            print(
+                f"{page_size:>6} {best_time(uncached, cards) * 1000:>14.2f} "
+                f"{best_time(cached, cards, card_cache.clear) * 1000:>16.2f} "
+                f"{best_time(cached, cards) * 1000:>16.2f} "
+                f"{best_time(cached, cards, changed) * 1000:>17.2f}"
+            )
+        print("Card cache:", card_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
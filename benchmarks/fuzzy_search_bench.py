@@ -0,0 +1,49 @@
+# Benchmark the typo tolerant event index on a large synthetic catalog
+# Run from the repository root with: python -m benchmarks.fuzzy_search_bench
+import random
+import time
+import timeit
+
+from app.fuzzy import FuzzyEventIndex
+
+NUM_EVENTS = 100_000
+REPEAT = 50
+
+WORDS = [
+    "jazz", "night", "hackathon", "career", "fair", "startup", "pitch", "robotics", "club",
+    "yoga", "chess", "lecture", "research", "symposium", "film", "screening", "trivia",
+    "debate", "workshop", "python", "design", "music", "open", "mic", "networking",
+]
+
+# Queries with typos, as a user would type them
+QUERIES = ["jaz", "robtoics", "hackathn nigth", "carer fair", "symposim research", "pyhton workshop", "zzzzz"]
+
+
+def make_name(rng):
+    # Mix the common words with rare ones so the vocabulary looks like a real catalog
+    words = [rng.choice(WORDS) for _ in range(rng.randint(2, 5))]
+    words.append("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9))))
+    rng.shuffle(words)
+    return " ".join(words).title()
+
+
+def main():
+    rng = random.Random(0)
+    events = [(event_id, make_name(rng)) for event_id in range(1, NUM_EVENTS + 1)]
+
+    index = FuzzyEventIndex()
+    start = time.perf_counter()
+    index.build(events)
+    print(f"Built the index for {NUM_EVENTS} events and {len(index.postings)} terms "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    print(f"{'query':>20} {'matches':>8} {'top 5 (ms)':>11} {'all (ms)':>9}")
+    for query in QUERIES:
+        matches = len(index.search(query))
+        top = min(timeit.repeat(lambda: index.search(query, limit=5), number=1, repeat=REPEAT)) * 1000
+        full = min(timeit.repeat(lambda: index.search(query), number=1, repeat=REPEAT)) * 1000
+        print(f"{query:>20} {matches:>8} {top:>11.3f} {full:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Benchmark loading an event listing as compact projected rows versus ORM objects turned into
+# dicts of strings (how the listing pages loaded their events before app/projections.py)
+# Run from the repository root with: python -m benchmarks.projections_bench
+import gc
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from flask import Flask
+from sqlalchemy import insert
+
+from app.main import db
+from app.database import EventDetails
+from app.projections import EventCard, EventCalendarEntry, project
+
+NUM_EVENTS = 50_000
+REPEAT = 3
+
+WORDS = [
+    "jazz", "night", "hackathon", "career", "fair", "startup", "pitch", "robotics", "club",
+    "yoga", "chess", "lecture", "research", "symposium", "film", "screening", "trivia",
+    "debate", "workshop", "python", "design", "music", "open", "mic", "networking",
+]
+
+
+def make_bench_app():
+    bench_app = Flask(__name__)
+    bench_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(bench_app)
+    return bench_app
+
+
+def populate(num_events):
+    rng = random.Random(num_events)
+
+    def text(low, high):
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+    first_day = date(2030, 1, 1)
+    db.session.execute(
+        insert(EventDetails),
+        [
+            {
+                "name": text(2, 5).title(),
+                "short_description": text(4, 10),
+                "long_description": text(80, 150),
+                "additional_info": text(40, 80),
+                "category": rng.choice(["Academic", "Hobbies", "Music", "Nightlife", "Business"]),
+                "image": "placeholder.png",
+                "venue": "Hart House",
+                "start_date": first_day + timedelta(days=rng.randint(0, 365)),
+                "end_date": first_day + timedelta(days=rng.randint(0, 365)),
+                "ticket_price": 0.0,
+            }
+            for _ in range(num_events)
+        ],
+    )
+    db.session.commit()
+
+
+def stringified_dicts():
+    dict_of_events_details = {}
+    for row in EventDetails.query.all():
+        dict_of_events_details[row.id] = {
+            column.name: str(getattr(row, column.name)) for column in row.__table__.columns
+        }
+    return dict_of_events_details
+
+
+def measure(load):
+    # Best wall time of REPEAT loads, and the peak memory allocated by one load
+    times = []
+    for _ in range(REPEAT):
+        db.session.expunge_all()
+        gc.collect()
+        start = time.perf_counter()
+        load()
+        times.append(time.perf_counter() - start)
+
+    db.session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return min(times), peak
+
+
+def main():
+    bench_app = make_bench_app()
+    with bench_app.app_context():
+        db.create_all()
+        populate(NUM_EVENTS)
+
+        loads = {
+            "ORM objects + dicts of strings": stringified_dicts,
+            "EventCard rows": lambda: project(EventDetails.query, EventCard),
+            "EventCalendarEntry rows": lambda: project(EventDetails.query, EventCalendarEntry),
+        }
+        print(f"Loading {NUM_EVENTS} events")
+        print(f"{'':>32} {'time (ms)':>10} {'peak memory (MB)':>17}")
+        for name, load in loads.items():
+            seconds, peak = measure(load)
+            print(f"{name:>32} {seconds * 1000:>10.0f} {peak / 2**20:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
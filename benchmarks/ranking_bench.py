@@ -0,0 +1,55 @@
+# Benchmark the BM25 relevance ranking on a large synthetic catalog
+# Run from the repository root with: python -m benchmarks.ranking_bench
+import random
+import time
+import timeit
+from collections import namedtuple
+
+from app.ranking import BM25FIndex
+
+NUM_EVENTS = 100_000
+REPEAT = 20
+
+WORDS = [
+    "jazz", "night", "hackathon", "career", "fair", "startup", "pitch", "robotics", "club",
+    "yoga", "chess", "lecture", "research", "symposium", "film", "screening", "trivia",
+    "debate", "workshop", "python", "design", "music", "open", "mic", "networking",
+]
+VENUES = ["Hart House", "Bahen Centre", "Robarts Library", "Myhal Centre", "Sidney Smith Hall"]
+CATEGORIES = ["Academic", "Hobbies", "Music", "Nightlife", "Business"]
+
+QUERIES = ["jazz", "career fair", "robotics workshop night", "music", "zzzzz"]
+
+Event = namedtuple("Event", ["id", "name", "short_description", "long_description", "venue", "category"])
+
+
+def make_event(rng, event_id):
+    def text(low, high):
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+    return Event(event_id, text(2, 5).title(), text(4, 10), text(20, 60), rng.choice(VENUES), rng.choice(CATEGORIES))
+
+
+def main():
+    rng = random.Random(0)
+    events = [make_event(rng, event_id) for event_id in range(1, NUM_EVENTS + 1)]
+
+    index = BM25FIndex()
+    start = time.perf_counter()
+    index.build(events)
+    print(f"Built the index for {NUM_EVENTS} events ({len(index.main)} postings) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    update = min(timeit.repeat(lambda: index.add(events[0]), number=1, repeat=REPEAT)) * 1000
+    print(f"Updating one event takes {update:.2f} ms")
+
+    print(f"{'query':>26} {'matches':>8} {'all (ms)':>9} {'top 10 (ms)':>12}")
+    for query in QUERIES:
+        matches = len(index.search(query))
+        full = min(timeit.repeat(lambda: index.search(query), number=1, repeat=REPEAT)) * 1000
+        top = min(timeit.repeat(lambda: index.search(query, limit=10), number=1, repeat=REPEAT)) * 1000
+        print(f"{query:>26} {matches:>8} {full:>9.2f} {top:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
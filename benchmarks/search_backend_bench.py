@@ -0,0 +1,80 @@
+# Benchmark every search backend on the same synthetic catalog and queries
+# Run from the repository root with: python -m benchmarks.search_backend_bench
+# elasticsearch runs against the cluster at ELASTICSEARCH_HOST if it is set, otherwise
+# against the local fake cluster (whose searches are answered by the in-memory engine)
+import os
+import random
+import time
+import timeit
+
+from flask import Flask
+from sqlalchemy import insert
+
+from app.main import db
+from app.database import EventDetails
+from app.search_backends import SEARCH_BACKENDS, create_search_backend
+
+NUM_EVENTS = 10_000
+REPEAT = 20
+
+WORDS = [
+    "jazz", "night", "hackathon", "career", "fair", "startup", "pitch", "robotics", "club",
+    "yoga", "chess", "lecture", "research", "symposium", "film", "screening", "trivia",
+    "debate", "workshop", "python", "design", "music", "open", "mic", "networking",
+]
+
+QUERIES = ["jazz", "career fair", "robtoics", "zzzzz"]
+
+
+def make_bench_app():
+    bench_app = Flask(__name__)
+    bench_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(bench_app)
+    return bench_app
+
+
+def populate(num_events):
+    rng = random.Random(num_events)
+    db.session.execute(
+        insert(EventDetails),
+        [
+            {"name": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()}
+            for _ in range(num_events)
+        ],
+    )
+    db.session.commit()
+
+
+def backend_options(name):
+    if name != "elasticsearch" or os.environ.get("ELASTICSEARCH_HOST"):
+        return {}
+    from tests.fake_elasticsearch import make_fake_elasticsearch
+    es, _ = make_fake_elasticsearch()
+    return {"es": es}
+
+
+def main():
+    bench_app = make_bench_app()
+    with bench_app.app_context():
+        db.create_all()
+        populate(NUM_EVENTS)
+        event = EventDetails.query.first()
+
+        print(f"{'backend':>14} {'build (s)':>10} {'index (ms)':>11} {'query':>12} {'matches':>8} "
+              f"{'search (ms)':>12} {'autocomplete (ms)':>18}")
+        for name in sorted(SEARCH_BACKENDS):
+            start = time.perf_counter()
+            backend = create_search_backend(name, **backend_options(name))
+            build = time.perf_counter() - start
+            index = min(timeit.repeat(lambda: backend.index(event), number=1, repeat=REPEAT)) * 1000
+
+            for query in QUERIES:
+                matches = len(backend.search(query))
+                search = min(timeit.repeat(lambda: backend.search(query), number=1, repeat=REPEAT)) * 1000
+                complete = min(timeit.repeat(lambda: backend.autocomplete(query), number=1, repeat=REPEAT)) * 1000
+                print(f"{name:>14} {build:>10.2f} {index:>11.3f} {query:>12} {matches:>8} "
+                      f"{search:>12.3f} {complete:>18.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Benchmark the in-process event name index against the table scan it replaced
+# Run from the repository root with: python -m benchmarks.search_index_bench
+import random
+import timeit
+
+from flask import Flask
+from sqlalchemy import insert
+
+from app.main import db
+from app.database import EventDetails
+from app.search_index import EventNameIndex
+
+CATALOG_SIZES = [1_000, 10_000, 100_000]
+QUERIES = ["ja", "night", "hackathon", "career fair", "zzz"]
+REPEAT = 20
+
+WORDS = [
+    "jazz", "night", "hackathon", "career", "fair", "startup", "pitch", "robotics", "club",
+    "yoga", "chess", "lecture", "research", "symposium", "film", "screening", "trivia",
+    "debate", "workshop", "python", "design", "music", "open", "mic", "networking",
+]
+
+
+def make_bench_app():
+    bench_app = Flask(__name__)
+    bench_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(bench_app)
+    return bench_app
+
+
+def populate(num_events):
+    rng = random.Random(num_events)
+    db.session.execute(EventDetails.__table__.delete())
+    db.session.execute(
+        insert(EventDetails),
+        [
+            {"name": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()}
+            for _ in range(num_events)
+        ],
+    )
+    db.session.commit()
+
+
+def table_scan(query):
+    # The previous simple search implementation (without its per row logging)
+    result = []
+    for row in EventDetails.query.all():
+        if query in str(row.name).lower():
+            result.append([str(row.name), str(row.id)])
+    return result
+
+
+def main():
+    bench_app = make_bench_app()
+    with bench_app.app_context():
+        db.create_all()
+        print(f"{'events':>8} {'query':>12} {'scan (ms)':>10} {'index (ms)':>11} {'speedup':>8}")
+        for num_events in CATALOG_SIZES:
+            populate(num_events)
+
+            index = EventNameIndex()
+            index.build(db.session.query(EventDetails.id, EventDetails.name).all())
+
+            for query in QUERIES:
+                assert [int(event_id) for _, event_id in table_scan(query)] == index.lookup(query)
+
+                scan = min(timeit.repeat(lambda: table_scan(query), number=1, repeat=3)) * 1000
+                lookup = min(timeit.repeat(lambda: index.lookup_names(query), number=1, repeat=REPEAT)) * 1000
+                print(f"{num_events:>8} {query:>12} {scan:>10.2f} {lookup:>11.3f} {scan / lookup:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
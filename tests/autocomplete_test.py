@@ -0,0 +1,76 @@
+from app.autocomplete import AutocompleteTrie, score_event, UPCOMING_EVENT_BOOST, PAST_EVENT_PENALTY
+
+
+def make_trie(k=3):
+    trie = AutocompleteTrie(k=k)
+    trie.build([
+        (1, "Jazz Night", 10),
+        (2, "Jazz Brunch", 30),
+        (3, "Java Workshop", 20),
+        (4, "Startup Night", 5),
+        (5, "Jam Session", 1),
+    ])
+    return trie
+
+
+def test_score_event():
+    assert score_event(3, is_past_event=False) == 3 + UPCOMING_EVENT_BOOST
+    assert score_event(3, is_past_event=True) == 3 - PAST_EVENT_PENALTY
+
+
+# Test that completions come back best score first and are capped at k
+def test_ranked_completions():
+    trie = make_trie()
+    assert trie.complete("ja") == [["Jazz Brunch", 2], ["Java Workshop", 3], ["Jazz Night", 1]]
+    assert trie.complete("JAZZ") == [["Jazz Brunch", 2], ["Jazz Night", 1]]
+    assert trie.complete("jazz n") == [["Jazz Night", 1]]
+    assert trie.complete("jaz") == trie.complete("jazz")
+    assert trie.complete("jazzy") == []
+    assert trie.complete("") == []
+
+
+# Test that every word of the name can start a completion
+def test_word_completions():
+    trie = make_trie()
+    assert trie.complete("night") == [["Jazz Night", 1], ["Startup Night", 4]]
+    assert trie.complete("sess") == [["Jam Session", 5]]
+
+
+# Test the incremental update hooks
+def test_incremental_updates():
+    trie = make_trie()
+
+    # A registration pushes Jam Session above the other "ja" events
+    trie.update_score(5, 100)
+    assert trie.complete("ja")[0] == ["Jam Session", 5]
+
+    # Renaming an event moves it to the new prefixes only
+    trie.upsert(1, "Blues Night", 10)
+    assert ["Jazz Night", 1] not in trie.complete("jazz")
+    assert trie.complete("blu") == [["Blues Night", 1]]
+    assert trie.complete("night") == [["Blues Night", 1], ["Startup Night", 4]]
+
+    trie.remove(2)
+    assert trie.complete("jazz") == []
+    assert trie.complete("ja") == [["Jam Session", 5], ["Java Workshop", 3]]
+
+    trie.upsert(6, "Jazz Fest", 50)
+    assert trie.complete("j") == [["Jam Session", 5], ["Jazz Fest", 6], ["Java Workshop", 3]]
+
+
+# Test that incremental updates give the same result as rebuilding the trie
+def test_incremental_matches_rebuild():
+    trie = AutocompleteTrie(k=2)
+    events = {}
+    for event_id in range(50):
+        name = f"Event {event_id % 7} Night {event_id % 3}"
+        events[event_id] = (name, event_id % 11)
+        trie.upsert(event_id, name, event_id % 11)
+    for event_id in range(0, 50, 4):
+        del events[event_id]
+        trie.remove(event_id)
+
+    rebuilt = AutocompleteTrie(k=2)
+    rebuilt.build((event_id, name, score) for event_id, (name, score) in events.items())
+    for prefix in ["e", "event 3", "night", "night 2", "n", "1", "event 6 night 0"]:
+        assert trie.complete(prefix) == rebuilt.complete(prefix)
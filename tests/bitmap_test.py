@@ -0,0 +1,169 @@
+import pytest
+import random
+from pathlib import Path
+from datetime import date, datetime, time, timedelta
+from app.main import app, db
+from app.globals import Role
+from app.database import Credentials, EventDetails, Tag
+from app.bitmap import Bitmap, EventBitmapIndex, parse_filter_expression, ARRAY_MAX
+from app.filter import EventFilterBuilder, is_valid_filter_tag, toggle_filter_tag
+
+TEST_DB = "test.db"
+
+TODAY = date(2030, 5, 15)
+NOON = datetime.combine(TODAY, time(12, 0))
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def tagged_events(client):
+    # Events and tags are removed again so that the ids expected by the other tests are unchanged
+    outdoors = Tag(name="Bitmap Outdoors")
+    events = [
+        EventDetails(name="Bitmap Concert", is_online=0, ticket_price=0.0, category="music",
+                     start_date=TODAY, start_time=time(9, 0), tags=[outdoors]),
+        EventDetails(name="Bitmap Lecture", is_online=1, ticket_price=10.0, category="academic",
+                     start_date=TODAY - timedelta(days=1), start_time=time(18, 0)),
+        EventDetails(name="Bitmap Jam", is_online=None, ticket_price=None, category="Music",
+                     start_date=TODAY, start_time=time(20, 0), tags=[outdoors]),
+        EventDetails(name="Bitmap Social", is_online=0, ticket_price=5.0, category="nightlife"),
+    ]
+    db.session.add_all(events)
+    db.session.commit()
+    yield events
+    for event in events:
+        db.session.delete(event)
+    db.session.delete(outdoors)
+    db.session.commit()
+
+
+def index_of(events):
+    index = EventBitmapIndex()
+    index.build(events, {event.id: [tag.name for tag in event.tags] for event in events})
+    return index
+
+
+def names(index, expression):
+    event_ids = index.evaluate(expression, now=NOON).to_list()
+    return [event.name for event in EventDetails.query.filter(EventDetails.id.in_(event_ids)).order_by(EventDetails.id)]
+
+
+# Test the set operations against python sets, on sparse (array) and dense (bitset) chunks
+def test_bitmap_operations():
+    rng = random.Random(0)
+    dense = set(range(1, 3 * ARRAY_MAX, 2))
+    sets = [
+        dense | {70000, 70001, 200000},
+        set(rng.sample(range(300000), 500)) | set(range(0, 2 * ARRAY_MAX, 3)),
+        set(rng.sample(range(300000), 20)),
+        set(),
+    ]
+    for first in sets:
+        for second in sets:
+            a, b = Bitmap.from_ids(first), Bitmap.from_ids(second)
+            assert (a & b).to_list() == sorted(first & second)
+            assert (a | b).to_list() == sorted(first | second)
+            assert (a - b).to_list() == sorted(first - second)
+            assert len(a) == len(first)
+
+
+def test_bitmap_updates():
+    bitmap = Bitmap.from_ids(range(ARRAY_MAX))
+    shared = bitmap | Bitmap()
+    # Growing past ARRAY_MAX switches the chunk to a bitset and back
+    bitmap.add(ARRAY_MAX + 10)
+    assert ARRAY_MAX + 10 in bitmap and len(bitmap) == ARRAY_MAX + 1
+    bitmap.discard(0)
+    bitmap.discard(ARRAY_MAX + 10)
+    assert 0 not in bitmap and len(bitmap) == ARRAY_MAX - 1
+    bitmap.add(1 << 20)
+    assert (1 << 20) in bitmap
+    # Bitmaps sharing a chunk are not affected
+    assert len(shared) == ARRAY_MAX and 0 in shared
+
+
+def test_parse_filter_expression():
+    assert parse_filter_expression("Free+music,nightlife+-past events") == [
+        [(False, "free")], [(False, "music"), (False, "nightlife")], [(True, "past events")]]
+    with pytest.raises(ValueError):
+        parse_filter_expression("free++music")
+
+
+def test_evaluate(tagged_events):
+    index = index_of(tagged_events)
+    assert names(index, "free+in-person+music+today") == ["Bitmap Concert", "Bitmap Jam"]
+    assert names(index, "music,nightlife+-free") == ["Bitmap Social"]
+    assert names(index, "bitmap outdoors+past events") == ["Bitmap Concert"]
+    assert names(index, "-in-person") == ["Bitmap Lecture"]
+    assert names(index, "all") == [event.name for event in sorted(tagged_events, key=lambda event: event.id)]
+
+    # Every filter tag matches the same events as the SQL filters
+    sql_only = lambda: EventFilterBuilder().event_ids([event.id for event in tagged_events])
+    assert names(index, "free") == [event.name for event in sql_only().free().all()]
+    assert names(index, "past events") == [event.name for event in sql_only().past(NOON).all()]
+    assert names(index, "today") == [event.name for event in sql_only().today(TODAY).all()]
+
+
+def test_facet_counts_and_updates(tagged_events):
+    index = index_of(tagged_events)
+    music = index.evaluate("music", now=NOON)
+    assert index.facet_counts(music, ["free", "in-person", "today", "academic"], now=NOON) == {
+        "free": 2, "in-person": 2, "today": 2, "academic": 0}
+
+    concert = tagged_events[0]
+    concert.ticket_price = 15.0
+    index.upsert(concert, ["Bitmap Outdoors"])
+    assert names(index, "free+music") == ["Bitmap Jam"]
+    index.remove(tagged_events[2].id)
+    assert names(index, "free+music") == []
+    assert len(index) == 3
+
+
+def test_filter_tags(tagged_events):
+    assert toggle_filter_tag("all", "free") == "free"
+    assert toggle_filter_tag("free", "music") == "free+music"
+    assert toggle_filter_tag("free+music", "free") == "music"
+    assert toggle_filter_tag("music", "music") == "all"
+
+    assert is_valid_filter_tag("free+in-person+music+today")
+    assert is_valid_filter_tag("-past events")
+    assert not is_valid_filter_tag("free+nonsense")
+    assert not is_valid_filter_tag("free+")
+
+    # Any number of ids is sent as one parameter
+    event_ids = [event.id for event in tagged_events] + list(range(10**6, 10**6 + 50000))
+    rows = EventFilterBuilder().in_events(event_ids).in_person().all()
+    assert [row.name for row in rows] == ["Bitmap Concert", "Bitmap Jam", "Bitmap Social"]
+
+
+# Test that the filter buttons combine the tags of the current filter
+def test_filter_events_route(client):
+    user = Credentials(username="bitmap_user", role=Role.USER.value, name="Bitmap User")
+    db.session.add(user)
+    db.session.commit()
+    try:
+        with client.session_transaction() as session:
+            session["_user_id"] = user.username
+        response = client.post("/filter_events", data={"filter-tag": "music", "current-filter": "free"},
+                               headers={"Referer": "http://localhost/user/free"})
+        assert response.headers["Location"] == "/user/free+music"
+
+        response = client.get("/user/free+music")
+        assert response.status_code == 200
+        assert b"Free (" in response.data
+        assert client.get("/user/free+nonsense").status_code == 404
+    finally:
+        db.session.delete(user)
+        db.session.commit()
@@ -0,0 +1,109 @@
+import threading
+import pytest
+from app.cache import LRUCache, SingleFlight, normalize_query, get_catalog_content_version, bump_catalog_content_version
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# Test that the least recently used entry is evicted first
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+# Test that entries expire after their time to live
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+    cache.set("a", 1)
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.stats()["expirations"] == 1
+
+
+def test_get_or_compute_counters():
+    cache = LRUCache(maxsize=10)
+    calls = []
+    compute = lambda: calls.append(1) or ["result"]
+
+    assert cache.get_or_compute("q", compute) == ["result"]
+    assert cache.get_or_compute("q", compute) == ["result"]
+    assert len(calls) == 1
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_normalize_query():
+    assert normalize_query("  Jazz   NIGHT ") == "jazz night"
+
+
+# Test that a catalog write changes the cache key so stale results are never returned
+def test_catalog_content_version_invalidates():
+    cache = LRUCache(maxsize=10)
+    cache.set(("search", "jazz", get_catalog_content_version()), [1])
+    bump_catalog_content_version()
+    assert cache.get(("search", "jazz", get_catalog_content_version())) is None
+
+
+# Test that concurrent calls with the same key share one execution
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ["result"]
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("q", compute)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("q", compute))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    # Wait until every follower is waiting on the leader's call
+    while flight.shared < 3:
+        pass
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert results == [["result"]] * 4
+    assert len(calls) == 1
+    assert flight.calls == {}
+
+    # Once done, the next call runs again
+    assert flight.do("q", lambda: ["again"]) == ["again"]
+
+
+def test_single_flight_error():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("backend down")
+
+    with pytest.raises(ValueError):
+        flight.do("q", fail)
+    assert flight.calls == {}
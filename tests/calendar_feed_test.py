@@ -0,0 +1,106 @@
+import pytest
+from pathlib import Path
+from datetime import date, time
+from app.main import app, db
+from app.globals import Role, CATEGORY_COLORS
+from app.database import Credentials, EventDetails
+from app.filter import EventFilterBuilder
+from app.user import get_category_color
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def calendar_events(client):
+    # Events are removed again so that the event ids expected by the other tests are unchanged
+    events = [
+        EventDetails(name="Calendar Festival", category="music", start_date=date(2032, 1, 20),
+                     end_date=date(2032, 2, 10), start_time=time(10, 0), end_time=time(22, 0)),
+        EventDetails(name="Calendar Talk", category="academic", start_date=date(2032, 2, 15), start_time=time(18, 0)),
+        EventDetails(name="Calendar Party", category="nightlife", start_date=date(2032, 3, 1)),
+        EventDetails(name="Calendar Retreat", category="hobbies", start_date=date(2032, 1, 25), end_date=date(2032, 1, 31)),
+    ]
+    db.session.add_all(events)
+    db.session.commit()
+    yield events
+    for event in events:
+        db.session.delete(event)
+    db.session.commit()
+
+
+@pytest.fixture
+def logged_in(client):
+    user = Credentials(username="calendar_user", role=Role.USER.value, name="Calendar User")
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as session:
+        session["_user_id"] = user.username
+    yield client
+    db.session.delete(user)
+    db.session.commit()
+
+
+def names(builder):
+    return sorted(event.name for event in builder.all() if event.name.startswith("Calendar"))
+
+
+# Test that events spanning the start of the range are found, whatever their start date
+def test_overlapping(calendar_events):
+    february = EventFilterBuilder().overlapping(date(2032, 2, 1), date(2032, 3, 1))
+    assert names(february) == ["Calendar Festival", "Calendar Talk"]
+    assert names(EventFilterBuilder().overlapping(date(2032, 3, 1), date(2032, 3, 2))) == ["Calendar Party"]
+    assert names(EventFilterBuilder().overlapping(date(2032, 1, 1), date(2032, 1, 20))) == []
+
+
+def test_category_colors():
+    assert get_category_color("music") == CATEGORY_COLORS["Music"]
+    assert get_category_color("Unknown") == get_category_color("unknown")
+    assert get_category_color(None) in CATEGORY_COLORS.values()
+
+
+def test_calendar_feed(logged_in, calendar_events):
+    response = logged_in.get("/user/calendar/events?start=2032-02-01T00:00:00-05:00&end=2032-03-02T00:00:00-05:00")
+    assert response.status_code == 200
+    feed = [event for event in response.get_json() if event["title"].startswith("Calendar")]
+    assert feed == [
+        {"key": calendar_events[0].id, "title": "Calendar Festival", "start": "2032-01-20T10:00:00",
+         "end": "2032-02-10T22:00:00", "backgroundColor": CATEGORY_COLORS["Music"], "borderColor": CATEGORY_COLORS["Music"]},
+        {"key": calendar_events[1].id, "title": "Calendar Talk", "start": "2032-02-15T18:00:00",
+         "backgroundColor": CATEGORY_COLORS["Academic"], "borderColor": CATEGORY_COLORS["Academic"]},
+        {"key": calendar_events[2].id, "title": "Calendar Party", "start": "2032-03-01",
+         "backgroundColor": CATEGORY_COLORS["Nightlife"], "borderColor": CATEGORY_COLORS["Nightlife"]},
+    ]
+
+    # Filters apply to the feed and unchanged responses are revalidated
+    response = logged_in.get("/user/calendar/events?start=2032-01-01&end=2032-02-01&filter=hobbies")
+    assert [event["title"] for event in response.get_json()] == ["Calendar Retreat"]
+    assert response.get_json()[0]["end"] == "2032-02-01"
+    etag = response.headers["ETag"]
+    response = logged_in.get("/user/calendar/events?start=2032-01-01&end=2032-02-01&filter=hobbies",
+                             headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    assert logged_in.get("/user/calendar/events?start=soon&end=later").status_code == 404
+    assert logged_in.get("/user/calendar/events?start=2032-01-01&end=2032-02-01&filter=nonsense").status_code == 404
+
+
+# Test that the range query is answered with the starts_at index
+def test_range_query_uses_index(client):
+    query = EventFilterBuilder().overlapping(date(2032, 2, 1), date(2032, 3, 1)).query
+    plan = db.session.execute(db.text(
+        "EXPLAIN QUERY PLAN " + str(query.statement.compile(compile_kwargs={"literal_binds": True}))
+    )).all()
+    assert any("ix_event_details_starts_at" in row[-1] for row in plan)
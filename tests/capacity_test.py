@@ -0,0 +1,188 @@
+import io
+import pytest
+import threading
+from pathlib import Path
+from flask import g
+from datetime import date, time, timedelta
+from app.main import app, db
+from app.globals import Role
+from app.database import ChangeLog, Credentials, EventDetails, EventRegistration, EventWaitlist
+from app.migrations import count_taken_seats
+
+TEST_DB = "test.db"
+
+NUM_REGISTRANTS = 300
+MAX_CAPACITY = 50
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def popular_event(client):
+    users = [
+        Credentials(username=f"capacity_user{number}", role=Role.USER.value, name="Capacity User")
+        for number in range(NUM_REGISTRANTS)
+    ]
+    event = EventDetails(name="Popular Capacity Event", image="placeholder.png", max_capacity=MAX_CAPACITY,
+                         current_capacity=0, start_date=date.today() + timedelta(days=7), start_time=time(18, 0))
+    db.session.add_all([*users, event])
+    db.session.commit()
+
+    yield event.id, [user.username for user in users]
+
+    EventWaitlist.query.filter_by(event_id=event.id).delete()
+    EventRegistration.query.filter_by(event_id=event.id).delete()
+    ChangeLog.query.filter_by(event_id=event.id).delete()
+    for row in [*users, event]:
+        db.session.delete(row)
+    db.session.commit()
+
+
+def logged_in_client(username):
+    user_client = app.test_client()
+    with user_client.session_transaction() as session:
+        session["_user_id"] = username
+    return user_client
+
+
+def register_as(username, event_id):
+    # The app context of the fixture outlives the requests, and so does the user flask-login loaded
+    g.pop("_login_user", None)
+    return logged_in_client(username).post(f"/events/register/{event_id}")
+
+
+def seats(event_id):
+    db.session.expire_all()
+    taken = db.session.get(EventDetails, event_id).current_capacity
+    return taken, EventRegistration.query.filter_by(event_id=event_id).count()
+
+
+def register_concurrently(event_id, usernames):
+    # Every user toggles their registration at the same time, from a thread of their own
+    clients = [logged_in_client(username) for username in usernames]
+    start = threading.Barrier(len(clients))
+    failures = []
+
+    def toggle(user_client):
+        start.wait()
+        response = user_client.post(f"/events/register/{event_id}")
+        if response.status_code != 302:
+            failures.append(response.status_code)
+
+    threads = [threading.Thread(target=toggle, args=(user_client,)) for user_client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert failures == []
+
+
+# Test that a full event turns registrations away and a cancellation frees a seat
+def test_full_event(popular_event):
+    event_id, usernames = popular_event
+    event = db.session.get(EventDetails, event_id)
+    event.max_capacity = 2
+    db.session.commit()
+
+    for username in usernames[:3]:
+        register_as(username, event_id)
+    assert seats(event_id) == (2, 2)
+    assert EventRegistration.query.filter_by(event_id=event_id, attendee_username=usernames[2]).first() is None
+
+    # The second click cancels the registration, its seat goes to the waitlisted user
+    register_as(usernames[0], event_id)
+    assert seats(event_id) == (2, 2)
+    assert EventRegistration.query.filter_by(event_id=event_id, attendee_username=usernames[2]).first() is not None
+    register_as(usernames[2], event_id)
+    assert seats(event_id) == (1, 1)
+
+
+def test_unlimited_event(popular_event):
+    event_id, usernames = popular_event
+    event = db.session.get(EventDetails, event_id)
+    event.max_capacity = None
+    event.current_capacity = None
+    db.session.commit()
+
+    for username in usernames[:3]:
+        register_as(username, event_id)
+    assert seats(event_id) == (3, 3)
+
+
+# Test that hundreds of concurrent registrants never oversubscribe the event
+def test_concurrent_registrations(popular_event):
+    event_id, usernames = popular_event
+
+    register_concurrently(event_id, usernames)
+    assert seats(event_id) == (MAX_CAPACITY, MAX_CAPACITY)
+
+    # Registered users cancel while the waitlisted ones leave, the seats follow the registrations
+    registered = {registration.attendee_username for registration in EventRegistration.query.filter_by(event_id=event_id)}
+    cancelling = sorted(registered)[:MAX_CAPACITY // 2]
+    waiting = [username for username in usernames if username not in registered]
+    register_concurrently(event_id, cancelling + waiting)
+    taken, registrations = seats(event_id)
+    assert taken == registrations <= MAX_CAPACITY
+
+
+# Test that the seats taken before the registrations counted them are backfilled
+def test_count_taken_seats(popular_event):
+    event_id, usernames = popular_event
+    db.session.add_all([EventRegistration(event_id=event_id, attendee_username=username) for username in usernames[:4]])
+    db.session.commit()
+    assert seats(event_id) == (0, 4)
+
+    count_taken_seats()
+    db.session.commit()
+    assert seats(event_id) == (4, 4)
+
+
+def edit_capacity(event_id, max_capacity):
+    g.pop("_login_user", None)
+    organizer = Credentials(username="capacity_organizer", role=Role.ORGANIZER.value, name="Capacity Organizer")
+    db.session.add(organizer)
+    db.session.commit()
+    try:
+        organizer_client = logged_in_client(organizer.username)
+        event = db.session.get(EventDetails, event_id)
+        return organizer_client.post(f"/events/edit_event/{event_id}", content_type="multipart/form-data", data={
+            "name": event.name, "short_description": "Capacity", "category": "Music",
+            "start_date": event.start_date.isoformat(), "end_date": event.start_date.isoformat(),
+            "start_time": "18:00", "end_time": "20:00", "max_capacity": max_capacity, "ticket_price": 0,
+            "banner_image": (io.BytesIO(b""), ""),
+        })
+    finally:
+        g.pop("_login_user", None)
+        db.session.delete(organizer)
+        db.session.commit()
+
+
+# Test that the capacity of an event can't be lowered below the seats already taken
+def test_capacity_below_taken_seats(popular_event):
+    event_id, usernames = popular_event
+    db.session.get(EventDetails, event_id).category = "music"
+    db.session.commit()
+    for username in usernames[:3]:
+        register_as(username, event_id)
+    assert seats(event_id) == (3, 3)
+
+    response = edit_capacity(event_id, 2)
+    assert response.status_code == 200
+    assert b"3 seats are already taken" in response.data
+    db.session.expire_all()
+    assert db.session.get(EventDetails, event_id).max_capacity == MAX_CAPACITY
+
+    assert edit_capacity(event_id, 3).status_code == 302
+    db.session.expire_all()
+    assert db.session.get(EventDetails, event_id).max_capacity == 3
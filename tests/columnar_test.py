@@ -0,0 +1,159 @@
+import pytest
+from pathlib import Path
+from datetime import date, datetime, time, timedelta
+from app.main import app, db
+from app.database import EventDetails
+from app.filter import EventFilterBuilder
+from app.columnar import EventColumns, ColumnarEventFilter
+from app.projections import EventCard
+
+TEST_DB = "test.db"
+
+TODAY = date(2030, 5, 15)
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def columnar_events(client):
+    # Events are removed again so that the event ids expected by the other tests are unchanged
+    events = [
+        EventDetails(name="Columnar Concert", is_online=0, ticket_price=0.0, category="music", organizer="org_a",
+                     start_date=TODAY, start_time=time(9, 0)),
+        EventDetails(name="Columnar Lecture", is_online=1, ticket_price=10.0, category="academic", organizer="org_b",
+                     start_date=TODAY - timedelta(days=1), start_time=time(18, 0)),
+        EventDetails(name="Columnar Jam", is_online=None, ticket_price=None, category="music", organizer="org_a",
+                     start_date=TODAY + timedelta(days=1), start_time=time(9, 0)),
+        EventDetails(name="Columnar Social", is_online=0, ticket_price=5.0, category="nightlife",
+                     start_date=TODAY, start_time=None),
+        EventDetails(name="Columnar Meetup", category="business"),
+        EventDetails(name="Columnar Brunch", is_online=0, ticket_price=0.0, category="hobbies",
+                     start_date=TODAY, start_time=time(9, 0)),
+    ]
+    db.session.add_all(events)
+    db.session.commit()
+    yield events
+    for event in events:
+        db.session.delete(event)
+    db.session.commit()
+
+
+def snapshot(events):
+    columns = EventColumns()
+    columns.build(events)
+    return columns
+
+
+def sql_only(events):
+    # A SQL builder restricted to the test events, whatever else is in the database
+    return EventFilterBuilder().event_ids([event.id for event in events])
+
+
+def names(rows):
+    return [row.name for row in rows]
+
+
+# Test that the columnar filters match the SQL ones, alone and combined
+def test_filters_match_sql(columnar_events):
+    columns = snapshot(columnar_events)
+    morning = datetime.combine(TODAY, time(8, 0))
+    noon = datetime.combine(TODAY, time(12, 0))
+    chains = [
+        lambda f: f,
+        lambda f: f.in_person(),
+        lambda f: f.free(),
+        lambda f: f.today(TODAY),
+        lambda f: f.past(morning),
+        lambda f: f.past(noon),
+        lambda f: f.category("music"),
+        lambda f: f.category("Music").free().in_person(),
+        lambda f: f.filter_tag("free").today(TODAY),
+        lambda f: f.filter_tag("academic").in_person(),
+    ]
+    for chain in chains:
+        assert names(chain(ColumnarEventFilter(columns)).all()) == names(chain(sql_only(columnar_events)).all())
+        assert names(chain(ColumnarEventFilter(columns)).all(EventCard)) == names(chain(sql_only(columnar_events)).all(EventCard))
+
+
+def test_organizer_and_event_ids(columnar_events):
+    columns = snapshot(columnar_events)
+    concert, lecture, jam = columnar_events[:3]
+    assert names(ColumnarEventFilter(columns).organizer("org_a").all()) == ["Columnar Concert", "Columnar Jam"]
+    assert names(ColumnarEventFilter(columns).organizer("nobody").all()) == []
+    # Search results keep the order of the ids
+    assert names(ColumnarEventFilter(columns).event_ids([jam.id, lecture.id, concert.id]).free().all()) == [
+        "Columnar Jam", "Columnar Concert"]
+
+
+# Test that the listing pages follow the same (starts_at, id) order as SQL
+def test_listing_page_matches_sql(columnar_events):
+    columns = snapshot(columnar_events)
+    expected = names(sql_only(columnar_events).listing_page())
+    assert names(ColumnarEventFilter(columns).listing_page()) == expected
+
+    for limit in range(1, len(columnar_events) + 1):
+        assert names(ColumnarEventFilter(columns).listing_page(limit=limit, row_type=EventCard)) == expected[:limit]
+
+    concert = columnar_events[0]
+    for after in [(concert.starts_at, concert.id), (None, 0)]:
+        assert names(ColumnarEventFilter(columns).listing_page(after, 2)) == names(sql_only(columnar_events).listing_page(after, 2))
+
+
+# Test that writes are applied to the snapshot without a rebuild
+def test_incremental_updates(columnar_events, monkeypatch):
+    monkeypatch.setattr("app.columnar.INITIAL_CAPACITY", 2)
+    columns = snapshot(columnar_events[:2])
+    concert, lecture = columnar_events[:2]
+    assert names(ColumnarEventFilter(columns).free().all()) == ["Columnar Concert"]
+
+    lecture.ticket_price = 0.0
+    db.session.commit()
+    columns.upsert(lecture)
+    assert names(ColumnarEventFilter(columns).free().all()) == ["Columnar Concert", "Columnar Lecture"]
+
+    columns.remove(concert.id)
+    assert names(ColumnarEventFilter(columns).free().all()) == ["Columnar Lecture"]
+    assert len(columns) == 1
+
+    # The arrays grow as events are added
+    for event in columnar_events[2:]:
+        columns.upsert(event)
+    assert names(ColumnarEventFilter(columns).category("music").all()) == ["Columnar Jam"]
+
+
+# Test that the entries of edited events are dropped instead of growing the arrays forever
+def test_edits_compact_the_snapshot(columnar_events, monkeypatch):
+    monkeypatch.setattr("app.columnar.INITIAL_CAPACITY", 1)
+    columns = snapshot(columnar_events)
+    lecture = columnar_events[1]
+    for price in range(100):
+        lecture.ticket_price = float(price % 2)
+        columns.upsert(lecture)
+    # Grown once for the first edit, then compacted
+    assert len(columns.ids) == 2 * len(columnar_events)
+    assert len(columns) == len(columnar_events)
+
+    lecture.ticket_price = 0.0
+    db.session.commit()
+    columns.upsert(lecture)
+    assert names(ColumnarEventFilter(columns).free().all()) == names(sql_only(columnar_events).free().all())
+    expected = names(sql_only(columnar_events).listing_page())
+    assert names(ColumnarEventFilter(columns).listing_page()) == expected
+
+
+def test_overlapping_matches_sql(columnar_events):
+    columns = snapshot(columnar_events)
+    for start, end in [(TODAY, TODAY + timedelta(days=1)), (TODAY - timedelta(days=7), TODAY), (TODAY, TODAY)]:
+        assert names(ColumnarEventFilter(columns).overlapping(start, end).all()) == \
+            names(sql_only(columnar_events).overlapping(start, end).all())
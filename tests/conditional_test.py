@@ -0,0 +1,156 @@
+import pytest
+from pathlib import Path
+from sqlalchemy import event
+from app.main import app, db
+from app.globals import Role, ETAG_TIME_BUCKET
+from app.database import ChangeLog, Credentials
+from app.cache import get_catalog_version, get_registration_version, advance_catalog_version
+from app.invalidation import record_change, publish_change, get_last_change_id
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+def log_in(client, username, role):
+    user = Credentials(username=username, role=role, name=username)
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as session:
+        session["_user_id"] = username
+    return user
+
+
+@pytest.fixture
+def user_client(client):
+    user = log_in(client, "conditional_user", Role.USER.value)
+    first_change_id = get_catalog_version()
+    yield client
+    ChangeLog.query.filter(ChangeLog.id > first_change_id).delete()
+    db.session.delete(user)
+    db.session.commit()
+
+
+def commit_change(topic, username=None):
+    # A write of this worker, replayed by the others
+    record_change(topic, 123456, username)
+    db.session.commit()
+    publish_change(topic, 123456, username)
+
+
+@pytest.fixture
+def organizer_client(client):
+    user = log_in(client, "conditional_org", Role.ORGANIZER.value)
+    yield client
+    db.session.delete(user)
+    db.session.commit()
+
+
+def revalidate(client, url, etag):
+    return client.get(url, headers={"If-None-Match": etag})
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+# Test that an unchanged page is answered with a 304, without any database query
+def test_not_modified(user_client):
+    response = user_client.get("/user/")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    counter = QueryCounter()
+    event.listen(db.engine, "before_cursor_execute", counter)
+    try:
+        response = revalidate(user_client, "/user/", etag)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", counter)
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert counter.count == 0
+
+    # Other pages have other ETags
+    assert user_client.get("/user/free").headers["ETag"] != etag
+    assert user_client.get("/myevents/").status_code == 200
+
+
+def test_versions_change_the_etag(user_client):
+    etag = user_client.get("/myevents/").headers["ETag"]
+    commit_change("ratings")
+    response = revalidate(user_client, "/myevents/", etag)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert revalidate(user_client, "/myevents/", etag).status_code == 304
+
+    # The versions are the ids of the changes
+    commit_change("registrations", "conditional_user")
+    assert get_registration_version("conditional_user") == get_catalog_version()
+    assert get_catalog_version() == ChangeLog.query.order_by(ChangeLog.id.desc()).first().id
+    assert revalidate(user_client, "/myevents/", etag).status_code == 200
+
+
+# Test that a restarted worker, whose versions start over, still rejects the ETags of stale pages
+def test_versions_survive_restart(user_client, monkeypatch):
+    stale_etag = user_client.get("/myevents/").headers["ETag"]
+    commit_change("ratings")
+
+    # The worker restarts, its caches are built from the database
+    monkeypatch.setattr("app.cache._catalog_version", 0)
+    monkeypatch.setattr("app.cache._registration_versions", {})
+    advance_catalog_version(get_last_change_id())
+    response = revalidate(user_client, "/myevents/", stale_etag)
+    assert response.status_code == 200
+    assert revalidate(user_client, "/myevents/", response.headers["ETag"]).status_code == 304
+
+
+def test_session_and_time(user_client, monkeypatch):
+    etag = user_client.get("/user/").headers["ETag"]
+    with user_client.session_transaction() as session:
+        session["toggle_value"] = True
+    assert revalidate(user_client, "/user/", etag).status_code == 200
+
+    # The listings expire with the time bucket, whatever the filter: they show the counts of
+    # today's and past events
+    now = 1_000_000 * ETAG_TIME_BUCKET
+    monkeypatch.setattr("app.conditional.time.time", lambda: now)
+    urls = ["/user/today", "/user/", "/myevents/"]
+    etags = [user_client.get(url).headers["ETag"] for url in urls]
+    for url, etag in zip(urls, etags):
+        assert revalidate(user_client, url, etag).status_code == 304
+    now += ETAG_TIME_BUCKET
+    for url, etag in zip(urls, etags):
+        assert revalidate(user_client, url, etag).status_code == 200
+
+
+# Test that pending flashed messages are always rendered
+def test_flashes_skip_the_cache(user_client):
+    etag = user_client.get("/user/").headers["ETag"]
+    with user_client.session_transaction() as session:
+        session["_flashes"] = [("primary", "Registered!")]
+    response = revalidate(user_client, "/user/", etag)
+    assert response.status_code == 200
+    assert b"Registered!" in response.data
+    assert revalidate(user_client, "/user/", etag).status_code == 304
+
+
+def test_organizer_page(organizer_client):
+    etag = organizer_client.get("/organizer").headers["ETag"]
+    assert revalidate(organizer_client, "/organizer", etag).status_code == 304
@@ -0,0 +1,65 @@
+import pytest
+import sqlite3
+from flask import Flask
+from sqlalchemy import text
+from app.main import db
+from app.database import EventDetails
+from app.db_profiles import init_database
+from app.globals import SQLITE_BUSY_TIMEOUT
+
+
+def create_profile_app(tmp_path, profile):
+    profile_app = Flask(__name__)
+    profile_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path.joinpath('profile.db')}"
+    init_database(profile_app, db, profile)
+    return profile_app
+
+
+def pragma(name):
+    return db.session.execute(text(f"PRAGMA {name}")).scalar()
+
+
+# Test that every connection of the production profile is tuned
+def test_production_profile(tmp_path):
+    profile_app = create_profile_app(tmp_path, "production")
+    with profile_app.app_context():
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 1
+        assert pragma("busy_timeout") == SQLITE_BUSY_TIMEOUT
+        assert pragma("temp_store") == 2
+        assert pragma("cache_size") < 0
+        assert db.engine.pool.size() > 1
+        db.engine.dispose()
+
+
+def test_default_profile(tmp_path):
+    profile_app = create_profile_app(tmp_path, "default")
+    with profile_app.app_context():
+        assert pragma("journal_mode") == "delete"
+        assert profile_app.config["DB_PROFILE"] == "default"
+        db.engine.dispose()
+
+    with pytest.raises(ValueError):
+        create_profile_app(tmp_path, "fast")
+
+
+# Test that the readers of the production profile don't wait for a write in progress
+def test_reads_during_write(tmp_path):
+    profile_app = create_profile_app(tmp_path, "production")
+    with profile_app.app_context():
+        db.create_all()
+        db.session.add(EventDetails(name="Committed Event"))
+        db.session.commit()
+
+        # Another worker in the middle of committing a write holds the exclusive lock
+        writer = sqlite3.connect(tmp_path.joinpath("profile.db"), isolation_level=None)
+        writer.execute("BEGIN EXCLUSIVE")
+        writer.execute("INSERT INTO event_details (name) VALUES ('Uncommitted Event')")
+        try:
+            names = db.session.execute(text("SELECT name FROM event_details")).scalars().all()
+            assert names == ["Committed Event"]
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+            db.session.remove()
+            db.engine.dispose()
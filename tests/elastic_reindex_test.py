@@ -0,0 +1,75 @@
+import pytest
+from pathlib import Path
+from elasticsearch import helpers
+from app.main import app, db
+from app.database import EventDetails
+from app.elastic import reindex_events, EVENTS_ALIAS
+from tests.fake_elasticsearch import make_fake_elasticsearch
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def indexed_events(client):
+    # Events are removed again so that the event ids expected by the other tests are unchanged
+    events = [EventDetails(name=f"Reindex Event {number}") for number in range(7)]
+    db.session.add_all(events)
+    db.session.commit()
+    yield events
+    for event in events:
+        db.session.delete(event)
+    db.session.commit()
+
+
+# Test that the events are sent in bulk chunks and the alias is swapped to the new index
+def test_reindex_with_alias_swap(indexed_events):
+    es, cluster = make_fake_elasticsearch()
+
+    first_index = reindex_events(es, chunk_size=3)
+    assert cluster.aliases[EVENTS_ALIAS] == {first_index}
+    documents = cluster.indices[first_index]
+    for event in indexed_events:
+        assert documents[str(event.id)]["name"] == event.name
+    assert cluster.requests.count(("PUT", f"/{first_index}/_doc")) == 0
+    assert cluster.requests.count(("PUT", "/_bulk")) + cluster.requests.count(("POST", "/_bulk")) == -(-len(documents) // 3)
+
+    # A second reindex replaces the old index without the alias ever being empty
+    second_index = reindex_events(es)
+    assert second_index != first_index
+    assert cluster.aliases[EVENTS_ALIAS] == {second_index}
+    assert first_index not in cluster.indices
+
+
+# Test that an old concrete "events" index is replaced in the same atomic alias update
+def test_reindex_replaces_legacy_index(indexed_events):
+    es, cluster = make_fake_elasticsearch()
+    cluster.indices[EVENTS_ALIAS] = {"junk": {}}
+
+    new_index = reindex_events(es)
+    assert EVENTS_ALIAS not in cluster.indices
+    assert cluster.aliases[EVENTS_ALIAS] == {new_index}
+
+
+# Test that a failed reindex keeps serving the previous index
+def test_failed_reindex_keeps_live_index(indexed_events):
+    es, cluster = make_fake_elasticsearch()
+    live_index = reindex_events(es)
+
+    cluster.bulk_item_status = 400
+    with pytest.raises(helpers.BulkIndexError):
+        reindex_events(es)
+    assert cluster.aliases[EVENTS_ALIAS] == {live_index}
+    assert list(cluster.indices) == [live_index]
@@ -0,0 +1,109 @@
+import pytest
+from pathlib import Path
+from datetime import date, time, timedelta
+from sqlalchemy import event as sqlalchemy_event
+from app.main import app, db
+from app.globals import Role
+from app.database import Credentials, EventDetails, EventRegistration, EventRating
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def user_client(client):
+    user = Credentials(username="event_page_user", role=Role.USER.value, name="Event Page User")
+    upcoming = EventDetails(name="Upcoming Page Event", image="placeholder.png",
+                            start_date=date.today() + timedelta(days=3), start_time=time(9, 0),
+                            end_date=date.today() + timedelta(days=3), end_time=time(10, 0))
+    past = EventDetails(name="Past Page Event", image="placeholder.png",
+                        start_date=date.today() - timedelta(days=3), start_time=time(9, 0),
+                        end_date=date.today() - timedelta(days=3), end_time=time(10, 0))
+    db.session.add_all([user, upcoming, past])
+    db.session.commit()
+    with client.session_transaction() as session:
+        session["_user_id"] = user.username
+
+    yield client, upcoming.id, past.id
+
+    for model in [EventRating, EventRegistration]:
+        model.query.filter_by(attendee_username=user.username).delete()
+    for row in [user, upcoming, past]:
+        db.session.delete(row)
+    db.session.commit()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        sqlalchemy_event.listen(db.engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc_info):
+        sqlalchemy_event.remove(db.engine, "before_cursor_execute", self)
+
+
+# Test that the event page loads the event, the registration and the rating in one query
+def test_event_page_single_query(user_client):
+    client, upcoming_id, _ = user_client
+    # The first request also loads the logged in user
+    assert client.get(f"/events/{upcoming_id}").status_code == 200
+
+    with QueryCounter() as counter:
+        response = client.get(f"/events/{upcoming_id}")
+    assert response.status_code == 200
+    assert b"Upcoming Page Event" in response.data
+    assert len(counter.statements) == 1
+
+    assert client.get("/events/987654").status_code == 404
+
+
+def test_register_and_cancel(user_client):
+    client, upcoming_id, past_id = user_client
+    response = client.post(f"/events/register/{upcoming_id}", follow_redirects=True)
+    assert response.status_code == 200
+    assert b"You are registered for the event!" in response.data
+    assert EventRegistration.query.filter_by(attendee_username="event_page_user", event_id=upcoming_id).count() == 1
+
+    response = client.post(f"/events/register/{upcoming_id}", follow_redirects=True)
+    assert b"Cancelled registration for the event!" in response.data
+    assert EventRegistration.query.filter_by(attendee_username="event_page_user", event_id=upcoming_id).count() == 0
+
+    assert client.post(f"/events/register/{past_id}").status_code == 401
+    assert client.post("/events/register/987654").status_code == 404
+
+
+# Test that the rating is saved for the checked event, whatever event the form names
+def test_submit_rating(user_client):
+    client, upcoming_id, past_id = user_client
+    assert client.post(f"/events/submit_rating/{past_id}", data={"rating": "4"}).status_code == 401
+
+    db.session.add(EventRegistration(attendee_username="event_page_user", event_id=past_id))
+    db.session.commit()
+    response = client.post(f"/events/submit_rating/{past_id}", data={"rating": "4", "event_id": str(upcoming_id)})
+    assert response.status_code == 302
+    assert EventRating.query.filter_by(attendee_username="event_page_user", event_id=past_id).one().rating == 4
+    assert EventRating.query.filter_by(attendee_username="event_page_user", event_id=upcoming_id).count() == 0
+
+    # The previous rating is updated and shown
+    client.post(f"/events/submit_rating/{past_id}", data={"rating": "2"})
+    assert EventRating.query.filter_by(attendee_username="event_page_user", event_id=past_id).one().rating == 2
+    response = client.get(f"/events/{past_id}")
+    assert b"This is a past event!" in response.data
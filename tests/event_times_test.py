@@ -0,0 +1,173 @@
+import threading
+
+import pytest
+from pathlib import Path
+from datetime import date, datetime, time, timedelta
+from flask import Flask
+from sqlalchemy import insert, text
+from app.main import app, db
+from app.autocomplete import AutocompleteTrie, refresh_event_in_autocomplete, rescore_started_events, score_event
+from app.database import EventDetails
+from app.filter import EventFilterBuilder
+from app.migrations import MIGRATIONS, get_schema_version, migrate, backfill_event_times
+
+TEST_DB = "test.db"
+
+DAY = date(2031, 3, 10)
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+def query_plan(query):
+    statement = query.statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+    return " ".join(row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {statement}")))
+
+
+# Test that starts_at and ends_at follow the dates and times on every write
+def test_times_are_synced(client):
+    event = EventDetails(name="Synced Event", start_date=DAY, start_time=time(18, 30), end_time=time(20, 0))
+    db.session.add(event)
+    db.session.commit()
+    try:
+        assert event.starts_at == datetime(2031, 3, 10, 18, 30)
+        assert event.ends_at == datetime(2031, 3, 10, 20, 0)
+
+        # Without times the event lasts its whole days
+        event.start_time, event.end_time, event.end_date = None, None, DAY + timedelta(days=2)
+        db.session.commit()
+        assert event.starts_at == datetime(2031, 3, 10)
+        assert event.ends_at == datetime.combine(DAY + timedelta(days=2), time.max)
+
+        event.start_date = None
+        event.end_date = None
+        db.session.commit()
+        assert event.starts_at is None and event.ends_at is None
+    finally:
+        db.session.delete(event)
+        db.session.commit()
+
+
+# Test that the events written without the ORM are backfilled
+def test_backfill(client):
+    db.session.execute(insert(EventDetails), [
+        {"name": "Bulk Event 1", "start_date": DAY, "start_time": time(9, 0)},
+        {"name": "Bulk Event 2", "start_date": DAY, "end_date": DAY + timedelta(days=1)},
+        {"name": "Bulk Event 3"},
+    ])
+    db.session.commit()
+    events = EventDetails.query.filter(EventDetails.name.like("Bulk Event %")).order_by(EventDetails.id).all()
+    try:
+        assert backfill_event_times(batch_size=1) == 2
+        assert backfill_event_times() == 0
+        db.session.expire_all()
+        assert [(event.starts_at, event.ends_at) for event in events] == [
+            (datetime(2031, 3, 10, 9, 0), datetime.combine(DAY, time.max)),
+            (datetime(2031, 3, 10), datetime.combine(DAY + timedelta(days=1), time.max)),
+            (None, None),
+        ]
+    finally:
+        for event in events:
+            db.session.delete(event)
+        db.session.commit()
+
+
+# Test that a database created before starts_at/ends_at existed gets the columns
+def test_add_columns_to_existing_database():
+    legacy_app = Flask(__name__)
+    legacy_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(legacy_app)
+    with legacy_app.app_context():
+        db.session.execute(text("CREATE TABLE event_details (id INTEGER PRIMARY KEY, name VARCHAR(150), "
+                                "start_date DATE, start_time TIME, end_date DATE, end_time TIME, organizer VARCHAR(150), "
+                                "max_capacity INTEGER, current_capacity INTEGER)"))
+        db.session.execute(text("CREATE INDEX ix_event_details_start_date ON event_details (start_date)"))
+        db.session.execute(text("INSERT INTO event_details (name, start_date, start_time) "
+                                "VALUES ('Legacy Event', '2031-03-10', '09:00:00.000000')"))
+        db.session.commit()
+
+        # As at startup, create_all leaves the existing table alone
+        db.create_all()
+        assert "fill_event_times" in migrate()
+        assert backfill_event_times() == 0
+        assert db.session.execute(text("SELECT starts_at FROM event_details")).scalar() == "2031-03-10 09:00:00.000000"
+        indexes = db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars().all()
+        assert "ix_event_details_start_date" not in indexes
+
+
+# Test that workers starting together apply every migration once
+def test_concurrent_migrate(tmp_path):
+    legacy_app = Flask(__name__)
+    legacy_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'legacy.db'}"
+    db.init_app(legacy_app)
+    with legacy_app.app_context():
+        db.session.execute(text("CREATE TABLE event_details (id INTEGER PRIMARY KEY, name VARCHAR(150), "
+                                "start_date DATE, start_time TIME, end_date DATE, end_time TIME, organizer VARCHAR(150), "
+                                "max_capacity INTEGER, current_capacity INTEGER)"))
+        db.session.execute(text("INSERT INTO event_details (name, start_date, start_time) "
+                                "VALUES ('Legacy Event', '2031-03-10', '09:00:00.000000')"))
+        db.session.commit()
+        db.create_all()
+
+    start = threading.Barrier(4)
+    applied, errors = [], []
+
+    def worker():
+        with legacy_app.app_context():
+            start.wait()
+            try:
+                applied.extend(migrate())
+            except Exception as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(applied) == sorted(migration.__name__ for migration in MIGRATIONS)
+    with legacy_app.app_context():
+        assert get_schema_version() == len(MIGRATIONS)
+        assert db.session.execute(text("SELECT starts_at FROM event_details")).scalar() == "2031-03-10 09:00:00.000000"
+
+
+# Test that autocomplete ranks an event without a start time as started at midnight
+def test_autocomplete_past_without_start_time(client):
+    today = date.today()
+    event = EventDetails(name="Midnight Event", start_date=today)
+    db.session.add(event)
+    db.session.commit()
+    try:
+        trie = AutocompleteTrie()
+        refresh_event_in_autocomplete(trie, event.id)
+        assert trie.entries[event.id] == ("Midnight Event", score_event(0, is_past_event=True))
+
+        # Scored before midnight, the rescore notices the event started since
+        trie.upsert(event.id, event.name, score_event(0, is_past_event=False))
+        trie.scored_at = datetime.combine(today, time.min) - timedelta(minutes=1)
+        rescore_started_events(trie)
+        assert trie.entries[event.id] == ("Midnight Event", score_event(0, is_past_event=True))
+    finally:
+        db.session.delete(event)
+        db.session.commit()
+
+
+# Test that the time filters are range scans of the starts_at indexes
+def test_time_filters_use_indexes(client):
+    assert "ix_event_details_starts_at" in query_plan(EventFilterBuilder().past(datetime(2031, 3, 10, 12, 0)).query)
+    assert "ix_event_details_starts_at" in query_plan(EventFilterBuilder().today(DAY).query)
+
+    upcoming = EventDetails.query.filter_by(organizer="someone").filter(EventDetails.starts_at >= datetime(2031, 3, 10))
+    assert "ix_event_details_organizer_starts_at" in query_plan(upcoming)
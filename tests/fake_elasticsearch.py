@@ -0,0 +1,165 @@
+import json
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from elasticsearch import Elasticsearch
+from elastic_transport import BaseNode, ApiResponseMeta, HttpHeaders
+
+from app.fuzzy import FuzzyEventIndex
+
+# A local fake of the handful of elasticsearch endpoints the app uses
+# It plugs in at the transport level (node_class), so the real client, helpers and
+# serializers are exercised without a running cluster
+
+FakeNodeResponse = namedtuple("FakeNodeResponse", ["meta", "body"])
+
+
+class FakeCluster:
+    def __init__(self):
+        # index name -> {document id: document}
+        self.indices = {}
+        # alias name -> set of index names
+        self.aliases = {}
+        # (method, path) of every request received
+        self.requests = []
+        # Status returned for every item of a bulk request, set to simulate failures
+        self.bulk_item_status = 201
+        # Search engine over the documents, rebuilt after any write
+        self.documents = {}
+        self.engine = None
+        self.engine_key = None
+        self.num_writes = 0
+
+    def resolve(self, name):
+        return sorted(self.aliases.get(name, {name} if name in self.indices else set()))
+
+    def handle(self, method, path, body):
+        self.requests.append((method, path))
+        parts = [part for part in path.split("/") if part]
+        if method not in ("GET", "HEAD") and parts[-1:] != ["_search"]:
+            self.num_writes += 1
+
+        if parts == ["_bulk"]:
+            return self.bulk(body)
+        if parts == ["_aliases"] and method in ("POST", "PUT"):
+            return self.update_aliases(json.loads(body))
+        if len(parts) == 2 and parts[0] == "_alias":
+            found = {index: {"aliases": {parts[1]: {}}} for index in sorted(self.aliases.get(parts[1], ()))}
+            return (200, found) if found else (404, {"error": "alias missing", "status": 404})
+        if len(parts) == 2 and parts[1] == "_search":
+            return self.search(parts[0], json.loads(body))
+        if len(parts) == 2 and parts[1] == "_refresh":
+            return 200, {"_shards": {"failed": 0}}
+        if len(parts) == 3 and parts[1] == "_doc":
+            indices = self.resolve(parts[0])
+            if not indices:
+                return 404, {"error": "index_not_found_exception", "status": 404}
+            if method == "DELETE":
+                removed = self.indices[indices[0]].pop(parts[2], None)
+                return (200 if removed else 404), {"result": "deleted" if removed else "not_found"}
+            self.indices[indices[0]][parts[2]] = json.loads(body)
+            return 200, {"result": "updated"}
+        if len(parts) == 1:
+            name = parts[0]
+            if method == "HEAD":
+                return (200 if self.resolve(name) else 404), None
+            if method == "PUT":
+                if name in self.indices:
+                    return 400, {"error": "resource_already_exists_exception", "status": 400}
+                self.indices[name] = {}
+                return 200, {"acknowledged": True, "index": name}
+            if method == "DELETE":
+                if name not in self.indices:
+                    return 404, {"error": "index_not_found_exception", "status": 404}
+                del self.indices[name]
+                for members in self.aliases.values():
+                    members.discard(name)
+                return 200, {"acknowledged": True}
+
+        return 400, {"error": f"unsupported request {method} {path}", "status": 400}
+
+    def bulk(self, body):
+        lines = [json.loads(line) for line in body.decode().splitlines() if line.strip()]
+        items = []
+        position = 0
+        while position < len(lines):
+            (op_type, meta), = lines[position].items()
+            position += 1
+            # Writes through an alias go to the index behind it
+            index = (self.resolve(meta["_index"]) or [meta["_index"]])[0]
+            item = {"_index": index, "_id": meta["_id"], "status": self.bulk_item_status}
+            if op_type == "delete":
+                found = self.indices.get(index, {}).pop(meta["_id"], None)
+                if found is None and self.bulk_item_status < 300:
+                    item["status"] = 404
+            else:
+                if self.bulk_item_status < 300:
+                    self.indices.setdefault(index, {})[meta["_id"]] = lines[position]
+                else:
+                    item["error"] = {"type": "mapper_parsing_exception"}
+                position += 1
+            items.append({op_type: item})
+        errors = any(item[op]["status"] >= 300 for item in items for op in item)
+        return 200, {"took": 1, "errors": errors, "items": items}
+
+    def search(self, name, body):
+        # Only the fuzzy span_near query of the app is supported, it is answered by the
+        # in-memory engine that emulates it
+        indices = self.resolve(name)
+        if not indices:
+            return 404, {"error": "index_not_found_exception", "status": 404}
+        clauses = body["query"]["bool"]["must"][0]["span_near"]["clauses"]
+        query = " ".join(clause["span_multi"]["match"]["fuzzy"]["name"]["value"] for clause in clauses)
+
+        if self.engine_key != (tuple(indices), self.num_writes):
+            self.documents = {}
+            for index in indices:
+                self.documents.update(self.indices[index])
+            self.engine = FuzzyEventIndex()
+            self.engine.build((int(doc_id), document["name"]) for doc_id, document in self.documents.items())
+            self.engine_key = (tuple(indices), self.num_writes)
+        results = self.engine.search(query, limit=body.get("size", 10))
+
+        hits = [
+            {"_index": indices[0], "_id": str(event_id), "_source": self.documents[str(event_id)]}
+            for _, event_id in results
+        ]
+        return 200, {"took": 1, "timed_out": False, "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}}
+
+    def update_aliases(self, body):
+        # All actions are applied together, like the real _aliases endpoint
+        aliases = {name: set(members) for name, members in self.aliases.items()}
+        indices = dict(self.indices)
+        for action in body["actions"]:
+            (kind, spec), = action.items()
+            if kind == "add":
+                aliases.setdefault(spec["alias"], set()).add(spec["index"])
+            elif kind == "remove":
+                aliases.get(spec["alias"], set()).discard(spec["index"])
+            elif kind == "remove_index":
+                indices.pop(spec["index"], None)
+        self.aliases = {name: members for name, members in aliases.items() if members}
+        self.indices = indices
+        return 200, {"acknowledged": True}
+
+
+class FakeElasticsearchNode(BaseNode):
+    # The cluster is shared by every node instance the transport creates
+    cluster = None
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        status, data = self.cluster.handle(method, urlsplit(target).path, body)
+        response_headers = HttpHeaders({
+            "x-elastic-product": "Elasticsearch",
+            "content-type": "application/json",
+        })
+        meta = ApiResponseMeta(
+            status=status, http_version="1.1", headers=response_headers, duration=0.0, node=self.config
+        )
+        return FakeNodeResponse(meta, b"" if data is None else json.dumps(data).encode())
+
+
+def make_fake_elasticsearch(cluster=None):
+    cluster = cluster or FakeCluster()
+    node_class = type("BoundFakeElasticsearchNode", (FakeElasticsearchNode,), {"cluster": cluster})
+    return Elasticsearch("http://fake-elasticsearch:9200", node_class=node_class), cluster
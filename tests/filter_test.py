@@ -0,0 +1,83 @@
+import pytest
+from pathlib import Path
+from datetime import date, datetime, time, timedelta
+from app.main import app, db
+from app.database import EventDetails
+from app.filter import EventFilterBuilder, is_valid_filter_tag
+
+TEST_DB = "test.db"
+
+TODAY = date(2030, 5, 15)
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def listed_events(client):
+    # Events are removed again so that the event ids expected by the other tests are unchanged
+    events = [
+        EventDetails(name="Filter Concert", is_online=0, ticket_price=0.0, category="music",
+                     start_date=TODAY, start_time=time(9, 0)),
+        EventDetails(name="Filter Lecture", is_online=1, ticket_price=10.0, category="academic",
+                     start_date=TODAY - timedelta(days=1), start_time=time(18, 0)),
+        EventDetails(name="Filter Jam", is_online=None, ticket_price=None, category="music",
+                     start_date=TODAY + timedelta(days=1), start_time=time(9, 0)),
+    ]
+    db.session.add_all(events)
+    db.session.commit()
+    yield events
+    for event in events:
+        db.session.delete(event)
+    db.session.commit()
+
+
+def names(builder):
+    return [event.name for event in builder.all()]
+
+
+def only(events):
+    # A builder restricted to the test events, whatever else is in the database
+    return EventFilterBuilder().event_ids([event.id for event in events])
+
+
+def test_filters(listed_events):
+    assert names(only(listed_events).in_person()) == ["Filter Concert", "Filter Jam"]
+    assert names(only(listed_events).free()) == ["Filter Concert", "Filter Jam"]
+    assert names(only(listed_events).today(TODAY)) == ["Filter Concert"]
+    assert names(only(listed_events).category("music")) == ["Filter Concert", "Filter Jam"]
+
+    # Past events are compared on the date and then the start time
+    assert names(only(listed_events).past(datetime.combine(TODAY, time(8, 0)))) == ["Filter Lecture"]
+    assert names(only(listed_events).past(datetime.combine(TODAY, time(12, 0)))) == ["Filter Concert", "Filter Lecture"]
+
+
+def test_filters_compose(listed_events):
+    assert names(only(listed_events).category("music").free().today(TODAY)) == ["Filter Concert"]
+    assert names(only(listed_events).filter_tag("academic").in_person()) == []
+    assert names(only(listed_events).filter_tag("all")) == ["Filter Concert", "Filter Lecture", "Filter Jam"]
+
+
+# Test that search results keep the order of the ids
+def test_event_ids_order(listed_events):
+    concert, lecture, jam = listed_events
+    builder = EventFilterBuilder().event_ids([jam.id, concert.id])
+    assert names(builder) == ["Filter Jam", "Filter Concert"]
+    assert names(EventFilterBuilder().event_ids([])) == []
+
+
+def test_is_valid_filter_tag():
+    assert is_valid_filter_tag("all")
+    assert is_valid_filter_tag("past events")
+    assert is_valid_filter_tag("nightlife")
+    assert not is_valid_filter_tag("nonsense")
@@ -0,0 +1,83 @@
+import pytest
+from pathlib import Path
+from app.main import app, db
+from app.globals import Role
+from app.database import Credentials, EventDetails
+from app.cache import card_cache
+from app.fragments import render_event_card
+from app.invalidation import publish_change
+from app.projections import EventCard
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def card_event(client):
+    event = EventDetails(name="Fragment Fest", short_description="Cards all night", image="placeholder.png")
+    db.session.add(event)
+    db.session.commit()
+    publish_change("events", event.id, event=event)
+    yield event
+    event_id = event.id
+    db.session.delete(event)
+    db.session.commit()
+    publish_change("events", event_id)
+
+
+def card_row(event):
+    return EventCard(event.id, event.name, event.short_description, event.image, event.start_date, event.start_time,
+                     event.starts_at)
+
+
+# Test that a card is rendered once per version of the event
+def test_card_cache(card_event):
+    with app.test_request_context():
+        hits = card_cache.hits
+        card = render_event_card(card_row(card_event))
+        assert f'href="/events/{card_event.id}"' in card
+        assert "Fragment Fest" in card
+        assert render_event_card(card_row(card_event)) is card
+        assert card_cache.hits == hits + 1
+
+        # Organizer cards are cached separately
+        admin_card = render_event_card(card_row(card_event), admin=True)
+        assert f'href="/events/admin/{card_event.id}"' in admin_card
+
+        # An event write renders the card again
+        card_event.name = "Fragment Festival"
+        db.session.commit()
+        publish_change("events", card_event.id, event=card_event)
+        assert "Fragment Festival" in render_event_card(card_row(card_event))
+
+
+# Test that the listing pages join the cached cards
+def test_listing_uses_cached_cards(client, card_event):
+    user = Credentials(username="fragment_user", role=Role.USER.value, name="Fragment User")
+    db.session.add(user)
+    db.session.commit()
+    with client.session_transaction() as session:
+        session["_user_id"] = user.username
+
+    try:
+        first = client.get("/user/")
+        assert b"Fragment Fest" in first.data
+        hits = card_cache.hits
+        second = client.get("/user/")
+        assert second.data == first.data
+        assert card_cache.hits > hits
+    finally:
+        db.session.delete(user)
+        db.session.commit()
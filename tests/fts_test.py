@@ -0,0 +1,86 @@
+import pytest
+from pathlib import Path
+from sqlalchemy import text
+from app.main import app, db
+from app.database import EventDetails
+from app.fts import create_fts_index, build_fts_match_expression, get_eventids_matching_fts_query
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        create_fts_index()
+        yield app.test_client()
+
+
+@pytest.fixture
+def fts_events(client):
+    # Events are removed again so that the event ids expected by the other tests are unchanged
+    events = [
+        EventDetails(name="Robotics Club Meetup", short_description="Build robots", venue="Bahen"),
+        EventDetails(name="Jazz Night", short_description="Live robotics themed jazz", venue="Hart House"),
+        EventDetails(name="Career Fair", short_description="Meet employers", venue="Myhal",
+                     additional_info="Bring your robotics portfolio"),
+    ]
+    db.session.add_all(events)
+    db.session.commit()
+    yield events
+    for event in events:
+        db.session.delete(event)
+    db.session.commit()
+
+
+def test_match_expression_quotes_user_input():
+    assert build_fts_match_expression('Jazz "NIGHT" OR') == '"jazz"* "night"* "or"*'
+    assert build_fts_match_expression("  ") == ""
+
+
+# Test that all mirrored columns are searched and name matches are ranked first
+def test_fts_ranking(fts_events):
+    robotics, jazz, career = fts_events
+    assert get_eventids_matching_fts_query("robotics") == [robotics.id, jazz.id, career.id]
+    assert get_eventids_matching_fts_query("robo", limit=1) == [robotics.id]
+    assert get_eventids_matching_fts_query("jazz hart") == [jazz.id]
+
+
+# Test that the triggers keep the FTS table in sync with event_details
+def test_fts_triggers(fts_events):
+    robotics, jazz, career = fts_events
+
+    jazz.name = "Blues Night"
+    db.session.commit()
+    assert get_eventids_matching_fts_query("jazz") == [jazz.id]
+    assert get_eventids_matching_fts_query("blues") == [jazz.id]
+
+    db.session.delete(career)
+    db.session.commit()
+    fts_events.remove(career)
+    assert get_eventids_matching_fts_query("myhal") == []
+
+
+# Test that the update trigger of an existing database is limited to the mirrored columns
+def test_update_trigger_columns(client):
+    def update_trigger():
+        return db.session.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'event_details_fts_au'"
+        )).scalar()
+
+    assert "AFTER UPDATE OF name, short_description, venue, additional_info ON event_details" in update_trigger()
+
+    # The trigger as created by the previous versions fired on every update
+    db.session.execute(text("DROP TRIGGER event_details_fts_au"))
+    db.session.execute(text(
+        "CREATE TRIGGER event_details_fts_au AFTER UPDATE ON event_details BEGIN SELECT 1; END"
+    ))
+    db.session.commit()
+    create_fts_index()
+    assert "AFTER UPDATE OF name, short_description, venue, additional_info ON event_details" in update_trigger()
@@ -0,0 +1,69 @@
+from app.fuzzy import FuzzyEventIndex, auto_fuzziness, edit_distance
+
+
+def make_index():
+    index = FuzzyEventIndex()
+    index.build([
+        (1, "Jazz Night"),
+        (2, "Night of Jazz"),
+        (3, "Startup Pitch Night"),
+        (4, "Robotics Club Meetup"),
+        (5, "AI Talk"),
+    ])
+    return index
+
+
+def test_auto_fuzziness():
+    assert [auto_fuzziness(term) for term in ["ai", "jazz", "robotics"]] == [0, 1, 2]
+
+
+def test_edit_distance():
+    assert edit_distance("night", "nigth", 2) == 1
+    assert edit_distance("robotics", "robtoics", 2) == 1
+    assert edit_distance("meetup", "meetng", 2) == 2
+    assert edit_distance("meetup", "meeting", 2) == 3
+    assert edit_distance("jazz", "robotics", 2) == 3
+
+
+# Test that typos within the AUTO edit distance still match
+def test_fuzzy_terms():
+    index = make_index()
+    assert index.search("jaz") == [["Jazz Night", 1], ["Night of Jazz", 2]]
+    assert index.search("robtoics") == [["Robotics Club Meetup", 4]]
+    assert index.search("meetng") == [["Robotics Club Meetup", 4]]
+    assert index.search("ai") == [["AI Talk", 5]]
+    assert index.search("aj") == []
+    assert index.search("") == []
+
+
+# Test the unordered span_near semantics: all tokens adjacent, in any order
+def test_span_near_semantics():
+    index = make_index()
+    assert index.search("jazz night") == [["Jazz Night", 1]]
+    assert index.search("night jazz") == [["Jazz Night", 1]]
+    assert index.search("pitch startup") == [["Startup Pitch Night", 3]]
+    # "startup" and "night" are not adjacent
+    assert index.search("startup night") == []
+    # A single term can't match two tokens
+    assert index.search("jazz jazz") == []
+
+
+# Test that exact matches rank above typos and the limit is applied
+def test_ranking_and_limit():
+    index = make_index()
+    index.add(6, "Jazz Knight")
+    assert index.search("jazz night") == [["Jazz Night", 1], ["Jazz Knight", 6]]
+    assert index.search("knight jazz") == [["Jazz Knight", 6], ["Jazz Night", 1]]
+    assert index.search("night", limit=2) == [["Jazz Night", 1], ["Night of Jazz", 2]]
+
+
+def test_add_remove():
+    index = make_index()
+    index.add(1, "Blues Evening")
+    assert index.search("jazz") == [["Night of Jazz", 2]]
+    assert index.search("blues") == [["Blues Evening", 1]]
+
+    index.remove(2)
+    assert index.search("jazz") == []
+    assert "jazz" not in index.postings
+    assert all("jazz" not in terms for buckets in index.deletes.values() for terms in buckets.values())
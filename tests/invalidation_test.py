@@ -0,0 +1,234 @@
+import pytest
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import func
+from app.main import app, db
+from app.globals import Role, SQLITE_POOL_SIZE
+from app.database import ChangeLog, Credentials, EventDetails
+from app.cache import (
+    get_catalog_version,
+    get_catalog_content_version,
+    get_registration_version,
+    user_cache,
+    organizer_name_cache,
+    chart_cache,
+)
+from app.bitmap import event_bitmaps
+from app.db_profiles import init_database
+from app.search_backends import get_search_backend
+from app import invalidation
+from app.invalidation import (
+    ChangeWatcher,
+    record_change,
+    publish_change,
+    get_origin,
+    get_last_change_id,
+    prune_changes,
+    CHANGE_LOG_RETENTION,
+)
+
+TEST_DB = "test.db"
+
+OTHER_WORKER = "other-host:1234:cafe"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        first_id = db.session.query(func.max(ChangeLog.id)).scalar() or 0
+        yield app.test_client()
+        # Leave the shared test database the way we found it
+        ChangeLog.query.filter(ChangeLog.id > first_id).delete()
+        db.session.commit()
+
+
+@pytest.fixture
+def watcher(client, monkeypatch):
+    # The watcher of the app is paused, the tests poll their own
+    monkeypatch.setattr(invalidation.change_watcher, "poll", lambda: 0)
+    watcher = ChangeWatcher(app, get_last_change_id())
+    assert watcher.poll() == 0
+    yield watcher
+    watcher.connection.close()
+    # The changes of the test are deleted, the app's watcher must not take them for pruned ones
+    invalidation.change_watcher.last_seen_id = get_last_change_id()
+
+
+def write_as_other_worker(topic, event_id=None, username=None):
+    # The other worker is another connection, possibly in another process
+    connection = sqlite3.connect(db.engine.url.database)
+    with connection:
+        connection.execute(
+            "INSERT INTO change_log (topic, event_id, username, origin, created_at) VALUES (?, ?, ?, ?, ?)",
+            (topic, event_id, username, OTHER_WORKER, datetime.now()),
+        )
+    connection.close()
+
+
+# Test that the events written by another worker are replayed into the local indexes
+def test_replay_event_changes(watcher):
+    event = EventDetails(name="Zanzibar Invalidation Gala", category="music", is_online=0)
+    db.session.add(event)
+    db.session.commit()
+    event_id = event.id
+    assert get_search_backend().search("zanzibar") == []
+
+    write_as_other_worker("events", event_id)
+    version = get_catalog_version()
+    assert watcher.poll() == 1
+    assert get_search_backend().search("zanzibar") == [event_id]
+    assert event_id in event_bitmaps.evaluate("in-person").to_list()
+    assert get_catalog_version() > version
+
+    # Nothing was committed since the last poll
+    assert watcher.poll() == 0
+
+    db.session.delete(event)
+    db.session.commit()
+    write_as_other_worker("events", event_id)
+    assert watcher.poll() == 1
+    assert get_search_backend().search("zanzibar") == []
+    assert event_id not in event_bitmaps.evaluate("in-person").to_list()
+
+
+def test_replay_user_and_registration_changes(watcher):
+    user_cache.set("invalidated_user", Credentials(username="invalidated_user", role=Role.USER.value))
+    organizer_name_cache.set("invalidated_user", "Old Name")
+    chart_cache.set(123456, ["chart"])
+    registration_version = get_registration_version("invalidated_user")
+
+    write_as_other_worker("registrations", 123456, "invalidated_user")
+    assert watcher.poll() == 1
+    assert chart_cache.get(123456) is None
+    assert get_registration_version("invalidated_user") > registration_version
+    assert user_cache.get("invalidated_user") is not None
+
+    # Repeated changes are replayed once
+    write_as_other_worker("users", username="invalidated_user")
+    write_as_other_worker("users", username="invalidated_user")
+    assert watcher.poll() == 2
+    assert user_cache.get("invalidated_user") is None
+    assert organizer_name_cache.get("invalidated_user") is None
+
+
+# Test that a worker doesn't replay its own changes, it invalidated its caches when publishing them
+def test_own_changes_are_skipped(watcher):
+    organizer_name_cache.set("own_change_user", "Name")
+    record_change("users", username="own_change_user")
+    db.session.commit()
+    assert ChangeLog.query.filter_by(username="own_change_user").one().origin == get_origin()
+
+    assert watcher.poll() == 1
+    assert organizer_name_cache.get("own_change_user") == "Name"
+    organizer_name_cache.discard("own_change_user")
+
+    with pytest.raises(ValueError):
+        record_change("tickets")
+
+
+# Test that a worker that missed pruned changes rebuilds its caches instead
+def test_missed_changes(watcher, monkeypatch):
+    rebuilds = []
+    monkeypatch.setattr("app.invalidation.rebuild_local_caches", lambda: rebuilds.append(True))
+
+    # Changes deleted by hand are not pruned changes, the older changes are still there
+    write_as_other_worker("ratings", 1, "someone")
+    assert watcher.poll() == 1
+    write_as_other_worker("ratings", 1, "someone")
+    write_as_other_worker("ratings", 1, "someone")
+    deleted = ChangeLog.query.filter(ChangeLog.id > watcher.last_seen_id).order_by(ChangeLog.id).first()
+    db.session.delete(deleted)
+    db.session.commit()
+    assert watcher.poll() == 1
+    assert rebuilds == []
+
+    # Ids are never reused, even once the latest changes were deleted
+    last_seen_id = watcher.last_seen_id
+    ChangeLog.query.filter(ChangeLog.id == last_seen_id).delete()
+    db.session.commit()
+    write_as_other_worker("ratings", 1, "someone")
+    assert ChangeLog.query.filter(ChangeLog.id > last_seen_id).one().id == last_seen_id + 1
+
+    # Everything up to the next change was pruned
+    watcher.last_seen_id = db.session.query(func.min(ChangeLog.id)).scalar() - 2
+    write_as_other_worker("ratings", 1, "someone")
+    assert watcher.poll() >= 1
+    assert rebuilds == [True]
+
+
+def test_prune_changes(watcher):
+    write_as_other_worker("ratings", 1, "someone")
+    change = ChangeLog.query.filter_by(origin=OTHER_WORKER).one()
+    assert prune_changes(now=change.created_at) == 0
+    assert prune_changes(now=change.created_at + CHANGE_LOG_RETENTION * 2) >= 1
+    assert ChangeLog.query.filter_by(origin=OTHER_WORKER).count() == 0
+
+
+# Test that only the event writes invalidate the cached search results
+def test_registrations_keep_search_results(client):
+    content_version = get_catalog_content_version()
+    publish_change("registrations", 123456, "search_cache_user")
+    publish_change("ratings", 123456, "search_cache_user")
+    assert get_catalog_content_version() == content_version
+
+    publish_change("events", 123456)
+    assert get_catalog_content_version() > content_version
+
+
+# Test that the requests waiting to poll don't hold the connections the poll needs
+def test_publish_with_busy_pool(tmp_path, monkeypatch):
+    pool_app = Flask(__name__)
+    pool_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path.joinpath('pool.db')}"
+    init_database(pool_app, db, "production")
+    with pool_app.app_context():
+        db.create_all()
+        watcher = ChangeWatcher(pool_app)
+        monkeypatch.setattr(invalidation, "change_watcher", watcher)
+        # Replaying an event change still looks the event up through the session of the poll
+        monkeypatch.setitem(invalidation.HANDLERS, "events", lambda event_id, username, event: None)
+
+        # As many threads as the connections of the pool and its overflow
+        num_threads = 2 * SQLITE_POOL_SIZE
+        committed = threading.Barrier(num_threads + 1)
+        errors = []
+
+        def write(number):
+            with pool_app.app_context():
+                try:
+                    db.session.add(ChangeLog(topic="events", event_id=number, origin=OTHER_WORKER))
+                    record_change("ratings", number, "pool_user")
+                    db.session.commit()
+                    # Reads through the session after the commit, as the handlers do
+                    db.session.get(EventDetails, number)
+                    committed.wait()
+                    publish_change("ratings", number, "pool_user")
+                except Exception as error:
+                    errors.append(error)
+
+        threads = [threading.Thread(target=write, args=(number,)) for number in range(num_threads)]
+        # The watcher thread polls while every request waits for it
+        with watcher.lock:
+            for thread in threads:
+                thread.start()
+            committed.wait()
+            time.sleep(0.2)
+            assert watcher._poll() == 2 * num_threads
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert watcher.last_seen_id == get_last_change_id()
+
+        watcher.connection.close()
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,127 @@
+import pytest
+from pathlib import Path
+from datetime import date, time
+from app.main import app, db
+from app.globals import Role
+from app.database import Credentials, EventDetails, EventRegistration
+from app.filter import EventFilterBuilder
+from app.pagination import encode_cursor, decode_cursor, get_events_page, get_ranked_page
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def paged_events(client):
+    # Events are removed again so that the event ids expected by the other tests are unchanged
+    day = date(2031, 3, 1)
+    events = [
+        EventDetails(name="Paged Event 1", category="music", start_date=day, start_time=time(18, 0)),
+        EventDetails(name="Paged Event 2", category="academic", start_date=day, start_time=time(9, 0)),
+        EventDetails(name="Paged Event 3", category="music", start_date=date(2031, 2, 1), start_time=time(23, 0)),
+        EventDetails(name="Paged Event 4", category="music", start_date=day, start_time=time(9, 0)),
+        EventDetails(name="Paged Event 5", category="academic"),
+        EventDetails(name="Paged Event 6", category="music", start_date=date(2031, 4, 1), start_time=time(0, 0)),
+        EventDetails(name="Paged Event 7", category="music", start_date=day, start_time=time(18, 0)),
+    ]
+    db.session.add_all(events)
+    db.session.commit()
+    yield events
+    for event in events:
+        db.session.delete(event)
+    db.session.commit()
+
+
+def paged_only():
+    # A filter restricted to the test events, whatever else is in the database
+    return EventFilterBuilder(EventDetails.query.filter(EventDetails.name.like("Paged Event%")))
+
+
+def all_pages(make_filter, search=None, page_size=3):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = get_events_page(make_filter, search, cursor, page_size)
+        pages.append([row.name[-1] for row in rows])
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    position = {"after": ["2031-03-01T09:00:00", 12]}
+    assert decode_cursor(encode_cursor(position)) == position
+    for token in ["not a cursor", encode_cursor([1, 2])]:
+        with pytest.raises(ValueError):
+            decode_cursor(token)
+
+
+# Test that the pages follow (starts_at, id), without gaps or repeats
+def test_keyset_pages(paged_events):
+    # Events without a date come first, ties on the start are broken by the id
+    assert all_pages(paged_only) == [["5", "3", "2"], ["4", "1", "7"], ["6"]]
+    assert all_pages(paged_only, page_size=7) == [["5", "3", "2", "4", "1", "7", "6"]]
+    # A page can start after an event without a date
+    assert all_pages(paged_only, page_size=1) == [["5"], ["3"], ["2"], ["4"], ["1"], ["7"], ["6"]]
+    assert all_pages(lambda: paged_only().category("academic")) == [["5", "2"]]
+
+
+def test_invalid_cursor(paged_events):
+    for cursor in ["garbage", encode_cursor({"after": ["2031-03-01", "late"]}), encode_cursor({"after": 3})]:
+        with pytest.raises(ValueError):
+            get_events_page(paged_only, cursor=cursor)
+
+
+# Test that ranked search results are paged in relevance order and that filtered out hits are skipped
+def test_ranked_pages(paged_events, monkeypatch):
+    monkeypatch.setattr("app.pagination.SEARCH_CHUNK_SIZE", 2)
+    ids = [event.id for event in reversed(paged_events)]
+    music = lambda: paged_only().category("music")
+
+    page, offset = get_ranked_page(music, ids, page_size=2)
+    assert [row.name[-1] for row in page] == ["7", "6"]
+    page, offset = get_ranked_page(music, ids, offset, page_size=2)
+    assert [row.name[-1] for row in page] == ["4", "3"]
+    page, offset = get_ranked_page(music, ids, offset, page_size=2)
+    assert [row.name[-1] for row in page] == ["1"]
+    assert offset is None
+
+
+# Test the page endpoint used by the infinite scroll of my events
+def test_events_page_endpoint(client, paged_events):
+    user = Credentials(username="pagination_user", role=Role.USER.value, name="Pagination User")
+    registrations = [EventRegistration(event_id=event.id, attendee_username=user.username) for event in paged_events]
+    db.session.add(user)
+    db.session.add_all(registrations)
+    db.session.commit()
+
+    try:
+        with client.session_transaction() as session:
+            session["_user_id"] = user.username
+
+        response = client.get("/myevents/page?filter=music")
+        assert response.status_code == 200
+        page = response.get_json()
+        assert page["next_cursor"] is None
+        positions = [page["html"].index(f"Paged Event {number}") for number in "34176"]
+        assert positions == sorted(positions)
+        assert "Paged Event 2" not in page["html"]
+
+        assert client.get("/myevents/page?cursor=garbage").status_code == 404
+        assert client.get("/user/page?filter=nonsense").status_code == 404
+        assert client.get("/user/page").status_code == 200
+    finally:
+        for registration in registrations:
+            db.session.delete(registration)
+        db.session.delete(user)
+        db.session.commit()
@@ -0,0 +1,60 @@
+import pytest
+from pathlib import Path
+from datetime import date, datetime, time
+from app.main import app, db
+from app.database import EventDetails
+from app.filter import EventFilterBuilder
+from app.projections import EventCard, EventCalendarEntry, project
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def projected_events(client):
+    # Events are removed again so that the event ids expected by the other tests are unchanged
+    events = [
+        EventDetails(name="Projected Talk", short_description="A talk", image="talk.png", category="Academic",
+                     long_description="Long text " * 50, start_date=date(2031, 1, 2), start_time=time(10, 30)),
+        EventDetails(name="Projected Party", category="Nightlife"),
+    ]
+    db.session.add_all(events)
+    db.session.commit()
+    yield events
+    for event in events:
+        db.session.delete(event)
+    db.session.commit()
+
+
+# Test that only the columns of the row type are loaded, with their native types
+def test_project(projected_events):
+    talk, party = projected_events
+    query = EventDetails.query.filter(EventDetails.id.in_([talk.id, party.id])).order_by(EventDetails.id)
+
+    assert project(query, EventCard) == [
+        EventCard(talk.id, "Projected Talk", "A talk", "talk.png", date(2031, 1, 2), time(10, 30), datetime(2031, 1, 2, 10, 30)),
+        EventCard(party.id, "Projected Party", None, None, None, None, None),
+    ]
+    entry = project(query, EventCalendarEntry)[0]
+    assert (entry.name, entry.category, entry.start_date) == ("Projected Talk", "Academic", date(2031, 1, 2))
+    assert not hasattr(entry, "long_description")
+
+
+# Test that the filter builder projects rows and keeps the order of the search results
+def test_filter_builder_rows(projected_events):
+    talk, party = projected_events
+    rows = EventFilterBuilder().event_ids([party.id, talk.id]).all(EventCard)
+    assert [type(row) for row in rows] == [EventCard, EventCard]
+    assert [row.name for row in rows] == ["Projected Party", "Projected Talk"]
@@ -0,0 +1,173 @@
+import pytest
+import re
+from pathlib import Path
+from datetime import date, time, timedelta
+from flask import Flask
+from sqlalchemy import event as sqlalchemy_event, text
+from app.main import app, db
+from app.globals import Role
+from app.database import Credentials, EventDetails, EventRegistration, EventRating, Tag
+from app.filter import EventFilterBuilder
+from app.projections import EventCard
+from app.migrations import MIGRATIONS, migrate, get_schema_version
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def planned_event(client):
+    organizer = Credentials(username="plan_organizer", role=Role.ORGANIZER.value, name="Plan Organizer")
+    user = Credentials(username="plan_user", role=Role.USER.value, name="Plan User")
+    event = EventDetails(name="Query Plan Event", image="placeholder.png", organizer=organizer.username,
+                         start_date=date.today() + timedelta(days=3), start_time=time(9, 0),
+                         end_date=date.today() + timedelta(days=3), end_time=time(10, 0))
+    db.session.add_all([organizer, user, event])
+    db.session.commit()
+    db.session.add_all([
+        EventRegistration(event_id=event.id, attendee_username=user.username),
+        EventRating(event_id=event.id, attendee_username=user.username, rating=4),
+    ])
+    db.session.commit()
+
+    yield event.id
+
+    for model in [EventRating, EventRegistration]:
+        model.query.filter_by(event_id=event.id).delete()
+    for row in [event, organizer, user]:
+        db.session.delete(row)
+    db.session.commit()
+
+
+def log_in(client, username):
+    with client.session_transaction() as session:
+        session["_user_id"] = username
+
+
+def scanned_tables(client, url):
+    # The tables read in full by the queries of the page, searches through an index are fine
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    sqlalchemy_event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        response = client.get(url)
+    finally:
+        sqlalchemy_event.remove(db.engine, "before_cursor_execute", capture)
+    assert response.status_code == 200
+    assert statements
+
+    connection = db.engine.raw_connection()
+    try:
+        scans = set()
+        for statement, parameters in statements:
+            for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                # "SCAN event_ratings", also through a covering index
+                match = re.match(r"SCAN (\w+)", row[-1])
+                if match:
+                    scans.add(match.group(1))
+        return scans
+    finally:
+        connection.close()
+
+
+def query_plans(call):
+    # The plans of the SELECT statements run by call()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, *args):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    sqlalchemy_event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        call()
+    finally:
+        sqlalchemy_event.remove(db.engine, "before_cursor_execute", capture)
+
+    connection = db.engine.raw_connection()
+    try:
+        return [
+            " ".join(row[-1] for row in connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters))
+            for statement, parameters in statements
+        ]
+    finally:
+        connection.close()
+
+
+# Test that the queries of every page read the tables they filter through an index
+def test_organizer_pages_use_indexes(client, planned_event):
+    log_in(client, "plan_organizer")
+    assert scanned_tables(client, "/organizer").isdisjoint({"event_details", "event_ratings"})
+    assert scanned_tables(client, f"/events/admin/{planned_event}").isdisjoint(
+        {"event_details", "event_ratings", "event_registration"}
+    )
+
+
+def test_user_pages_use_indexes(client, planned_event):
+    log_in(client, "plan_user")
+    assert scanned_tables(client, "/myevents/").isdisjoint({"event_registration"})
+    assert scanned_tables(client, f"/events/{planned_event}").isdisjoint(
+        {"event_details", "event_ratings", "event_registration", "event_waitlist"}
+    )
+    assert scanned_tables(client, "/user/organizers/plan_organizer").isdisjoint({"event_details"})
+
+
+def test_tag_events_use_index(client):
+    tag = Tag(id=123456, name="query plan tag")
+    statement = tag.events.statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+    plan = " ".join(row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {statement}")))
+    assert "ix_event_tags_tag_id" in plan
+
+
+# Test that a listing page is a seek into the (starts_at, id) index, the listing isn't sorted
+def test_listing_page_uses_index(client, planned_event):
+    event = db.session.get(EventDetails, planned_event)
+    for after in [None, (event.starts_at, event.id), (None, 0)]:
+        for make_filter in [EventFilterBuilder, lambda: EventFilterBuilder().category("music").in_person()]:
+            plans = query_plans(lambda: make_filter().listing_page(after, 25, EventCard))
+            assert len(plans) == 1
+            assert "ix_event_details_starts_at_id" in plans[0], plans[0]
+            assert "TEMP B-TREE" not in plans[0], plans[0]
+
+
+# Test that the migrations bring an existing database up to date, once
+def test_migrate_existing_database():
+    legacy_app = Flask(__name__)
+    legacy_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(legacy_app)
+    with legacy_app.app_context():
+        db.create_all()
+        for index in ["ix_event_details_starts_at", "ix_event_ratings_event_id_attendee_username",
+                      "ix_event_registration_attendee_username", "ix_event_tags_tag_id"]:
+            db.session.execute(text(f"DROP INDEX {index}"))
+        db.session.commit()
+        assert get_schema_version() == 0
+
+        assert migrate() == [migration.__name__ for migration in MIGRATIONS]
+        assert get_schema_version() == len(MIGRATIONS)
+        indexes = db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars().all()
+        assert "ix_event_ratings_event_id_attendee_username" in indexes
+        assert "ix_event_tags_tag_id" in indexes
+
+        assert migrate() == []
+
+        # A database migrated by newer code is not touched
+        db.session.execute(text(f"PRAGMA user_version = {len(MIGRATIONS) + 1}"))
+        with pytest.raises(RuntimeError):
+            migrate()
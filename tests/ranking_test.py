@@ -0,0 +1,58 @@
+from collections import namedtuple
+from app.ranking import BM25FIndex
+
+Event = namedtuple("Event", ["id", "name", "short_description", "long_description", "venue", "category"])
+
+
+def make_index():
+    index = BM25FIndex()
+    index.build([
+        Event(1, "Career Fair", "Meet employers", "Bring your resume to the jazz lounge", "Hart House", "Business"),
+        Event(2, "Jazz Night", "Live jazz", "A night of jazz standards", "Jazz Bistro", "Music"),
+        Event(3, "Open Mic", "Music and jazz poetry", None, "Bahen Centre", "Music"),
+        Event(4, "Robotics Club Meetup", None, None, None, "Academic"),
+    ])
+    return index
+
+
+# Test that matches in the name and repeated matches rank first
+def test_relevance_order():
+    index = make_index()
+    assert index.search("jazz") == [2, 3, 1]
+    assert index.search("music") == [3, 2]
+
+
+# Test that every query word has to match, in any of the fields
+def test_all_terms_required():
+    index = make_index()
+    assert index.search("jazz poetry") == [3]
+    assert index.search("JAZZ   night") == [2]
+    assert index.search("jazz robotics") == []
+    assert index.search("unknown") == []
+    assert index.search("") == []
+    assert index.search("jazz", limit=1) == [2]
+
+
+def test_add_remove():
+    index = make_index()
+    index.add(Event(4, "Jazz Robotics", None, None, None, "Academic"))
+    assert index.search("robotics") == [4]
+    assert index.search("club") == []
+    assert 4 in index.search("jazz")
+
+    index.remove(2)
+    index.remove(2)
+    assert index.search("jazz")[0] == 4
+    assert index.search("night") == []
+    assert len(index) == 3
+
+
+# Test that dropping the deleted rows keeps the ranking unchanged
+def test_compaction():
+    index = make_index()
+    before = index.search("jazz")
+    index.remove(4)
+    index.remove(1)
+    assert len(index.event_ids) == 2
+    assert index.search("jazz") == [event_id for event_id in before if event_id != 1]
+    assert index.search("music") == [3, 2]
@@ -0,0 +1,103 @@
+import pytest
+from pathlib import Path
+from flask import g
+from app.main import app, db
+from app.globals import AUTOCOMPLETE_RATE, AUTOCOMPLETE_BURST, Role
+from app.database import Credentials
+from app.rate_limit import TokenBucket, RateLimiter
+from tests.cache_test import FakeClock
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == 0.5
+
+    # Tokens come back at the refill rate, up to the capacity
+    clock.now = 0.5
+    assert bucket.take() == 0
+    clock.now = 100
+    assert [bucket.take() for _ in range(4)] == [0, 0, 0, 0.5]
+
+
+# Test that every key gets its own bucket and the wait is rounded up to whole seconds
+def test_rate_limiter_keys():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=0.5, capacity=1, clock=clock)
+    assert limiter.take("alice") == 0
+    assert limiter.take("alice") == 2
+    assert limiter.take("bob") == 0
+    clock.now = 2
+    assert limiter.take("alice") == 0
+
+
+@pytest.fixture
+def stopped_limiter(monkeypatch):
+    # A stopped clock, so no token is refilled while the test runs
+    limiter = RateLimiter(rate=AUTOCOMPLETE_RATE, capacity=AUTOCOMPLETE_BURST, clock=FakeClock())
+    monkeypatch.setattr("app.search.autocomplete_limiter", limiter)
+    return limiter
+
+
+def burst(client, **kwargs):
+    return [client.get("/search?search=jazz", **kwargs).status_code for _ in range(AUTOCOMPLETE_BURST + 1)]
+
+
+# Test that a client sending too many autocomplete requests gets a 429 with Retry-After
+def test_autocomplete_rate_limit(client, stopped_limiter):
+    # Too short queries are answered without using a token
+    for _ in range(AUTOCOMPLETE_BURST + 1):
+        assert client.get("/search?search=j").status_code == 200
+
+    assert burst(client) == [200] * AUTOCOMPLETE_BURST + [429]
+
+    response = client.get("/search?search=jazz")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.get_json() == []
+
+    # Other addresses are not affected
+    assert app.test_client().get("/search?search=jazz", environ_base={"REMOTE_ADDR": "10.0.0.2"}).status_code == 200
+
+
+# Test that a client without cookies doesn't get a new bucket on every request
+def test_rate_limit_without_cookies(client, stopped_limiter):
+    cookieless = app.test_client(use_cookies=False)
+    assert burst(cookieless, environ_base={"REMOTE_ADDR": "10.0.0.3"}) == [200] * AUTOCOMPLETE_BURST + [429]
+
+
+# Test that the users behind one address have buckets of their own
+def test_rate_limit_per_user(client, stopped_limiter):
+    users = [Credentials(username=f"rate_limit_user{number}", role=Role.USER.value, name="Rate Limit User")
+             for number in range(2)]
+    db.session.add_all(users)
+    db.session.commit()
+    try:
+        for user in users:
+            # The app context of the fixture outlives the requests, and so does the user flask-login loaded
+            g.pop("_login_user", None)
+            user_client = app.test_client()
+            with user_client.session_transaction() as session:
+                session["_user_id"] = user.username
+            assert burst(user_client, environ_base={"REMOTE_ADDR": "10.0.0.4"}) == [200] * AUTOCOMPLETE_BURST + [429]
+    finally:
+        g.pop("_login_user", None)
+        for user in users:
+            db.session.delete(user)
+        db.session.commit()
@@ -0,0 +1,104 @@
+import pytest
+from pathlib import Path
+from app.main import app, db
+from app.database import EventDetails
+from app.globals import SEARCH_BACKEND
+from app.search_backends import SEARCH_BACKENDS, TrieAutocompleteBackend, create_search_backend, use_search_backend
+from tests.fake_elasticsearch import make_fake_elasticsearch
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def search_events(client):
+    # Events are removed again so that the event ids expected by the other tests are unchanged
+    events = [
+        EventDetails(name="Quokka Trivia Evening"),
+        EventDetails(name="Evening of Quokka Poetry"),
+        EventDetails(name="Wombat Chess Club"),
+    ]
+    db.session.add_all(events)
+    db.session.commit()
+    yield events
+    for event in events:
+        if EventDetails.query.filter_by(id=event.id).first() is not None:
+            db.session.delete(event)
+    db.session.commit()
+
+
+# Every backend runs through the same suite, elasticsearch against the local fake cluster
+@pytest.fixture(params=sorted(SEARCH_BACKENDS))
+def backend(request, search_events):
+    options = {}
+    if request.param == "elasticsearch":
+        options["es"], _ = make_fake_elasticsearch()
+    return create_search_backend(request.param, **options)
+
+
+def test_search(backend, search_events):
+    quokka_trivia, quokka_poetry, wombat = search_events
+
+    assert sorted(backend.search("quokka")) == [quokka_trivia.id, quokka_poetry.id]
+    assert backend.search("trivia evening")[0] == quokka_trivia.id
+    assert len(backend.search("quokka", size=1)) == 1
+    assert backend.search("xylophone") == []
+
+
+def test_autocomplete(backend, search_events):
+    wombat = search_events[2]
+
+    assert backend.autocomplete("wombat") == [["Wombat Chess Club", wombat.id]]
+    assert len(backend.autocomplete("quokka", size=1)) == 1
+
+
+def test_index_and_delete(backend, search_events):
+    quokka_trivia, quokka_poetry, wombat = search_events
+
+    wombat.name = "Platypus Chess Club"
+    db.session.commit()
+    backend.index(wombat)
+    assert backend.search("wombat") == []
+    assert backend.search("platypus") == [wombat.id]
+
+    db.session.delete(quokka_poetry)
+    db.session.commit()
+    backend.delete(quokka_poetry.id)
+    assert backend.search("quokka") == [quokka_trivia.id]
+
+    # Deleting an event the backend doesn't know about is not an error
+    backend.delete(quokka_poetry.id)
+
+
+# Test that the routes follow the backend selected at runtime
+def test_switch_backend(client, search_events):
+    quokka_trivia = search_events[0]
+    try:
+        use_search_backend("simple")
+        assert client.get("/search?search=quoka trivia").get_json() == []
+
+        use_search_backend("fuzzy")
+        assert client.get("/search?search=quoka trivia").get_json() == [["Quokka Trivia Evening", str(quokka_trivia.id)]]
+    finally:
+        use_search_backend(SEARCH_BACKEND)
+
+
+# Test that a backend missing part of the interface can't be created
+def test_incomplete_backend():
+    class AutocompleteOnlyBackend(TrieAutocompleteBackend):
+        name = "autocomplete-only"
+
+    with pytest.raises(TypeError, match="search"):
+        AutocompleteOnlyBackend()
@@ -0,0 +1,51 @@
+from app.search_index import EventNameIndex
+
+
+def make_index():
+    index = EventNameIndex()
+    index.build([
+        (1, "Hackathon Kickoff"),
+        (2, "Jazz Night"),
+        (3, "Startup Pitch Night"),
+        (4, "AI"),
+    ])
+    return index
+
+
+# Test that long queries match anywhere inside the event name
+def test_substring_lookup():
+    index = make_index()
+    assert index.lookup("night") == [2, 3]
+    assert index.lookup("ckoff") == [1]
+    assert index.lookup("PITCH") == [3]
+    assert index.lookup("nightly") == []
+
+
+# Test that queries shorter than an n-gram still behave like a substring scan
+def test_short_query_lookup():
+    index = make_index()
+    assert index.lookup("ai") == [4]
+    assert index.lookup("j") == [2]
+    assert index.lookup("") == []
+
+
+# Test that the grams of an event are verified against the name and not just intersected
+def test_lookup_verifies_candidates():
+    index = EventNameIndex()
+    index.build([(1, "abcd bcde"), (2, "abcde")])
+    assert index.lookup("abcde") == [2]
+
+
+# Test that create/edit/delete keep the index in sync
+def test_add_edit_remove():
+    index = make_index()
+    index.add(5, "Night Market")
+    assert index.lookup("night") == [2, 3, 5]
+
+    index.add(2, "Jazz Brunch")
+    assert index.lookup("night") == [3, 5]
+    assert index.lookup_names("brunch") == [["Jazz Brunch", 2]]
+
+    index.remove(3)
+    assert index.lookup("night") == [5]
+    assert "ght" not in index.postings or 3 not in index.postings["ght"]
@@ -0,0 +1,90 @@
+import pytest
+from pathlib import Path
+from datetime import datetime, timedelta
+from app.main import app, db
+from app.database import EventDetails, SearchOutbox
+from app.elastic import apply_event_changes, EVENTS_ALIAS
+from app.indexer import enqueue_search_update, drain_outbox, OUTBOX_MAX_ATTEMPTS
+from tests.fake_elasticsearch import make_fake_elasticsearch
+
+TEST_DB = "test.db"
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+        # Leave the shared test database the way we found it
+        SearchOutbox.query.delete()
+        db.session.commit()
+
+
+@pytest.fixture
+def outbox_event(client):
+    event = EventDetails(name="Outbox Event")
+    db.session.add(event)
+    db.session.flush()
+    enqueue_search_update(event.id, "create")
+    db.session.commit()
+    yield event
+    if db.session.get(EventDetails, event.id) is not None:
+        db.session.delete(event)
+        db.session.commit()
+
+
+# Test that the outbox row is committed with the event and applied through elasticsearch bulk
+def test_outbox_applies_changes(outbox_event):
+    es, cluster = make_fake_elasticsearch()
+    cluster.indices["events-1"] = {}
+    cluster.aliases[EVENTS_ALIAS] = {"events-1"}
+    apply_changes = lambda changes: apply_event_changes(es, changes)
+
+    assert SearchOutbox.query.filter_by(event_id=outbox_event.id).count() == 1
+    assert drain_outbox(apply_changes) == 1
+    assert cluster.indices["events-1"][str(outbox_event.id)]["name"] == "Outbox Event"
+    assert SearchOutbox.query.count() == 0
+
+    # Update and delete collapse into one sync that removes the document
+    outbox_event.name = "Renamed Event"
+    enqueue_search_update(outbox_event.id, "update")
+    db.session.commit()
+    event_id = outbox_event.id
+    db.session.delete(outbox_event)
+    enqueue_search_update(event_id, "delete")
+    db.session.commit()
+
+    assert drain_outbox(apply_changes) == 2
+    assert str(event_id) not in cluster.indices["events-1"]
+    assert SearchOutbox.query.count() == 0
+
+
+# Test that failed changes are retried with a backoff and dropped after too many attempts
+def test_outbox_retries(outbox_event):
+    now = datetime.now()
+
+    def failing_apply(changes):
+        raise ConnectionError("search index unavailable")
+
+    assert drain_outbox(failing_apply, now=now) == 1
+    row = SearchOutbox.query.filter_by(event_id=outbox_event.id).one()
+    assert row.attempts == 1
+    assert row.available_at > now
+    assert "unavailable" in row.last_error
+
+    # Not retried before its backoff expires
+    assert drain_outbox(failing_apply, now=now) == 0
+
+    # Per event failures reported by the backend are retried too
+    assert drain_outbox(lambda changes: set(changes), now=now + timedelta(hours=1)) == 1
+    assert SearchOutbox.query.one().attempts == 2
+
+    for attempt in range(2, OUTBOX_MAX_ATTEMPTS):
+        drain_outbox(failing_apply, now=now + timedelta(days=attempt))
+    assert SearchOutbox.query.count() == 0
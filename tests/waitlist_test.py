@@ -0,0 +1,228 @@
+import pytest
+import threading
+from pathlib import Path
+from flask import g
+from datetime import date, time, timedelta
+from sqlalchemy import func, text
+from app.main import app, db
+from app.globals import Role
+from app.database import ChangeLog, Credentials, EventDetails, EventRegistration, EventWaitlist
+from app.events import join_waitlist, promote_from_waitlist
+
+TEST_DB = "test.db"
+
+NUM_USERS = 200
+
+
+@pytest.fixture
+def client():
+    BASE_DIR = Path(__file__).resolve().parent.parent
+    app.config["TESTING"] = True
+    app.config["DATABASE"] = BASE_DIR.joinpath(TEST_DB)
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{BASE_DIR.joinpath(TEST_DB)}"
+
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+@pytest.fixture
+def full_event(client):
+    users = [
+        Credentials(username=f"waitlist_user{number:03}", role=Role.USER.value, name="Waitlist User")
+        for number in range(NUM_USERS)
+    ]
+    event = EventDetails(name="Waitlisted Event", image="placeholder.png", max_capacity=2, current_capacity=0,
+                         start_date=date.today() + timedelta(days=7), start_time=time(18, 0))
+    db.session.add_all([*users, event])
+    db.session.commit()
+
+    yield event.id, [user.username for user in users]
+
+    for model in [EventWaitlist, EventRegistration, ChangeLog]:
+        model.query.filter_by(event_id=event.id).delete()
+    for row in [*users, event]:
+        db.session.delete(row)
+    db.session.commit()
+
+
+def logged_in_client(username):
+    user_client = app.test_client()
+    with user_client.session_transaction() as session:
+        session["_user_id"] = username
+    return user_client
+
+
+def as_user(username):
+    # The app context of the fixture outlives the requests, and so does the user flask-login loaded
+    g.pop("_login_user", None)
+    return logged_in_client(username)
+
+
+def registered(event_id):
+    db.session.expire_all()
+    return sorted(registration.attendee_username for registration in EventRegistration.query.filter_by(event_id=event_id))
+
+
+def waitlist(event_id):
+    entries = EventWaitlist.query.filter_by(event_id=event_id).order_by(EventWaitlist.position)
+    return [entry.attendee_username for entry in entries]
+
+
+def seats(event_id):
+    db.session.expire_all()
+    return db.session.get(EventDetails, event_id).current_capacity
+
+
+def toggle_concurrently(event_id, usernames):
+    clients = [logged_in_client(username) for username in usernames]
+    start = threading.Barrier(len(clients))
+    failures = []
+
+    def toggle(user_client):
+        start.wait()
+        response = user_client.post(f"/events/register/{event_id}")
+        if response.status_code != 302:
+            failures.append(response.status_code)
+
+    threads = [threading.Thread(target=toggle, args=(user_client,)) for user_client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert failures == []
+
+
+# Test that the users who registered for a full event are promoted in the order they joined
+def test_waitlist_order(full_event):
+    event_id, usernames = full_event
+    first, second, third, fourth, fifth = usernames[:5]
+
+    for username in [first, second, third, fourth, fifth]:
+        as_user(username).post(f"/events/register/{event_id}")
+    assert registered(event_id) == [first, second]
+    assert waitlist(event_id) == [third, fourth, fifth]
+    assert b"You are on the waitlist" in as_user(fourth).get(f"/events/{event_id}", follow_redirects=True).data
+
+    # Clicking again leaves the waitlist
+    as_user(fourth).post(f"/events/register/{event_id}")
+    assert waitlist(event_id) == [third, fifth]
+
+    # Every cancellation gives its seat to the head of the waitlist
+    as_user(first).post(f"/events/register/{event_id}")
+    assert registered(event_id) == [second, third]
+    assert waitlist(event_id) == [fifth]
+    as_user(second).post(f"/events/register/{event_id}")
+    assert registered(event_id) == [third, fifth]
+    assert seats(event_id) == 2
+
+    # Nobody is left to promote
+    as_user(third).post(f"/events/register/{event_id}")
+    assert registered(event_id) == [fifth]
+    assert waitlist(event_id) == []
+    assert seats(event_id) == 1
+
+
+# Test that a higher capacity promotes as many users as there are new seats
+def test_promote_new_seats(full_event):
+    event_id, usernames = full_event
+    for username in usernames[:6]:
+        as_user(username).post(f"/events/register/{event_id}")
+    assert len(waitlist(event_id)) == 4
+
+    db.session.get(EventDetails, event_id).max_capacity = 5
+    db.session.flush()
+    assert promote_from_waitlist(event_id) == usernames[2:5]
+    db.session.commit()
+    assert registered(event_id) == usernames[:5]
+    assert waitlist(event_id) == usernames[5:6]
+    assert seats(event_id) == 5
+
+
+# Test that concurrent registrants are waitlisted and promoted without gaps or duplicates
+def test_concurrent_waitlist(full_event):
+    event_id, usernames = full_event
+    event = db.session.get(EventDetails, event_id)
+    event.max_capacity = 20
+    db.session.commit()
+
+    toggle_concurrently(event_id, usernames)
+    assert len(registered(event_id)) == 20
+    positions = [entry.position for entry in EventWaitlist.query.filter_by(event_id=event_id).order_by(EventWaitlist.position)]
+    assert positions == list(range(1, NUM_USERS - 20 + 1))
+
+    # Half of the registered users cancel at the same time, the head of the waitlist takes their seats
+    head = waitlist(event_id)[:10]
+    cancelling = registered(event_id)[:10]
+    toggle_concurrently(event_id, cancelling)
+    assert set(head) <= set(registered(event_id))
+    assert len(registered(event_id)) == seats(event_id) == 20
+    assert len(waitlist(event_id)) == NUM_USERS - 30
+
+
+# Test that joining and promoting are seeks of the (event_id, position) index
+def test_waitlist_uses_index(client):
+    head = EventWaitlist.query.filter_by(event_id=1).order_by(EventWaitlist.position).limit(1)
+    last_position = db.session.query(func.max(EventWaitlist.position)).filter(EventWaitlist.event_id == 1)
+    for query in [head, last_position]:
+        statement = query.statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+        plan = " ".join(row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {statement}")))
+        assert "SEARCH event_waitlist USING" in plan and "ix_event_waitlist_event_id_position" in plan
+
+
+# Test that a registered user is never waitlisted, and that a stale entry doesn't block the promotions
+def test_registered_user_on_waitlist(full_event):
+    event_id, usernames = full_event
+    first, second, third, fourth = usernames[:4]
+    for username in [first, second, third]:
+        as_user(username).post(f"/events/register/{event_id}")
+    assert waitlist(event_id) == [third]
+
+    assert not join_waitlist(event_id, first)
+    db.session.commit()
+    assert waitlist(event_id) == [third]
+
+    # An entry of a registered user at the head, as written before join_waitlist checked the registrations
+    db.session.query(EventWaitlist).filter_by(event_id=event_id).update({"position": 2})
+    db.session.add(EventWaitlist(event_id=event_id, attendee_username=first, position=1))
+    db.session.commit()
+    as_user(fourth).post(f"/events/register/{event_id}")
+    assert waitlist(event_id) == [first, third, fourth]
+
+    response = as_user(second).post(f"/events/register/{event_id}")
+    assert response.status_code == 302
+    assert registered(event_id) == [first, third]
+    assert waitlist(event_id) == [fourth]
+    assert seats(event_id) == 2
+
+
+# Test that deleting an event deletes its waitlist in the same commit
+def test_delete_event_with_waitlist(client):
+    organizer = Credentials(username="waitlist_organizer", role=Role.ORGANIZER.value, name="Waitlist Organizer")
+    users = [Credentials(username=f"deleted_waitlist_user{number}", role=Role.USER.value, name="Waitlist User")
+             for number in range(3)]
+    event = EventDetails(name="Deleted Waitlisted Event", image="placeholder.png", max_capacity=1, current_capacity=0,
+                         organizer=organizer.username, start_date=date.today() + timedelta(days=7), start_time=time(18, 0))
+    db.session.add_all([organizer, *users, event])
+    db.session.commit()
+    event_id = event.id
+
+    try:
+        for user in users:
+            as_user(user.username).post(f"/events/register/{event_id}")
+        assert len(waitlist(event_id)) == 2
+
+        response = as_user(organizer.username).post(f"/events/delete_event/{event_id}")
+        assert response.status_code == 302
+        db.session.expire_all()
+        assert db.session.get(EventDetails, event_id) is None
+        assert waitlist(event_id) == []
+    finally:
+        g.pop("_login_user", None)
+        for model in [EventWaitlist, EventRegistration, ChangeLog]:
+            model.query.filter_by(event_id=event_id).delete()
+        EventDetails.query.filter_by(id=event_id).delete()
+        for user in [organizer, *users]:
+            db.session.delete(user)
+        db.session.commit()